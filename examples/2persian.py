@@ -12,8 +12,8 @@ def translate_text(args, output_file):
     Main function to translate text content from a given txt file.
     :param args: Arguments passed to the script
     """
-    # Get all files
-    files = FileUtils.get_files(args.path, f".{args.type}")
+    # Get all files lazily
+    files = FileUtils.walk_files(args.path, f".{args.type}")
 
     for file in files:
         content = []
@@ -94,8 +94,8 @@ def podcastit(args, output_file):
     Main function to create podcast content from unorganized text material.
     :param args: Arguments passed to the script
     """
-    # Get all files
-    files = FileUtils.get_files(args.path, f".{args.type}")
+    # Get all files lazily
+    files = FileUtils.walk_files(args.path, f".{args.type}")
 
     for file in files:
         content = []
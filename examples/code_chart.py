@@ -9,7 +9,7 @@ import os
 import logging
 import datetime
 import secrets
-from pipeline import PipelineUtils, FileUtils
+from pipeline import PipelineUtils, FileUtils, ReportWriter
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -21,38 +21,39 @@ def main():
     args.type = "py"
 
     if args.path:
-        files = FileUtils.get_files(args.path, ".py")
+        files = FileUtils.walk_files(args.path, ".py", use_gitignore=True)
     else:
-        files = FileUtils.get_files()
+        files = FileUtils.walk_files(use_gitignore=True)
 
     # create an output file with timestamp .md file and write the response to it
     output_file = f"./history/code_chart_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
 
-    for file in files:
+    with ReportWriter(output_file, append=True) as report:
+        for file in files:
 
-        # get absolute path of the file
-        args.path = os.path.abspath(file)
-        args.collection_name = secrets.token_hex(16)
-        chatbot = PipelineUtils.create_chatbot(args)
+            # get absolute path of the file
+            args.path = os.path.abspath(file)
+            args.collection_name = secrets.token_hex(16)
+            chatbot = PipelineUtils.create_chatbot(args)
 
-        logging.info("Analyzing %s...", file)
-        FileUtils.write_to_file(output_file, f"# Analyzing {file}...", mode="a")
+            logging.info("Analyzing %s...", file)
+            report.write(f"# Analyzing {file}...")
 
-        response = chatbot.invoke(
-            "Analyze the code in the content and write a description of what the code does. "
-        )
+            response = chatbot.invoke(
+                "Analyze the code in the content and write a description of what the code does. "
+            )
 
-        FileUtils.write_to_file(output_file, response, mode="a")
+            report.write(response)
 
-        response = chatbot.invoke(
-            "Write a description of the code in the content, " +
-            "which could be used in creating a detailed flow chart ."
-        )
+            response = chatbot.invoke(
+                "Write a description of the code in the content, " +
+                "which could be used in creating a detailed flow chart ."
+            )
 
-        FileUtils.write_to_file(output_file, response, mode="a")
+            report.write(response)
 
-        chatbot.delete_collection()
-        chatbot.clear_chat_history()
+            chatbot.delete_collection()
+            chatbot.clear_chat_history()
 
 
 if __name__ == "__main__":
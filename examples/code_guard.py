@@ -8,7 +8,7 @@ For now it only scans the python files.
 import os
 
 import datetime
-from pipeline import PipelineUtils, FileUtils, logger
+from pipeline import PipelineUtils, FileUtils, ReportWriter, logger
 
 
 def main():
@@ -18,47 +18,48 @@ def main():
     args.type = "py"
 
     if args.path:
-        files = FileUtils.get_files(args.path, ".py")
+        files = FileUtils.walk_files(args.path, ".py", use_gitignore=True)
     else:
-        files = FileUtils.get_files()
+        files = FileUtils.walk_files(use_gitignore=True)
 
     # create an output file with timestamp .md file and write the response to it
     output_file = f"./history/code_guard_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
 
-    for file in files:
+    with ReportWriter(output_file, append=True) as report:
+        for file in files:
 
-        # get absolute path of the file
-        args.path = os.path.abspath(file)
+            # get absolute path of the file
+            args.path = os.path.abspath(file)
 
-        chatbot = PipelineUtils.create_chatbot(args)
+            chatbot = PipelineUtils.create_chatbot(args)
 
-        logger.info("Analyzing %s...", file)
-        logger.debug(chatbot.documents)
+            logger.info("Analyzing %s...", file)
+            logger.debug(chatbot.documents)
 
-        logger.info("Analyzing %s...", file)
-        FileUtils.write_to_file(output_file, f"# Analyzing {file}...", mode="a")
+            logger.info("Analyzing %s...", file)
+            report.write(f"# Analyzing {file}...")
 
-        response = chatbot.invoke(
-            "Analyze the code in content for potential issues and security vulnerabilities. " +
-            "Be precise about the line number and the issue."
-        )
+            response = chatbot.invoke(
+                "Analyze the code in content for potential issues and security vulnerabilities. " +
+                "Be precise about the line number and the issue."
+            )
 
-        FileUtils.write_to_file(output_file, response, mode="a")
+            report.write(response)
 
-        response = chatbot.invoke(
-            f"Suggest improvements for the code in '{file}'."
-        )
+            response = chatbot.invoke(
+                f"Suggest improvements for the code in '{file}'."
+            )
 
-        FileUtils.write_to_file(output_file, response, mode="a")
+            report.write(response)
 
-        response = chatbot.invoke(
-            f"Score the code in '{file}' on a scale of 1 to 10."
-        )
+            response = chatbot.invoke(
+                f"Score the code in '{file}' on a scale of 1 to 10."
+            )
 
-        FileUtils.write_to_file(output_file, response, mode="a")
+            report.write(response)
 
-        chatbot.delete_collection()
-        chatbot.clear_chat_history()
+            chatbot.delete_collection()
+            chatbot.clear_chat_history()
 
 
 if __name__ == "__main__":
@@ -4,7 +4,8 @@
 
 
 from datetime import datetime
-from pipeline import PipelineUtils, ChatbotUtils, logger, FileUtils
+from pipeline import PipelineUtils, logger, FileUtils
+from pipeline.pipeline import PipelineError
 import subprocess
 import sys
 
@@ -34,6 +35,17 @@ def split_diff_by_file(diff_path: str) -> list:
     return sections
 
 
+COMMIT_MESSAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "array", "items": {"type": "string"}},
+        "type": {"type": "string"}
+    },
+    "required": ["title", "description", "type"]
+}
+
+
 def create_commit_message(chatbot) -> str:
     """
     Create a commit message using the chatbot.
@@ -42,38 +54,33 @@ def create_commit_message(chatbot) -> str:
     """
     logger.info("Running chatbot to generate commit message...")
     try:
-        commit_message = chatbot.invoke(
+        commit_message_json = chatbot.invoke_structured(
             (
-                "Write a detailed commit message based on the provided content. "
-                "Format the commit message as JSON with the keys: "
-                "'title', 'description' (list of sentences), and 'type' (e.g., feature, bugfix)."
-            )
+                "Write a detailed commit message based on the provided content, with "
+                "a 'title', a 'description' (list of sentences) and a 'type' (e.g., feature, bugfix)."
+            ),
+            COMMIT_MESSAGE_SCHEMA
         )
 
-        logger.info("Commit message generated by chatbot: %s", commit_message)
-
-        if commit_message:
-            commit_message_json = ChatbotUtils.parse_json(commit_message)
-            if commit_message_json is None:
-                logger.warning("Invalid JSON format. Trying again... Press CTRL+C to abort.")
-                return None
-            commit_message = commit_message_json.get('title', 'No Title!')
-            commit_message += "\n\nDescription:\n"
-            description = commit_message_json.get('description', ['No Description!'])
-            for i, sentence in enumerate(description, start=1):
-                sentence = sentence.strip()
-                # Check if the sentence already ends with punctuation
-                if not sentence.endswith(('.', '!', '?')):
-                    sentence += '.'
-                commit_message += f"{i}. {sentence}\n"
-            commit_message += f"\nType: {commit_message_json.get('type', 'No Type!')}"
-
-            logger.info("Generated commit message: %s", commit_message)
+        logger.info("Commit message generated by chatbot: %s", commit_message_json)
+
+        commit_message = commit_message_json['title']
+        commit_message += "\n\nDescription:\n"
+        for i, sentence in enumerate(commit_message_json['description'], start=1):
+            sentence = sentence.strip()
+            # Check if the sentence already ends with punctuation
+            if not sentence.endswith(('.', '!', '?')):
+                sentence += '.'
+            commit_message += f"{i}. {sentence}\n"
+        commit_message += f"\nType: {commit_message_json['type']}"
+
+        logger.info("Generated commit message: %s", commit_message)
+        logger.info("Structured output metrics: %s", chatbot.structured_metrics)
 
         return commit_message
     except KeyboardInterrupt:
         logger.error("Aborting commit.")
-    except ValueError as e:
+    except (ValueError, PipelineError) as e:
         logger.error("Error generating commit message: %s", str(e))
 
     return False
@@ -5,28 +5,54 @@ This script reads file's content and organizes it in a structured way.
 import datetime
 import json
 import os
-from typing import Union
-from pipeline import PipelineUtils, FileUtils, ChatbotUtils, logger
+from pipeline import PipelineUtils, FileUtils, ChatbotUtils, ReportWriter, logger
+from pipeline.pipeline import StructuredOutputError
 
-def analyzer(chatbot, prompt: str) -> Union[dict, str]:
+
+def list_schema(key: str) -> dict:
+    """
+    JSON schema of an object with a list of strings.
+    :param key: The key of the list
+    :return: The JSON schema
+    """
+    return {
+        "type": "object",
+        "properties": {key: {"type": "array", "items": {"type": "string"}}},
+        "required": [key]
+    }
+
+
+def text_schema(key: str) -> dict:
+    """
+    JSON schema of an object with a text.
+    :param key: The key of the text
+    :return: The JSON schema
+    """
+    return {"type": "object", "properties": {key: {"type": "string"}}, "required": [key]}
+
+
+AREAS_SCHEMA = list_schema("areas_covered")
+POLICIES_SCHEMA = list_schema("policies")
+REQUIREMENTS_SCHEMA = list_schema("requirements")
+PURPOSE_SCHEMA = text_schema("purpose")
+SUMMARY_SCHEMA = text_schema("summary")
+POLICY_SCHEMA = {"type": "object"}
+
+
+def analyzer(chatbot, prompt: str, schema: dict) -> dict:
     """
     Analyzes a single file and writes the results to the output file.
     :param chatbot: Chatbot object of the classes TextRAG or PdfRAG
     :param prompt: Prompt to be analyzed
-    :return: JSON response
+    :param schema: JSON schema of the response
+    :return: JSON response, validated against the schema
     """
 
-    response = chatbot.invoke(
-        f"""
-        {prompt}
-        Format the output as JSON.
-        Example: {{"areas_covered": [List of the areas covered by the content]}}
-        """
-    )
+    response = chatbot.invoke_structured(prompt, schema)
 
     logger.info("response %s...", response)
 
-    return ChatbotUtils.parse_json(response)
+    return response
 
 
 def get_output_file(path: str) -> str:
@@ -56,17 +82,17 @@ def get_output_file(path: str) -> str:
 
 
 
-def organize_content(args, output_file, create_questionnaire=False):
+def organize_content(args, output_file, with_questionnaire=False):
     """
     Main function to organize the content of files.
     :param args: Arguments passed to the script
-    :param create_questionnaire: Create a questionnaire based on the analysis of the content
+    :param with_questionnaire: Create a questionnaire based on the analysis of the content
     """
 
-    # Get all files
-    files = FileUtils.get_files(args.path, f".{args.type}")
+    # Get all files lazily
+    files = FileUtils.walk_files(args.path, f".{args.type}")
 
-    # List to store all requirements (for both cases of create_questionnaire)
+    # List to store all requirements (for both cases of with_questionnaire)
     all_requirements = []
 
 
@@ -90,94 +116,84 @@ def organize_content(args, output_file, create_questionnaire=False):
 
         logger.info("............................................")
 
-        # First prompt: Analyze content
-        prompt = (
-            "Analyze content and make a prioritized list of which areas it covers "
-            "based on what is important for Cybersecurity, Business Continuity and Disaster Recovery."
-        )
-        response_topics = analyzer(chatbot, prompt)
-
-        for i, area in enumerate(response_topics['areas_covered']):
-            content.append(f"## {i + 1} - {area}\n\n")
-
-            # Second prompt: List relevant requirements
-            prompt = f"""
-            List every relevant requirement needed to comply with '{area}'.
-            If no content is found in knowledge base, write requirements based on your knowledge about "{area}" related to "{subject}" in domain of Cybersecurity.
-            List should be prioritized based on importance of requirements.
-            Keep same tone and same style of writing and do not change meaning of requirements.
-            Response in json format.
-            format of response should be like this:
-            {{
-                "requirements": [
-                    "Requirement 1",
-                    "Requirement 2",
-                    "Requirement 3",
-                    ........
-                ],
-            }}
-            """.replace("  ", "")
+        try:
+            # First prompt: Analyze content
+            prompt = (
+                "Analyze content and make a prioritized list of which areas it covers "
+                "based on what is important for Cybersecurity, Business Continuity and Disaster Recovery."
+            )
+            response_topics = analyzer(chatbot, prompt, AREAS_SCHEMA)
 
-            response_requirements = analyzer(chatbot, prompt)
+            for i, area in enumerate(response_topics['areas_covered']):
+                content.append(f"## {i + 1} - {area}\n\n")
 
-            if 'requirements' not in response_requirements:
-                logger.error(f"No requirements found in the response for the area: '{area}' for the subject: '{subject}'.")
-                raise ValueError(f"No requirements found in the response for the area: '{area}' for the subject '{subject}' .")
+                # Second prompt: List relevant requirements
+                prompt = f"""
+                List every relevant requirement needed to comply with '{area}'.
+                If no content is found in knowledge base, write requirements based on your knowledge about "{area}" related to "{subject}" in domain of Cybersecurity.
+                List should be prioritized based on importance of requirements.
+                Keep same tone and same style of writing and do not change meaning of requirements.
+                Response with the list of "requirements".
+                """.replace("  ", "")
 
-            requirements = response_requirements['requirements']  # Extract the 'requirements' list from the response
+                response_requirements = analyzer(chatbot, prompt, REQUIREMENTS_SCHEMA)
 
-            for z, requirement in enumerate(requirements):
-                logger.info(f"Requirement: {requirement}")
+                requirements = response_requirements['requirements']  # Extract the 'requirements' list from the response
 
-                output = ChatbotUtils.process_json_response(requirement)
+                for z, requirement in enumerate(requirements):
+                    logger.info(f"Requirement: {requirement}")
 
-                if output.startswith(" - "):
-                    content.append(f"{output}\n\n")
-                else:
-                    content.append(f"**{z + 1}:** {output}\n\n")
+                    output = ChatbotUtils.process_json_response(requirement)
 
-                # Add to all_requirements if create_questionnaire is True
-                if create_questionnaire:
-                    all_requirements.append((z + 1, requirement))
+                    if output.startswith(" - "):
+                        content.append(f"{output}\n\n")
+                    else:
+                        content.append(f"**{z + 1}:** {output}\n\n")
 
+                    # Add to all_requirements if with_questionnaire is True
+                    if with_questionnaire:
+                        all_requirements.append((z + 1, requirement))
 
-        content.append("\\newpage\n\n")
 
-        # Inserting a table of contents at the top of the file
-        content.insert(0, f"\\toc\n\\newpage")
+            content.append("\\newpage\n\n")
 
-        # Get the purpose of the policies and the requirements
-        prompt = "Write the purpose of the policies and the requirements in a few sentences."
-        purpose = analyzer(chatbot, prompt)
-        content.insert(1, f"## Purpose\n\n{purpose['purpose']}\n\n")
+            # Inserting a table of contents at the top of the file
+            content.insert(0, f"\\toc\n\\newpage")
 
-        # Get a description of the content
-        prompt = "Summarize the content in a few sentences."
-        summary = analyzer(chatbot, prompt)
-        content.insert(2, f"## Summary\n\n{summary['summary']}\n\n")
+            # Get the purpose of the policies and the requirements
+            prompt = "Write the purpose of the policies and the requirements in a few sentences."
+            purpose = analyzer(chatbot, prompt, PURPOSE_SCHEMA)
+            content.insert(1, f"## Purpose\n\n{purpose['purpose']}\n\n")
 
-        FileUtils.write_to_file(output_file, "".join(content), mode='a')
+            # Get a description of the content
+            prompt = "Summarize the content in a few sentences."
+            summary = analyzer(chatbot, prompt, SUMMARY_SCHEMA)
+            content.insert(2, f"## Summary\n\n{summary['summary']}\n\n")
 
-        # Clean up the chatbot collection and history
-        chatbot.delete_collection()
-        chatbot.clear_chat_history()
+            FileUtils.write_to_file(output_file, "".join(content), mode='a')
+        except StructuredOutputError as e:
+            logger.error("Skipping %s, the response was not valid: %s", file, str(e))
+        finally:
+            # Clean up the chatbot collection and history
+            chatbot.delete_collection()
+            chatbot.clear_chat_history()
 
         logger.info("::::::::::::::::::::::::::::::::::::::::::::")
 
-    return all_requirements if create_questionnaire else None
+    return all_requirements if with_questionnaire else None
 
 
-def deep_organizer(args, output_file, create_questionnaire=False):
+def deep_organizer(args, output_file, with_questionnaire=False):
     """
     Main function to organize the content of files.
     :param args: Arguments passed to the script
-    :param create_questionnaire: Create a questionnaire based on the analysis of the content
+    :param with_questionnaire: Create a questionnaire based on the analysis of the content
     """
 
-    # Get all files
-    files = FileUtils.get_files(args.path, f".{args.type}")
+    # Get all files lazily
+    files = FileUtils.walk_files(args.path, f".{args.type}")
 
-    # List to store all requirements (for both cases of create_questionnaire)
+    # List to store all requirements (for both cases of with_questionnaire)
     all_requirements = []
 
 
@@ -201,101 +217,82 @@ def deep_organizer(args, output_file, create_questionnaire=False):
 
         logger.info("............................................")
 
-        prompt = (
-            "Analyze content and make a list of which policies it covers. "
-            "Find the title of the policies and write them in a list. "
-            "The format of the response should be like this: "
-            "{"
-            "    'policies': ["
-            "        'Policy 1',"
-            "        'Policy 2',"
-            "        'Policy 3',"
-            "        ........"
-            "    ]"
-            "}"
-        )
+        try:
+            prompt = (
+                "Analyze content and make a list of which policies it covers. "
+                "Find the title of the policies and write them in a list of 'policies'."
+            )
 
-        response_policies = analyzer(chatbot, prompt)
+            response_policies = analyzer(chatbot, prompt, POLICIES_SCHEMA)
 
-        logger.info("Policies: %s", response_policies['policies'])
+            logger.info("Policies: %s", response_policies['policies'])
 
-        for i, policy in enumerate(response_policies['policies']):
+            for i, policy in enumerate(response_policies['policies']):
 
-            content.append(f"# {i + 1} - {policy}\n\n")
+                content.append(f"# {i + 1} - {policy}\n\n")
 
-            # Second prompt: Analyze content
+                # Second prompt: Analyze content
 
-            prompt = f"Analyze content and make a prioritized list of which areas it covers for policy '{policy}'."
+                prompt = f"Analyze content and make a prioritized list of which areas it covers for policy '{policy}'."
 
-            response_topics = analyzer(chatbot, prompt)
+                response_topics = analyzer(chatbot, prompt, AREAS_SCHEMA)
 
-            for i, area in enumerate(response_topics['areas_covered']):
-                content.append(f"## {i + 1} - {area}\n\n")
+                for i, area in enumerate(response_topics['areas_covered']):
+                    content.append(f"## {i + 1} - {area}\n\n")
 
-                # Second prompt: List relevant requirements
-                prompt = f"""
-                List every relevant requirement needed to comply with '{area}'.
-                If no content is found in knowledge base, write requirements based on your knowledge about "{area}" related to "{subject}" in domain of Cybersecurity.
-                List should be prioritized based on importance of requirements.
-                Keep same tone and same style of writing and do not change meaning of requirements.
-                Response in json format.
-                format of response should be like this:
-                {{
-                    "requirements": [
-                        "Requirement 1",
-                        "Requirement 2",
-                        "Requirement 3",
-                        ........
-                    ],
-                }}
-                """.replace("  ", "")
+                    # Second prompt: List relevant requirements
+                    prompt = f"""
+                    List every relevant requirement needed to comply with '{area}'.
+                    If no content is found in knowledge base, write requirements based on your knowledge about "{area}" related to "{subject}" in domain of Cybersecurity.
+                    List should be prioritized based on importance of requirements.
+                    Keep same tone and same style of writing and do not change meaning of requirements.
+                    Response with the list of "requirements".
+                    """.replace("  ", "")
 
-                response_requirements = analyzer(chatbot, prompt)
+                    response_requirements = analyzer(chatbot, prompt, REQUIREMENTS_SCHEMA)
 
-                if 'requirements' not in response_requirements:
-                    logger.error(f"No requirements found in the response for the area: '{area}' for the subject: '{subject}'.")
-                    raise ValueError(f"No requirements found in the response for the area: '{area}' for the subject '{subject}' .")
+                    requirements = response_requirements['requirements']  # Extract the 'requirements' list from the response
 
-                requirements = response_requirements['requirements']  # Extract the 'requirements' list from the response
+                    for z, requirement in enumerate(requirements):
+                        logger.info(f"Requirement: {requirement}")
 
-                for z, requirement in enumerate(requirements):
-                    logger.info(f"Requirement: {requirement}")
+                        output = ChatbotUtils.process_json_response(requirement)
 
-                    output = ChatbotUtils.process_json_response(requirement)
+                        if output.startswith(" - "):
+                            content.append(f"{output}\n\n")
+                        else:
+                            content.append(f"**{z + 1}:** {output}\n\n")
 
-                    if output.startswith(" - "):
-                        content.append(f"{output}\n\n")
-                    else:
-                        content.append(f"**{z + 1}:** {output}\n\n")
-
-                    # Add to all_requirements if create_questionnaire is True
-                    if create_questionnaire:
-                        all_requirements.append((z + 1, requirement))
+                        # Add to all_requirements if with_questionnaire is True
+                        if with_questionnaire:
+                            all_requirements.append((z + 1, requirement))
 
 
-            content.append("\\newpage\n\n")
-
-            content.insert(0, f"\\toc\n\\newpage")
+                content.append("\\newpage\n\n")
 
-            # Get the purpose of the policies and the requirements
-            prompt = "Write the purpose of the policies and the requirements in a few sentences."
-            purpose = analyzer(chatbot, prompt)
-            content.insert(1, f"## Purpose\n\n{purpose['purpose']}\n\n")
+                content.insert(0, f"\\toc\n\\newpage")
 
-            # Get a description of the content
-            prompt = "Summarize the content in a few sentences."
-            summary = analyzer(chatbot, prompt)
-            content.insert(2, f"## Summary\n\n{summary['summary']}\n\n")
+                # Get the purpose of the policies and the requirements
+                prompt = "Write the purpose of the policies and the requirements in a few sentences."
+                purpose = analyzer(chatbot, prompt, PURPOSE_SCHEMA)
+                content.insert(1, f"## Purpose\n\n{purpose['purpose']}\n\n")
 
-            FileUtils.write_to_file(output_file, "".join(content), mode='a')
+                # Get a description of the content
+                prompt = "Summarize the content in a few sentences."
+                summary = analyzer(chatbot, prompt, SUMMARY_SCHEMA)
+                content.insert(2, f"## Summary\n\n{summary['summary']}\n\n")
 
-        # Clean up the chatbot collection and history
-        chatbot.delete_collection()
-        chatbot.clear_chat_history()
+                FileUtils.write_to_file(output_file, "".join(content), mode='a')
+        except StructuredOutputError as e:
+            logger.error("Skipping %s, the response was not valid: %s", file, str(e))
+        finally:
+            # Clean up the chatbot collection and history
+            chatbot.delete_collection()
+            chatbot.clear_chat_history()
 
         logger.info("::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::")
 
-    return all_requirements if create_questionnaire else None
+    return all_requirements if with_questionnaire else None
 
 
 def create_questionnaire(area, requirement, output_file):
@@ -383,10 +380,11 @@ def convert_json_to_md(output_file):
         questionnaire = json.load(file)
 
     # Write the questionnaire to the output file
-    for area in questionnaire:
-        FileUtils.write_to_file(output_file, f"## {area}\n\n", mode='a')
-        for i, question in enumerate(questionnaire[area]):
-            FileUtils.write_to_file(output_file, f"**{i + 1}:** {question}\n", mode='a')
+    with ReportWriter(output_file, append=True) as report:
+        for area in questionnaire:
+            report.write(f"## {area}\n\n")
+            for i, question in enumerate(questionnaire[area]):
+                report.write(f"**{i + 1}:** {question}\n")
 
 
 def convert_md_to_docx(output_file):
@@ -439,20 +437,22 @@ def remove_duplicates(args, output_file):
 
     print(f"Removing duplicates from {len(files)} files... {files}")
 
-    for file in files:
-        # Extract the file name, remove extensions, and replace dashes with spaces
-        file_name = os.path.basename(file).replace("-", " ").replace(".pdf", "").replace(".txt", "")
+    # The fragments of all files are buffered and written in a few large writes
+    with ReportWriter(output_file, append=True) as report:
+        for file in files:
+            # Extract the file name, remove extensions, and replace dashes with spaces
+            file_name = os.path.basename(file).replace("-", " ").replace(".pdf", "").replace(".txt", "")
 
-        # Write the file name as the title at the top of the markdown file
-        FileUtils.write_to_file(output_file, f"# {file_name}\n\n", mode='a')
+            # Write the file name as the title at the top of the markdown file
+            report.write(f"# {file_name}\n\n")
 
-        # Create an output file with timestamp and write the response to it
-        logger.info(f"Processing file: {file}")
+            # Create an output file with timestamp and write the response to it
+            logger.info(f"Processing file: {file}")
 
-        args.collection_name = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            args.collection_name = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
 
-        args.system_prompt_template = """
+            args.system_prompt_template = """
 Your are a text analyst and you have to analyze the content of the file.
 the response should be in JSON format.
 Examples:
@@ -515,36 +515,43 @@ You can change the keys and values to match the content of the file.
 You can use camelCase or snake_case or ordinary case for the keys.
 """
 
-        chatbot = PipelineUtils.create_chatbot(args)
+            chatbot = PipelineUtils.create_chatbot(args)
 
-        logger.info("............................................")
+            logger.info("............................................")
+
+            try:
+                # First prompt: Analyze content
+                prompt = (
+                    "Analyze content and make a prioritized list of which areas it covers "
+                    "based on what is important for Cybersecurity, Business Continuity and Disaster Recovery."
+                )
+                topics = analyzer(chatbot, prompt, AREAS_SCHEMA)
+
+                for i, area in enumerate(topics['areas_covered']):
+                    report.write(f"## {i + 1} - {area}\n\n")
+
+                    # Second prompt: List relevant requirements
+                    prompt = f"""
+                    write the policy about the topic '{area}'.
+                    If possible improve, optimize and modernize the text to match the current standards and best practices.
+                    Avoid redundant and duplicate information, unless it is necessary and relevant.
+                    """.replace("  ", "")
+
+                    policy_text = analyzer(chatbot, prompt, POLICY_SCHEMA)
+                    output = ChatbotUtils.json_to_md(policy_text)
+                    report.write(f"{output}\n")
+
+                    # adding page break for pandoc
+                    report.write("\n\n---\n\n")
+                    # \newpage
+                    report.write("\n\n\\newpage\n\n")
+            except StructuredOutputError as e:
+                logger.error("Skipping %s, the response was not valid: %s", file, str(e))
+            finally:
+                # Clean up the chatbot collection and history
+                chatbot.delete_collection()
+                chatbot.clear_chat_history()
 
-        # First prompt: Analyze content
-        prompt = (
-            "Analyze content and make a prioritized list of which areas it covers "
-            "based on what is important for Cybersecurity, Business Continuity and Disaster Recovery."
-        )
-        topics = analyzer(chatbot, prompt)
-
-        for i, area in enumerate(topics['areas_covered']):
-            FileUtils.write_to_file(output_file, f"## {i + 1} - {area}\n\n", mode='a')
-
-            # Second prompt: List relevant requirements
-            prompt = f"""
-            write the policy about the topic '{area}'.
-            If possible improve, optimize and modernize the text to match the current standards and best practices.
-            Avoid redundant and duplicate information, unless it is necessary and relevant.
-            """.replace("  ", "")
-
-            requirements = analyzer(chatbot, prompt)
-            parsed_response = ChatbotUtils.parse_json(requirements)
-            output = ChatbotUtils.json_to_md(parsed_response)
-            FileUtils.write_to_file(output_file, f"{output}\n", mode='a')
-
-            # adding page break for pandoc
-            FileUtils.write_to_file(output_file, "\n\n---\n\n", mode='a')
-            # \newpage
-            FileUtils.write_to_file(output_file, "\n\n\\newpage\n\n", mode='a')
 
 def main():
     """Entry point for the script."""
@@ -6,7 +6,7 @@ import os
 import json
 import datetime
 import secrets
-from pipeline import PipelineUtils, FileUtils, logger
+from pipeline import PipelineUtils, FileUtils, ReportWriter, logger
 
 def analyze_files_in_path(path, args):
     """
@@ -69,36 +69,33 @@ def generate_readme_from_analysis(path, analysis, args):
     """
 
     readme_path = os.path.join(path, "README.md")
-    FileUtils.write_to_file(readme_path, "", mode='w')
+    with ReportWriter(readme_path) as report:
 
-    for item in analysis:
-        FileUtils.write_to_file(
-            readme_path,
-            f"## {item['file']}\n\n{item['description']}",
-            mode='a'
-        )
+        for item in analysis:
+            report.write(f"## {item['file']}\n\n{item['description']}")
 
-    # Dump the analysis to a JSON file and update args.path
-    analysis_json = json.dumps(analysis, indent=4)
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    analysis_file = os.path.join('/app/history', f'analysis_temp_{timestamp}.json')
-    FileUtils.write_to_file(analysis_file, analysis_json)
-    args.path = analysis_file
+        # Dump the analysis to a JSON file and update args.path
+        analysis_json = json.dumps(analysis, indent=4)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        analysis_file = os.path.join('/app/history', f'analysis_temp_{timestamp}.json')
+        FileUtils.write_to_file(analysis_file, analysis_json)
+        args.path = analysis_file
 
-    # Load the current README.md content if exists
-    args.collection_name = secrets.token_hex(16)
-    chatbot = PipelineUtils.create_chatbot(args)
+        # Load the current README.md content if exists
+        args.collection_name = secrets.token_hex(16)
+        chatbot = PipelineUtils.create_chatbot(args)
 
-    prompt = (
-        f"Analyze the provided JSON file which contains descriptions of Python files in the specified path '{path}'. "
-        "Write an introduction to the analysis and summarize the key points from the JSON file."
-    )
+        prompt = (
+            f"Analyze the provided JSON file which contains descriptions of Python files in the specified path '{path}'. "
+            "Write an introduction to the analysis and summarize the key points from the JSON file."
+        )
 
-    response = chatbot.invoke(prompt)
-    chatbot.delete_collection()
-    chatbot.clear_chat_history()
+        response = chatbot.invoke(prompt)
+        chatbot.delete_collection()
+        chatbot.clear_chat_history()
 
-    FileUtils.prepend_to_file(readme_path, response)
+        # The introduction goes into the header slot, in front of the file descriptions
+        report.set_header(response)
 
 def main():
     """Main function to scan the codebase and generate README.md files for given paths."""
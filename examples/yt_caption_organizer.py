@@ -37,10 +37,11 @@ def main():
     """
 
     yt_url = "https://www.youtube.com/watch?v=hEInetWQXD8"
+    retry_failed = False  # also retry a video that had no captions or failed too often
 
     # first, download the captions
     caption_downloader = YTCaptionDownloader('./yt')
-    download_path = caption_downloader.download_captions(yt_url)
+    download_path = caption_downloader.download_captions(yt_url, retry_failed=retry_failed)
 
     # Read the downloaded captions
     # captions = FileUtils.read_file(download_path)
@@ -3,9 +3,19 @@ This is the main file that runs the Nmap Port Scanner Project.
 """
 
 import datetime
-import secrets
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
-from pipeline import PipelineUtils, ChatbotUtils, NmapScanner, SearchSploit
+from pipeline import PipelineUtils, ChatbotUtils, logger
+from pipeline.config import CACHE_DIR
+from pipeline.nmap_project.nmap_scanner import NmapScanner
+from pipeline.nmap_project.nmap_orchestrator import NmapOrchestrator
+from pipeline.nmap_project.searchsploit import SearchSploit
+from pipeline.nmap_project.exploit_index import ExploitIndex
+from pipeline.nmap_project.service_fanout import ServiceFanout
+from pipeline.nmap_project.scan_store import ScanStore, IncrementalScanner
 
 
 class NmapPortScannerProject:
@@ -19,6 +29,27 @@ class NmapPortScannerProject:
         self.args = self.prepare_args()
         self.ip_addresses = [nmap_options['target']]
         self.chatbot = None
+        self.searchsploit = SearchSploit(index=self.load_exploit_index())
+        self.exploit_fanout = ServiceFanout(
+            lambda services: self.searchsploit.search_many([self.search_terms(options) for options in services])
+        )
+
+    @staticmethod
+    def load_exploit_index():
+        """
+        Loads the local Exploit Database index, building it on the first run.
+
+        Parameters:
+        None
+
+        Returns:
+        ExploitIndex: The index, or None when exploit-db is not installed and searchsploit has to be run instead.
+        """
+        try:
+            return ExploitIndex.load_or_build()
+        except FileNotFoundError as e:
+            logger.warning("Searching with the searchsploit command: %s", str(e))
+            return None
 
     def display_welcome_message(self):
         """
@@ -58,33 +89,128 @@ class NmapPortScannerProject:
             "Exclude any additional text or information from your response."
         )
         args.output_type = "json"
-        args.collection_name = secrets.token_hex(16)
+        # The documentation is embedded once per version of the file and reused by later runs
+        args.collection_name = self.documentation_collection_name(args.path)
+        args.persist_directory = str(CACHE_DIR / "nmap_project")
         return args
 
+    @staticmethod
+    def documentation_collection_name(path):
+        """
+        Names the documentation collection after the content of the file,
+        so a changed documentation file gets a new index.
+
+        Parameters:
+        path (str): The path to the documentation file.
+
+        Returns:
+        str: The collection name.
+        """
+        digest = hashlib.sha256()
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+        return f"nmap_docs_{digest.hexdigest()[:16]}"
+
+    def get_chatbot(self):
+        """
+        Returns the chatbot over the documentation index, creating it on the first call.
+        All ports share it; every analysis runs in its own chat session.
+
+        Parameters:
+        None
+
+        Returns:
+        chatbot (Retrieval): The chatbot.
+        """
+        if self.chatbot is None:
+            self.chatbot = PipelineUtils.create_chatbot(self.args)
+            # Build the chain before the analyses run concurrently
+            self.chatbot.setup_chain_with_message_history()
+        return self.chatbot
+
     def scan_ip_address(self):
         """
-        Scans a provided IP address and returns the results.
+        Scans the provided targets and returns the results.
+        Hosts are printed as soon as nmap reports them.
 
         Parameters:
         None
 
         Returns:
-        result (dict): The result of the Nmap scan.
+        result (dict): The scanned hosts, see NmapScanner.parse_host.
         """
+        if self.nmap_options.get('rescan') and not self.command:
+            return self.rescan()
+        if self.nmap_options.get('max_concurrency') and not self.command:
+            return self.scan_in_shards()
+
         nmap_scanner = NmapScanner(**self.nmap_options)
-        if self.command:
-            nmap_scanner.run_command(self.command)
-        else:
-            nmap_scanner.run_nmap()
-        nmap_scanner.parse_output()
-        result = nmap_scanner.get_parsed_data()
-        pprint(nmap_scanner.get_output())
-        pprint(result)
+        hosts = []
+        for host in nmap_scanner.iter_hosts(self.command):
+            pprint(host)
+            hosts.append(host)
+        return {'hosts': hosts}
+
+    def scan_in_shards(self):
+        """
+        Scans the targets in parallel shards, one nmap process per shard.
+
+        Parameters:
+        None
+
+        Returns:
+        result (dict): The merged hosts and the shard statistics, see NmapOrchestrator.run_async.
+        """
+        options = self.nmap_options
+        flags = options.get('flags') or ''
+        if options.get('script'):
+            flags += f" --script {options['script']}"
+        if options.get('firewall'):
+            flags += " -Pn"
+        orchestrator = NmapOrchestrator(
+            options['target'],
+            ports=options.get('ports'),
+            flags=flags,
+            max_concurrency=options['max_concurrency'],
+            shard_size=options.get('shard_size', 16),
+            timeout=options.get('timeout', 600)
+        )
+        result = orchestrator.run()
+        pprint(result['hosts'])
+        return result
+
+    def rescan(self):
+        """
+        Rescans the targets incrementally: a fast discovery pass, then the configured flags
+        only on the ports that are new, changed or stale since the last scan stored in the scan history.
+
+        Parameters:
+        None
+
+        Returns:
+        result (dict): The hosts, the diff against the last scan and the scan id, see IncrementalScanner.rescan.
+        """
+        options = self.nmap_options
+        scanner = IncrementalScanner(
+            ScanStore(options.get('scan_store')),
+            flags=options.get('flags') or '',
+            discovery_flags=options.get('discovery_flags', '-T4'),
+            firewall=options.get('firewall', False),
+            script=options.get('script'),
+            max_detail_age=options.get('max_detail_age')
+        )
+        try:
+            result = scanner.rescan(options['target'], ports=options.get('ports'))
+        finally:
+            scanner.store.close()
+        pprint(result['diff'])
         return result
 
     def process_ports(self, result):
         """
-        Processes the scanned ports and searches for exploits.
+        Processes the open ports of every scanned host.
 
         Parameters:
         result (dict): The result of the Nmap scan.
@@ -93,15 +219,21 @@ class NmapPortScannerProject:
         list: A list of options dictionaries containing port details.
         """
         options_list = []
-        for port in result['ports']:
-            options = {
-                "IP Address": self.nmap_options['target'],
-                "Port Number": port['port'],
-                "Service Name": port['service'],
-                "Version": port['version'],
-                "OS": result['os_info']
-            }
-            options_list.append(options)
+        for host in result['hosts']:
+            os_matches = host['os_matches']
+            for port in host['ports']:
+                if port['state'] != 'open':
+                    continue
+                options = {
+                    "IP Address": host['ip'],
+                    "Port Number": port['port'],
+                    "Service Name": port['service'],
+                    "Version": port['version'],
+                    "Product": port['product'],
+                    "Product Version": port['service_version'],
+                    "OS": os_matches[0]['name'] if os_matches else None
+                }
+                options_list.append(options)
         return options_list
 
     def search_exploits(self, version):
@@ -114,25 +246,55 @@ class NmapPortScannerProject:
         Returns:
         search_results (list): A list of search results from SearchSploit.
         """
-        ss = SearchSploit()
-        search_results = ss.search([version])
+        search_results = self.searchsploit.search([version])
         pprint(search_results)
         return search_results
 
-    def handle_chatbot(self, info, version):
+    @staticmethod
+    def search_terms(options):
+        """
+        The searchsploit terms of a port: product and version when nmap identified them.
+
+        Parameters:
+        options (dict): The port details of process_ports.
+
+        Returns:
+        list: The search terms.
+        """
+        if options.get("Product"):
+            return [term for term in (options["Product"], options.get("Product Version")) if term]
+        return [options["Version"] or options["Service Name"] or ""]
+
+    def search_all_exploits(self, options_list):
+        """
+        Searches the exploits of all ports in one batch.
+        Every distinct service is searched once, however many hosts run it.
+
+        Parameters:
+        options_list (list): The port details of process_ports.
+
+        Returns:
+        list: The search results of every port, in the order of options_list.
+        """
+        search_results = self.exploit_fanout.fan_out(options_list)
+        for options, result in zip(options_list, search_results):
+            pprint({"IP Address": options["IP Address"], "Port Number": options["Port Number"], "Exploits": result})
+        return search_results
+
+    def handle_chatbot(self, info, version, session_id=None):
         """
         Handles the chatbot interaction for vulnerability exploitation.
 
         Parameters:
         info (str): JSON formatted string with information about the target.
         version (str): The version of the service being scanned.
+        session_id (str): The chat session of the analysis. The default session if None.
 
         Returns:
         response (dict): The response from the chatbot.
         """
-        self.args.collection_name = secrets.token_hex(16)
-        self.chatbot = PipelineUtils.create_chatbot(self.args)
-        response = self.chatbot.invoke(f"""
+        chatbot = self.get_chatbot()
+        response = chatbot.invoke(f"""
         Information about the target: {info}.
         What will be the best way to exploit vulnerability on target?
         You must select right tool or tools from list to identify vulnerabilities of Version: '{version}' service.:
@@ -164,25 +326,25 @@ class NmapPortScannerProject:
                 etc...
             ]
         }}
-        """)
+        """, session_id=session_id)
         parsed_response = ChatbotUtils.parse_json(response)
         pprint(parsed_response)
-        self.chatbot.clear_chat_history()
+        chatbot.clear_session(session_id)
         return parsed_response
 
-    def handle_chatbot_vulnerability(self, info):
+    def handle_chatbot_vulnerability(self, info, session_id=None):
         """
         Handles the chatbot interaction for suggesting vulnerability proof of concept methods.
 
         Parameters:
         info (str): JSON formatted string with information about the target.
+        session_id (str): The chat session of the analysis. The default session if None.
 
         Returns:
         response (dict): The response from the chatbot.
         """
-        self.args.collection_name = secrets.token_hex(16)
-        self.chatbot = PipelineUtils.create_chatbot(self.args)
-        response = self.chatbot.invoke(f"""
+        chatbot = self.get_chatbot()
+        response = chatbot.invoke(f"""
         You must suggest vulnerability proof of concept method.
         Information about the target: {info}.
         The installed tools at the moment are:
@@ -225,12 +387,48 @@ class NmapPortScannerProject:
                 etc...
             ]
         }}
-        """)
+        """, session_id=session_id)
         parsed_response = ChatbotUtils.parse_json(response)
         pprint(parsed_response)
-        self.chatbot.clear_chat_history()
+        chatbot.clear_session(session_id)
         return parsed_response
 
+    def analyze_port(self, options):
+        """
+        Asks the chatbot for exploitation and proof of concept methods of one port,
+        in a chat session of its own.
+
+        Parameters:
+        options (dict): The port details of process_ports.
+
+        Returns:
+        dict: The port details with the 'exploitation' and 'proof_of_concept' responses.
+        """
+        info = json.dumps(options, indent=4)
+        session_id = f"{options['IP Address']}:{options['Port Number']}"
+        return {
+            **options,
+            "exploitation": self.handle_chatbot(info, options["Version"], session_id=session_id),
+            "proof_of_concept": self.handle_chatbot_vulnerability(info, session_id=session_id)
+        }
+
+    def analyze_ports(self, options_list, max_workers=4):
+        """
+        Analyzes the ports concurrently with one shared documentation index.
+
+        Parameters:
+        options_list (list): The port details of process_ports.
+        max_workers (int): The number of analyses running at once.
+
+        Returns:
+        list: The analyses, in the order of options_list.
+        """
+        if not options_list:
+            return []
+        self.get_chatbot()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.analyze_port, options_list))
+
     def run(self):
         """
         The main function that orchestrates the Nmap Port Scanner Project.
@@ -244,11 +442,9 @@ class NmapPortScannerProject:
         self.display_welcome_message()
         scan_result = self.scan_ip_address()
         options_list = self.process_ports(scan_result)
-        for options in options_list:
-            # info = json.dumps(options, indent=4)
-            self.search_exploits(options["Version"])
-            # self.handle_chatbot(info, options["Version"])
-            # self.handle_chatbot_vulnerability(info)
+        self.search_all_exploits(options_list)
+        if self.nmap_options.get('analyze'):
+            self.analyze_ports(options_list, max_workers=self.nmap_options.get('analysis_workers', 4))
 
 
 def main():
@@ -260,7 +456,15 @@ def main():
         'firewall': False,
         'flags': '-sV -O -T5',
         'ports': None,
-        'script': None
+        'script': None,
+        'max_concurrency': None,  # e.g. 8 to scan a range in parallel shards
+        'shard_size': 16,
+        'rescan': False,  # rescan only what changed since the last scan in the scan history
+        'discovery_flags': '-T4',
+        'scan_store': None,  # defaults to cache/scans.sqlite3
+        'max_detail_age': None,  # e.g. 604800 to scan the details of every open port again after a week
+        'analyze': False,  # ask the chatbot about every open port
+        'analysis_workers': 4
     }
     command = None  # or provide a specific nmap command here if needed
     project = NmapPortScannerProject(nmap_options, command)
@@ -22,6 +22,8 @@ from .chatbot import Chatbot
 from .utils.pipeline_utils import PipelineUtils
 from .utils.file_utils import FileUtils
 from .utils.chatbot_utils import ChatbotUtils
+from .utils.token_utils import TokenCounter
+from .utils.report_writer import ReportWriter
 from .utils.logger import logger
 
 # RAG (Retrieval-Augmented Generation) imports
@@ -42,6 +44,8 @@ __all__ = [
     'PipelineUtils',
     'FileUtils',
     'ChatbotUtils',
+    'TokenCounter',
+    'ReportWriter',
     'Chatbot',
     'TxtRAG',
     'WebRAG',
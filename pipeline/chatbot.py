@@ -16,11 +16,15 @@ class Chatbot(Pipeline):
     Pipeline for a chatbot
     """
 
-    def invoke(self, prompt):
+    def invoke(self, prompt, session_id=None, structured=False, configurable=None):
         """
         Invoke the chatbot pipeline
         params:
             prompt (str): The prompt to send to the chatbot.
+            session_id (str): The session whose history is used, see get_session_history.
+            structured (bool or dict): Answer in the provider's JSON mode, or to a JSON schema,
+                see Pipeline.invoke_structured.
+            configurable (dict): Configurable fields of the chain set for this call only.
         returns:
             str: The response from the chatbot.
         raises:
@@ -35,7 +39,7 @@ class Chatbot(Pipeline):
         sanitized_prompt = self.sanitize_input(prompt)
 
         try:
-            response = super().invoke(sanitized_prompt)
+            response = super().invoke(sanitized_prompt, session_id, structured, configurable)
 
             # Ensure response has the expected attribute
             if not hasattr(response, 'content'):
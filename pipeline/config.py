@@ -4,6 +4,7 @@ This file contains the configuration for the project.
 """
 import os
 import base64
+import multiprocessing
 from getpass import getpass
 import logging
 from pathlib import Path
@@ -27,6 +28,8 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent.parent
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
+CACHE_DIR = BASE_DIR / "cache"
+CACHE_DIR.mkdir(exist_ok=True)
 
 # Logging config
 LOG_FILE = LOG_DIR / "pipeline.log"
@@ -37,6 +40,8 @@ LOG_LEVEL = logging.INFO
 MAX_INPUT_LENGTH = 4096
 DEFAULT_CHUNK_SIZE = 500
 DEFAULT_CHUNK_OVERLAP = 0
+# Used to convert character based chunk defaults when a tokenizer is configured
+APPROX_CHARS_PER_TOKEN = 4
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 AZURE_OPENAI_ENDPOINT = None
@@ -117,8 +122,10 @@ def initialize_constants():
     else:
         logger.info("OPENAI_API_KEY successfully loaded.")
 
-# Initialize the constants when the module is imported
-initialize_constants()
+# Initialize the constants when the module is imported.
+# Spawned worker processes import the package again and must not prompt for the passphrase.
+if multiprocessing.current_process().name == "MainProcess":
+    initialize_constants()
 
 # Ensure the .env file is not included in version control
 # Add the following line to your .gitignore file:
@@ -0,0 +1,484 @@
+"""
+This module contains the ExploitIndex class, an in-process search index of the Exploit Database.
+
+The index is built once from the `files_exploits.csv` of exploit-db and written to a single file:
+an inverted index of title tokens with their posting lists, and the exploit records with the
+version ranges parsed from their titles. The file is memory mapped when it is loaded, so only
+the posting lists and records a search touches are read.
+
+Searches follow `searchsploit`: every word must appear in the title, and a version number matches
+titles whose version range contains it, e.g. '2.4.29' matches 'Apache 2.4.17 < 2.4.38 - ...'.
+Titles without a version range match versions they contain literally.
+Words that are not in the index are matched to similar title words by their trigrams.
+
+Example usage:
+    index = ExploitIndex.load_or_build("/usr/share/exploitdb/files_exploits.csv")
+    print(index.search(["vsftpd 2.3.4"]))
+    results = index.search_many([["OpenSSH 7.6p1"], ["Apache 2.4.29"], ["ProFTPD 1.3.5"]])
+"""
+
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from functools import lru_cache
+from pipeline import logger
+from pipeline.config import CACHE_DIR
+from pipeline.utils.file_utils import FileUtils
+
+
+class ExploitIndex:
+    """
+    A memory mapped inverted index of Exploit Database titles.
+
+    Methods:
+        build(csv_path, index_path): Builds the index file from files_exploits.csv.
+        load(index_path): Loads an index file.
+        load_or_build(csv_path, index_path): Loads the index, building it when the CSV changed.
+        search(terms, strict): Searches exploit titles, like `searchsploit --json`.
+        search_many(terms_list, strict): Searches many queries at once.
+    """
+
+    MAGIC = b"EDBIDX1\n"
+    DEFAULT_CSV_PATHS = (
+        "/usr/share/exploitdb/files_exploits.csv",
+        "/opt/exploitdb/files_exploits.csv",
+        os.path.expanduser("~/exploitdb/files_exploits.csv"),
+    )
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+    VERSION = r"\d+(?:\.(?:\d+|x))*[a-z]*\d*"
+    VERSION_PATTERN = re.compile(rf"^{VERSION}$")
+    RANGE_PATTERN = re.compile(rf"(<=?)?\s*(?<![\w.])({VERSION})(?![\w.])(?:\s*<(=?)\s*({VERSION})(?![\w.]))?")
+    VERSION_PART_PATTERN = re.compile(r"\d+|[a-z]+")
+
+    def __init__(self, index_path):
+        """
+        Opens an index file. Use load or load_or_build.
+        Args:
+            index_path (str): The path to the index file.
+        """
+        self.index_path = index_path
+        self._records = {}
+        self._trigrams = None
+        self._file = open(index_path, "rb")  # pylint: disable=consider-using-with
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise ValueError(f"Not an exploit index: {index_path}") from e
+
+        try:
+            if self._mmap[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError("wrong magic number")
+            header_start = len(self.MAGIC) + 8
+            (header_length,) = struct.unpack("<Q", self._mmap[len(self.MAGIC):header_start])
+            self.header = json.loads(self._mmap[header_start:header_start + header_length])
+            self._base = header_start + header_length
+            self.vocabulary = self.header["vocabulary"]
+            self.exploitdb_dir = self.header["exploitdb_dir"]
+
+            self._offsets_start = self._base + self.header["sections"]["offsets"][0]
+            self._postings_start = self._base + self.header["sections"]["postings"][0]
+            self._records_start = self._base + self.header["sections"]["records"][0]
+        except (ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+            self.close()
+            raise ValueError(f"Not an exploit index: {index_path}: {e}") from e
+
+
+    @classmethod
+    def tokenize(cls, text):
+        """
+        Splits text into lowercase words. Dotted versions like '2.4.29' stay one token.
+        """
+        return cls.TOKEN_PATTERN.findall(text.lower())
+
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def version_key(version):
+        """
+        Converts a version into a comparable key. '7.6p1' < '7.7' and '2.6.x' covers every '2.6.*'.
+        Args:
+            version (str): The version.
+        Returns:
+            tuple: The key.
+        """
+        key = []
+        for part in ExploitIndex.VERSION_PART_PATTERN.findall(version.lower()):
+            if part.isdigit():
+                key.append((1, int(part)))
+            elif part == "x":
+                key.append((2, 0))
+            else:
+                key.append((0, part))
+        return tuple(key)
+
+
+    @classmethod
+    def parse_version_ranges(cls, title):
+        """
+        Parses the version ranges of an exploit title. Only the part before ' - ' is read,
+        where Exploit-DB titles name the product and its versions.
+        'A < B' is the range from A up to B, '< B' every version below B, '<= B' includes B,
+        'A' only A, and 'A.x' or a version without dots every version starting with it.
+        Args:
+            title (str): The exploit title.
+        Returns:
+            list: [low, high, low_inclusive, high_inclusive] ranges, low or high None when open.
+        """
+        head = title.split(" - ", 1)[0].lower()
+        ranges = []
+        for match in cls.RANGE_PATTERN.finditer(head):
+            below, low, high_equal, high = match.groups()
+            if below:
+                ranges.append([None, low, False, below == "<="])
+            elif high:
+                ranges.append([low, high, True, high_equal == "="])
+            elif "." not in low or low.endswith(".x"):
+                prefix = low[:-2] if low.endswith(".x") else low
+                ranges.append([prefix, f"{prefix}.x", True, True])
+            else:
+                ranges.append([low, low, True, True])
+        return ranges
+
+
+    @classmethod
+    def in_ranges(cls, version, ranges):
+        """
+        Checks if a version is in one of the ranges of parse_version_ranges.
+        """
+        return cls._in_range_keys(cls.version_key(version), cls._range_keys(ranges))
+
+
+    @classmethod
+    def _range_keys(cls, ranges):
+        return [
+            (cls.version_key(low) if low is not None else None, cls.version_key(high) if high is not None else None,
+             low_inclusive, high_inclusive)
+            for low, high, low_inclusive, high_inclusive in ranges
+        ]
+
+
+    @staticmethod
+    def _in_range_keys(key, range_keys):
+        for low_key, high_key, low_inclusive, high_inclusive in range_keys:
+            if low_key is not None and (key < low_key or (key == low_key and not low_inclusive)):
+                continue
+            if high_key is not None and (key > high_key or (key == high_key and not high_inclusive)):
+                continue
+            return True
+        return False
+
+
+    @classmethod
+    def build(cls, csv_path, index_path=None):
+        """
+        Builds the index file from the exploit-db CSV.
+        Args:
+            csv_path (str): The path to files_exploits.csv.
+            index_path (str): The path of the index file. Defaults to exploitdb.idx in the cache directory.
+        Returns:
+            ExploitIndex: The loaded index.
+        """
+        index_path = str(index_path or CACHE_DIR / "exploitdb.idx")
+        postings = {}
+        records = bytearray()
+        offsets = array("Q", [0])
+
+        with open(csv_path, "r", encoding="utf-8", errors="replace", newline="") as file:
+            for number, row in enumerate(csv.DictReader(file)):
+                title = row.get("description") or row.get("title") or ""
+                record = {
+                    "id": row.get("id"),
+                    "file": row.get("file"),
+                    "title": title,
+                    "date": row.get("date_published") or row.get("date"),
+                    "author": row.get("author"),
+                    "type": row.get("type"),
+                    "platform": row.get("platform"),
+                    "codes": row.get("codes"),
+                    "ranges": cls.parse_version_ranges(title)
+                }
+                for token in set(cls.tokenize(title)):
+                    postings.setdefault(token, array("I")).append(number)
+                records += json.dumps(record, separators=(",", ":")).encode("utf-8")
+                offsets.append(len(records))
+
+        vocabulary = {}
+        posting_bytes = bytearray()
+        for token in sorted(postings):
+            vocabulary[token] = [len(posting_bytes) // 4, len(postings[token])]
+            posting_bytes += postings[token].tobytes()
+
+        sections = {}
+        data = bytearray()
+        for name, section in (("offsets", offsets.tobytes()), ("postings", bytes(posting_bytes)), ("records", records)):
+            data += b"\0" * (-len(data) % 8)
+            sections[name] = [len(data), len(section)]
+            data += section
+
+        stat = os.stat(csv_path)
+        header = json.dumps({
+            "source": {"path": os.path.abspath(csv_path), "size": stat.st_size, "mtime": stat.st_mtime},
+            "exploitdb_dir": os.path.dirname(os.path.abspath(csv_path)),
+            "records": len(offsets) - 1,
+            "sections": sections,
+            "vocabulary": vocabulary
+        }, separators=(",", ":")).encode("utf-8")
+        header += b" " * (-(len(cls.MAGIC) + 8 + len(header)) % 8)
+
+        # A unique temporary file, so concurrent builds do not write to the same one
+        descriptor, temp_path = FileUtils.temp_file(index_path)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(cls.MAGIC)
+                file.write(struct.pack("<Q", len(header)))
+                file.write(header)
+                file.write(data)
+            FileUtils.replace_file(temp_path, index_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        logger.info(
+            "Indexed %s exploits with %s title words into %s", len(offsets) - 1, len(vocabulary), index_path
+        )
+        return cls(index_path)
+
+
+    @classmethod
+    def load(cls, index_path=None):
+        """
+        Loads an index file.
+        Args:
+            index_path (str): The path of the index file. Defaults to exploitdb.idx in the cache directory.
+        Returns:
+            ExploitIndex: The index.
+        """
+        return cls(str(index_path or CACHE_DIR / "exploitdb.idx"))
+
+
+    @classmethod
+    def load_or_build(cls, csv_path=None, index_path=None):
+        """
+        Loads the index, building it first when it is missing or the CSV changed since.
+        Args:
+            csv_path (str): The path to files_exploits.csv. Defaults to the first of DEFAULT_CSV_PATHS that exists.
+            index_path (str): The path of the index file. Defaults to exploitdb.idx in the cache directory.
+        Returns:
+            ExploitIndex: The index.
+        """
+        csv_path = csv_path or next((path for path in cls.DEFAULT_CSV_PATHS if os.path.exists(path)), None)
+        if not csv_path or not os.path.exists(csv_path):
+            raise FileNotFoundError("files_exploits.csv of exploit-db was not found.")
+
+        index_path = str(index_path or CACHE_DIR / "exploitdb.idx")
+        if os.path.exists(index_path):
+            try:
+                index = cls(index_path)
+                stat = os.stat(csv_path)
+                source = index.header["source"]
+                if (source["path"], source["size"], source["mtime"]) == \
+                        (os.path.abspath(csv_path), stat.st_size, stat.st_mtime):
+                    return index
+                index.close()
+            except (ValueError, KeyError, OSError) as e:
+                logger.warning("Rebuilding the exploit index %s: %s", index_path, str(e))
+        return cls.build(csv_path, index_path)
+
+
+    def record(self, number):
+        """
+        Reads an exploit record from the index file.
+        Args:
+            number (int): The record number.
+        Returns:
+            dict: The record.
+        """
+        if number not in self._records:
+            start, end = struct.unpack_from("=QQ", self._mmap, self._offsets_start + number * 8)
+            start, end = self._records_start + start, self._records_start + end
+            record = json.loads(self._mmap[start:end])
+            record["range_keys"] = self._range_keys(record["ranges"])
+            self._records[number] = record
+        return self._records[number]
+
+
+    def postings(self, token):
+        """
+        Reads the numbers of the records whose title contains a token.
+        """
+        entry = self.vocabulary.get(token)
+        if not entry:
+            return ()
+        start = self._postings_start + entry[0] * 4
+        numbers = array("I")
+        numbers.frombytes(self._mmap[start:start + entry[1] * 4])
+        return numbers
+
+
+    @staticmethod
+    def trigrams(token):
+        """
+        The trigrams of a token, padded so short tokens have some.
+        """
+        padded = f"  {token} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+    def similar_tokens(self, token, threshold=0.5, limit=5):
+        """
+        Finds title words similar to a token by the Jaccard similarity of their trigrams.
+        Args:
+            token (str): The word.
+            threshold (float): The minimum similarity.
+            limit (int): The maximum number of words.
+        Returns:
+            list: The most similar title words.
+        """
+        if self._trigrams is None:
+            self._trigrams = {}
+            for word in self.vocabulary:
+                for trigram in self.trigrams(word):
+                    self._trigrams.setdefault(trigram, []).append(word)
+
+        query = self.trigrams(token)
+        shared = {}
+        for trigram in query:
+            for word in self._trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+
+        scored = []
+        for word, count in shared.items():
+            similarity = count / (len(query) + len(self.trigrams(word)) - count)
+            if similarity >= threshold:
+                scored.append((similarity, word))
+        return [word for _, word in sorted(scored, reverse=True)[:limit]]
+
+
+    def _matching_records(self, word):
+        """
+        The records whose title contains a word, or a similar word if no title contains it.
+        """
+        if word in self.vocabulary:
+            return set(self.postings(word))
+        numbers = set()
+        for similar in self.similar_tokens(word):
+            numbers.update(self.postings(similar))
+        return numbers
+
+
+    def search_records(self, terms, strict=False):
+        """
+        Finds the records matching all terms.
+        Args:
+            terms (list or str): The search terms, e.g. ['vsftpd 2.3.4'] or 'vsftpd 2.3.4'.
+            strict (bool): Match versions only literally, like `searchsploit --strict`.
+        Returns:
+            list: The matching records, ordered by title.
+        """
+        if isinstance(terms, str):
+            terms = [terms]
+        tokens = [token for term in terms for token in self.tokenize(term)]
+        words = [token for token in tokens if not self.VERSION_PATTERN.match(token)]
+        versions = [token for token in tokens if self.VERSION_PATTERN.match(token)]
+        if not words and not versions:
+            return []
+
+        candidates = None
+        for word in sorted(set(words), key=lambda word: self.vocabulary.get(word, [0, 0])[1]):
+            numbers = self._matching_records(word)
+            candidates = numbers if candidates is None else candidates & numbers
+            if not candidates:
+                return []
+
+        if candidates is None:
+            # Only versions, e.g. '2.3.4': the titles containing them literally
+            candidates = set()
+            for version in versions:
+                candidates.update(self.postings(version))
+
+        records = []
+        for number in sorted(candidates):
+            record = self.record(number)
+            title_tokens = None
+            matched = True
+            for version in versions:
+                if not strict and record["ranges"]:
+                    # The parsed ranges decide, so 'OpenSSH < 7.7' does not match 7.7 itself
+                    if self._in_range_keys(self.version_key(version), record["range_keys"]):
+                        continue
+                    matched = False
+                    break
+                title_tokens = title_tokens or set(self.tokenize(record["title"]))
+                if version not in title_tokens:
+                    matched = False
+                    break
+            if matched:
+                records.append(record)
+        return sorted(records, key=lambda record: record["title"].lower())
+
+
+    def search(self, terms, strict=False):
+        """
+        Searches exploit titles.
+        Args:
+            terms (list or str): The search terms, e.g. ['vsftpd 2.3.4'].
+            strict (bool): Match versions only literally.
+        Returns:
+            dict: The results in the format of `searchsploit --json`.
+        """
+        if isinstance(terms, str):
+            terms = [terms]
+        return {
+            "SEARCH": " ".join(terms),
+            "DB_PATH_EXPLOIT": self.exploitdb_dir,
+            "RESULTS_EXPLOIT": [
+                {
+                    "Title": record["title"],
+                    "EDB-ID": record["id"],
+                    "Date_Published": record["date"],
+                    "Author": record["author"],
+                    "Type": record["type"],
+                    "Platform": record["platform"],
+                    "Path": os.path.join(self.exploitdb_dir, record["file"] or ""),
+                    "Codes": record["codes"]
+                }
+                for record in self.search_records(terms, strict)
+            ],
+            "RESULTS_SHELLCODE": []
+        }
+
+
+    def search_many(self, terms_list, strict=False):
+        """
+        Searches many queries, each distinct query once.
+        Args:
+            terms_list (list): Search terms per query, e.g. [['OpenSSH 7.6p1'], ['Apache 2.4.29']].
+            strict (bool): Match versions only literally.
+        Returns:
+            list: The results of every query, in the order of terms_list.
+        """
+        results = {}
+        ordered = []
+        for terms in terms_list:
+            terms = [terms] if isinstance(terms, str) else list(terms)
+            key = tuple(self.tokenize(" ".join(terms)))
+            if key not in results:
+                results[key] = self.search(terms, strict)
+            ordered.append(results[key])
+        return ordered
+
+
+    def close(self):
+        """
+        Closes the memory map and the index file.
+        """
+        self._records.clear()
+        self._mmap.close()
+        self._file.close()
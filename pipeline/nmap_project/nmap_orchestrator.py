@@ -0,0 +1,341 @@
+"""
+This module contains the NmapOrchestrator class, which scans large target ranges in parallel.
+
+The targets and ports are split into shards. Every shard is scanned by its own nmap process,
+started without a shell as an asyncio subprocess. A semaphore limits the number of processes
+running at once, and every shard has its own timeout. The hosts of all shards, including the
+hosts a timed out shard reported before it was stopped, are merged into one result.
+
+Example usage:
+    orchestrator = NmapOrchestrator(
+        targets=["192.168.56.0/24", "10.0.0.5"],
+        ports="1-1024",
+        flags="-sV",
+        max_concurrency=8,
+        shard_size=32
+    )
+    result = orchestrator.run()
+    for host in result["hosts"]:
+        print(host["ip"], [port["port"] for port in host["ports"]])
+"""
+
+import asyncio
+import ipaddress
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pipeline import logger
+from pipeline.nmap_project.nmap_scanner import NmapScanner
+
+
+class NmapOrchestrator:
+    """
+    Runs sharded Nmap scans concurrently and merges their results.
+
+    Attributes:
+        shards (list): (targets, ports) pairs, one nmap process each.
+
+    Methods:
+        run(): Scans all shards and returns the merged result.
+        run_async(): The coroutine behind run().
+        split_targets(targets, shard_size): Splits targets into groups.
+        split_ports(ports, shards): Splits a port specification into ranges.
+        merge_hosts(hosts): Merges the hosts reported by several shards.
+    """
+
+    def __init__(self, targets, ports=None, flags="", max_concurrency=4, shard_size=16,
+                 port_shards=1, timeout=600, nmap="nmap"):
+        """
+        Args:
+            targets (list or str): IP addresses, CIDRs, nmap ranges or hostnames. A string is split on
+                                   whitespace and commas.
+            ports (str): The ports to scan, e.g. '22,80,1000-2000'. Nmap's default ports if None.
+            flags (str): Additional flags to pass to Nmap.
+            max_concurrency (int): The maximum number of nmap processes running at once.
+            shard_size (int): The maximum number of addresses per shard.
+            port_shards (int): The number of port ranges every target group is scanned in.
+            timeout (float): The seconds a shard may run before it is stopped.
+            nmap (str): The nmap executable.
+        """
+        if isinstance(targets, str):
+            targets = targets.replace(",", " ").split()
+        if not targets:
+            raise ValueError("At least one target is required.")
+        if max_concurrency < 1 or shard_size < 1 or port_shards < 1:
+            raise ValueError("max_concurrency, shard_size and port_shards must be positive.")
+
+        self.flags = shlex.split(flags or "")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.nmap = nmap
+        port_groups = self.split_ports(ports, port_shards) if ports else [None]
+        self.shards = list(product(self.split_targets(targets, shard_size), port_groups))
+
+
+    @staticmethod
+    def split_targets(targets, shard_size):
+        """
+        Splits targets into groups of at most shard_size addresses.
+        Networks larger than a shard are split into subnets. Other targets, like hostnames
+        and nmap ranges, count as one address each.
+
+        Args:
+            targets (list): The targets.
+            shard_size (int): The maximum number of addresses per group.
+
+        Returns:
+            list: Lists of targets.
+        """
+        groups = []
+        group = []
+        for target in targets:
+            try:
+                network = ipaddress.ip_network(target, strict=False)
+            except ValueError:
+                network = None
+
+            if network is not None and network.num_addresses > shard_size:
+                new_prefix = network.max_prefixlen - (shard_size.bit_length() - 1)
+                groups += [[str(subnet)] for subnet in network.subnets(new_prefix=max(new_prefix, network.prefixlen))]
+                continue
+
+            group.append(target)
+            if len(group) >= shard_size:
+                groups.append(group)
+                group = []
+
+        if group:
+            groups.append(group)
+        return groups
+
+
+    @staticmethod
+    def split_ports(ports, shards):
+        """
+        Splits a port specification into contiguous ranges with about the same number of ports.
+
+        Args:
+            ports (str): The ports, e.g. '22,80,1000-2000'.
+            shards (int): The number of ranges.
+
+        Returns:
+            list: Port specifications, e.g. ['22,80,1000-1499', '1500-2000'].
+        """
+        numbers = []
+        for part in str(ports).split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.replace("-", "").isdigit():
+                # Protocol prefixes and service names are left to nmap
+                return [str(ports)]
+            start, _, end = part.partition("-")
+            numbers += range(int(start), int(end or start) + 1)
+        numbers = sorted(set(numbers))
+        if not numbers:
+            raise ValueError(f"No ports in '{ports}'.")
+
+        size = -(-len(numbers) // shards)
+        specifications = []
+        for i in range(0, len(numbers), size):
+            chunk = numbers[i:i + size]
+            ranges = []
+            start = previous = chunk[0]
+            for number in chunk[1:] + [None]:
+                if number is not None and number == previous + 1:
+                    previous = number
+                    continue
+                ranges.append(str(start) if start == previous else f"{start}-{previous}")
+                start = previous = number
+            specifications.append(",".join(ranges))
+        return specifications
+
+
+    @staticmethod
+    def count_addresses(targets):
+        """
+        Counts the addresses of targets. Hostnames and nmap ranges count as one.
+        """
+        count = 0
+        for target in targets:
+            try:
+                count += ipaddress.ip_network(target, strict=False).num_addresses
+            except ValueError:
+                count += 1
+        return count
+
+
+    def build_command(self, targets, ports):
+        """
+        Builds the nmap arguments of a shard.
+
+        Args:
+            targets (list): The targets of the shard.
+            ports (str): The ports of the shard, or None.
+
+        Returns:
+            list: The nmap arguments, writing XML to stdout.
+        """
+        command = [self.nmap] + self.flags
+        if ports:
+            command += ["-p", ports]
+        return NmapScanner.with_xml_output(command + list(targets))
+
+
+    async def _scan_shard(self, semaphore, index, targets, ports):
+        """
+        Scans one shard. Output read before a timeout or error is kept.
+
+        Returns:
+            dict: The hosts and the status of the shard.
+        """
+        command = self.build_command(targets, ports)
+        chunks = []
+        status = "done"
+        async with semaphore:
+            logger.info("Starting shard %s/%s: %s", index + 1, len(self.shards), shlex.join(command))
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                logger.error("Error starting nmap for shard %s: %s", index + 1, str(e))
+                return {"hosts": [], "status": "failed", "targets": targets, "ports": ports}
+
+            async def read_stdout():
+                while True:
+                    chunk = await process.stdout.read(1 << 16)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+
+            async def read_output():
+                _, error = await asyncio.gather(read_stdout(), process.stderr.read())
+                return await process.wait(), error
+
+            try:
+                returncode, error = await asyncio.wait_for(read_output(), self.timeout)
+                if returncode != 0:
+                    logger.error("Nmap failed for shard %s: %s", index + 1, error.decode(errors="replace"))
+                    status = "failed"
+            except asyncio.TimeoutError:
+                logger.warning("Shard %s timed out after %s seconds", index + 1, self.timeout)
+                process.kill()
+                await process.wait()
+                status = "timed_out"
+
+        hosts = list(NmapScanner.parse_hosts(chunks))
+        return {"hosts": hosts, "status": status, "targets": targets, "ports": ports}
+
+
+    async def run_async(self):
+        """
+        Scans all shards concurrently.
+
+        Returns:
+            dict: The merged hosts, the failed and timed out shards, the number of shards,
+                  the scanned addresses, the elapsed seconds and the addresses scanned per second.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(self._scan_shard(semaphore, index, targets, ports))
+            for index, (targets, ports) in enumerate(self.shards)
+        ]
+
+        hosts = []
+        failed = []
+        timed_out = []
+        scanned = 0
+        scanned_groups = set()
+        for finished, task in enumerate(asyncio.as_completed(tasks), 1):
+            shard = await task
+            hosts += shard["hosts"]
+            if shard["status"] == "failed":
+                failed.append((shard["targets"], shard["ports"]))
+            elif shard["status"] == "timed_out":
+                timed_out.append((shard["targets"], shard["ports"]))
+            elif tuple(shard["targets"]) not in scanned_groups:
+                # Port shards of a target group scan the same addresses
+                scanned_groups.add(tuple(shard["targets"]))
+                scanned += self.count_addresses(shard["targets"])
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                "Finished %s/%s shards, %s hosts reported, %.1f addresses/s",
+                finished, len(tasks), len(hosts), scanned / elapsed if elapsed else 0.0
+            )
+
+        elapsed = time.perf_counter() - start
+        merged = self.merge_hosts(hosts)
+        logger.info(
+            "Scanned %s addresses in %.1f seconds: %s hosts, %s failed and %s timed out shards",
+            scanned, elapsed, len(merged), len(failed), len(timed_out)
+        )
+        return {
+            "hosts": merged,
+            "shards": len(self.shards),
+            "failed": failed,
+            "timed_out": timed_out,
+            "scanned": scanned,
+            "elapsed": elapsed,
+            "hosts_per_second": scanned / elapsed if elapsed else 0.0
+        }
+
+
+    def run(self):
+        """
+        Scans all shards concurrently. See run_async.
+        asyncio.run is only used when no event loop is running in this thread. Otherwise the scan
+        runs in its own loop in a worker thread and this call blocks, so callers in an event loop
+        should await run_async instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run_async())
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.run_async()).result()
+
+
+    @staticmethod
+    def merge_hosts(hosts):
+        """
+        Merges the hosts reported by several shards, e.g. one host scanned in several port ranges.
+
+        Args:
+            hosts (list): Hosts as returned by NmapScanner.parse_host.
+
+        Returns:
+            list: One host per address, with the ports, OS matches, hostnames and CPEs of all shards.
+        """
+        merged = {}
+        for host in hosts:
+            key = host["ip"] or host["mac_address"]
+            if key not in merged:
+                merged[key] = {
+                    **host,
+                    "addresses": dict(host["addresses"]),
+                    "hostnames": list(host["hostnames"]),
+                    "ports": list(host["ports"]),
+                    "os_matches": list(host["os_matches"]),
+                    "cpes": list(host["cpes"])
+                }
+                continue
+
+            entry = merged[key]
+            entry["addresses"].update(host["addresses"])
+            entry["mac_address"] = entry["mac_address"] or host["mac_address"]
+            entry["mac_vendor"] = entry["mac_vendor"] or host["mac_vendor"]
+            if host["status"] == "up":
+                entry["status"] = "up"
+            known_ports = {port["port"] for port in entry["ports"]}
+            entry["ports"] += [port for port in host["ports"] if port["port"] not in known_ports]
+            for field in ("hostnames", "os_matches", "cpes"):
+                entry[field] += [value for value in host[field] if value not in entry[field]]
+
+        for entry in merged.values():
+            entry["ports"].sort(key=lambda port: (port["protocol"], port["portid"]))
+            entry["os_matches"].sort(key=lambda match: -match["accuracy"])
+        return list(merged.values())
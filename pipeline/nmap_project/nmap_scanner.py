@@ -3,18 +3,25 @@ This module contains the NmapScanner class, which represents an Nmap scanner.
 
 The NmapScanner class provides methods to run an Nmap scan on a target IP address or hostname,
 parse the scan output, and extract relevant information.
+Nmap writes its XML report to stdout (-oX -), which is parsed incrementally,
+so every scanned host is available as soon as nmap reports it.
 
 Example usage:
-    target = "192.168.56.4"
-    scanner = NmapScanner(target)
+    target = "192.168.56.0/24"
+    scanner = NmapScanner(target=target, flags="-sV -O")
     scanner.run_nmap() or scanner.run_command("nmap -sV -p 22,80 -O 10.0.10.10")
     scanner.parse_output()
+
+    # or, host by host while the scan runs
+    for host in NmapScanner(target=target, flags="-sV").iter_hosts():
+        print(host["ip"], host["ports"])
 """
 
+import shlex
 import subprocess
-import re
+import tempfile
+from xml.etree.ElementTree import XMLPullParser, ParseError
 from pipeline import logger
-from pprint import pprint
 
 class NmapScanner:
     """
@@ -22,13 +29,15 @@ class NmapScanner:
 
     Attributes:
         target (str): The target IP address or hostname to scan.
-        nmap_output (str): The output of the Nmap scan.
+        nmap_output (str): The XML report of the Nmap scan.
         parsed_data (dict): Parsed data from the Nmap scan.
+        returncode (int): The exit status of the last iter_hosts scan, None before it ended.
 
     Methods:
         run_nmap(): Runs the Nmap scan.
-        run_command(command: str): Runs a command in the shell.
-        parse_output(): Parses the Nmap scan output.
+        run_command(command: str): Runs an Nmap command with XML output.
+        iter_hosts(): Runs the Nmap scan and yields the hosts as they are reported.
+        parse_output(): Parses the Nmap XML report.
         get_parsed_data(): Returns the parsed data from the Nmap scan.
     """
     def __init__(self, **kwargs):
@@ -48,6 +57,7 @@ class NmapScanner:
         self._kwargs = kwargs
         self.nmap_output = ''
         self.parsed_data = {}
+        self.returncode = None
 
 
     def __getattr__(self, name):
@@ -68,75 +78,222 @@ class NmapScanner:
         raise AttributeError(f"The 'NmapScanner' object has no attribute '{name}'")
 
 
+    def build_command(self):
+        """
+        Builds the Nmap command from the options.
+
+        Returns:
+            list: The Nmap arguments, writing XML to stdout.
+        """
+        command = ["nmap"] + shlex.split(self.flags or "")
+        if self._kwargs.get("ports"):
+            command += ["-p", str(self._kwargs["ports"])]
+        if self._kwargs.get("script"):
+            command += ["--script", self._kwargs["script"]]
+        if self._kwargs.get("firewall"):
+            command.append("-Pn")
+        return self.with_xml_output(command + shlex.split(self.target))
+
+
+    @staticmethod
+    def with_xml_output(command):
+        """
+        Makes an Nmap command write its XML report to stdout.
+        param command: The command as a string or a list of arguments.
+
+        Returns:
+            list: The arguments with '-oX -' instead of any other output option.
+        """
+        arguments = shlex.split(command) if isinstance(command, str) else list(command)
+        cleaned = []
+        skip = False
+        for argument in arguments:
+            if skip:
+                skip = False
+                continue
+            if argument in ("-oX", "-oN", "-oG", "-oA", "-oS"):
+                skip = True
+                continue
+            cleaned.append(argument)
+        return cleaned[:1] + ["-oX", "-"] + cleaned[1:]
+
+
     def run_nmap(self):
         """
         Runs an Nmap scan on the target.
 
         Returns:
-            str: The output of the Nmap scan.
+            NmapScanner: self, with the XML report in nmap_output, or None if nmap failed.
         """
-        command = f"nmap {self.flags} {self.ports} {self.script} {self.firewall} {self.target}"
-        return self.run_command(command)
+        return self.run_command(self.build_command())
 
 
     def run_command(self, command):
         """
-        Runs a command in the shell.
-        param command: The command to run.
+        Runs an Nmap command without a shell and keeps its XML report.
+        param command: The command to run, as a string or a list of arguments.
         """
-
-        logger.info("Running Nmap command: %s", command)
+        command = self.with_xml_output(command)
+        logger.info("Running Nmap command: %s", shlex.join(command))
 
         try:
-            with subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as process:
-                output, error = process.communicate()
-                if process.returncode != 0:
-                    logger.error("Error running nmap: %s", error)
-                    return None
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+            if result.returncode != 0:
+                logger.error("Error running nmap: %s", result.stderr)
+                return None
 
-            self.nmap_output = output
+            self.nmap_output = result.stdout
             return self
         except Exception as e:
             logger.error("Error running nmap: %s", str(e))
 
 
-    def parse_output(self):
+    def iter_hosts(self, command=None):
+        """
+        Runs an Nmap scan and yields every host as soon as nmap reports it.
+        param command: The command to run. Defaults to the command built from the options.
+
+        Yields:
+            dict: The hosts, see parse_host. Check returncode once the hosts are read:
+                  a failed scan yields the hosts reported before it failed.
+        """
+        self.returncode = None
+        command = self.with_xml_output(command) if command else self.build_command()
+        logger.info("Running Nmap command: %s", shlex.join(command))
+
+        # Only stdout is read until the scan ends, so stderr goes to a file: a full stderr
+        # pipe would block nmap and the scan would never end
+        with tempfile.TemporaryFile() as errors:
+            try:
+                process = subprocess.Popen(  # pylint: disable=consider-using-with
+                    command, stdout=subprocess.PIPE, stderr=errors
+                )
+            except OSError as e:
+                # nmap is not installed or cannot be executed, like the 127 of a shell
+                logger.error("Error running nmap: %s", str(e))
+                self.returncode = 127
+                return
+
+            with process:
+                try:
+                    yield from self.parse_hosts(iter(lambda: process.stdout.read1(1 << 16), b""))
+                except GeneratorExit:
+                    # The caller stopped reading, the rest of the scan is not needed
+                    process.kill()
+                    raise
+                self.returncode = process.wait()
+                if self.returncode != 0:
+                    errors.seek(0)
+                    logger.error("Error running nmap: %s", errors.read().decode(errors="replace"))
+
+
+    @classmethod
+    def parse_hosts(cls, chunks):
         """
-        Parses the Nmap scan output and extracts relevant information.
+        Parses an Nmap XML report incrementally.
+        param chunks: An iterable of str or bytes pieces of the report, e.g. reads from a pipe.
+
+        Yields:
+            dict: The hosts, see parse_host. Parsed elements are released, so memory stays constant.
+        """
+        parser = XMLPullParser(events=("start", "end"))
+        root = None
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == "start" and root is None:
+                        root = element
+                    elif event == "end" and element.tag == "host":
+                        yield cls.parse_host(element)
+                        if root is not None and element in root:
+                            root.remove(element)
+            parser.close()
+        except ParseError as e:
+            logger.error("Error parsing the Nmap XML report: %s", str(e))
+
+
+    @staticmethod
+    def parse_host(host):
         """
-        host_regex = re.compile(r'Nmap scan report for ([\d\.]+)')
-        port_regex = re.compile(r'(\d+/\w+)\s+(\w+)\s+(\w+)\s+(.+)')
-        mac_regex = re.compile(r'MAC Address: ([0-9A-F:]+) \((.+)\)')
-        service_info_regex = re.compile(r'Service Info: OSs: (.+); CPE: (.+)')
+        Converts a <host> element of the Nmap XML report into a compact dictionary.
+        param host: The host element.
 
-        host_match = host_regex.search(self.nmap_output)
-        host_ip = host_match.group(1) if host_match else None
+        Returns:
+            dict: ip, addresses by type, mac_address, mac_vendor, hostnames, status, ports,
+                  os_matches and the unique cpes of the services and OS matches.
+        """
+        addresses = {}
+        mac_vendor = None
+        for address in host.iter("address"):
+            addresses[address.get("addrtype")] = address.get("addr")
+            if address.get("addrtype") == "mac":
+                mac_vendor = address.get("vendor")
 
         ports = []
-        for port_match in port_regex.finditer(self.nmap_output):
-            port_info = {
-                'port': port_match.group(1),
-                'state': port_match.group(2),
-                'service': port_match.group(3),
-                'version': port_match.group(4)
+        for port in host.iter("port"):
+            state = port.find("state")
+            service = port.find("service")
+            service = service if service is not None else {}
+            product = " ".join(
+                value for value in (service.get("product"), service.get("version"), service.get("extrainfo")) if value
+            )
+            ports.append({
+                "port": f"{port.get('portid')}/{port.get('protocol')}",
+                "portid": int(port.get("portid")),
+                "protocol": port.get("protocol"),
+                "state": state.get("state") if state is not None else None,
+                "service": service.get("name"),
+                "product": service.get("product"),
+                "service_version": service.get("version"),
+                "version": product,
+                "cpes": [cpe.text for cpe in port.iter("cpe") if cpe.text]
+            })
+
+        os_matches = [
+            {
+                "name": match.get("name"),
+                "accuracy": int(match.get("accuracy", 0)),
+                "cpes": [cpe.text for cpe in match.iter("cpe") if cpe.text]
             }
-            ports.append(port_info)
+            for match in host.iter("osmatch")
+        ]
 
-        mac_match = mac_regex.search(self.nmap_output)
-        mac_address = mac_match.group(1) if mac_match else None
-        mac_vendor = mac_match.group(2) if mac_match else None
+        cpes = []
+        for entry in ports + os_matches:
+            cpes += [cpe for cpe in entry["cpes"] if cpe not in cpes]
+
+        status = host.find("status")
+        return {
+            "ip": addresses.get("ipv4") or addresses.get("ipv6"),
+            "addresses": addresses,
+            "mac_address": addresses.get("mac"),
+            "mac_vendor": mac_vendor,
+            "hostnames": [hostname.get("name") for hostname in host.iter("hostname")],
+            "status": status.get("state") if status is not None else None,
+            "ports": ports,
+            "os_matches": os_matches,
+            "cpes": cpes
+        }
 
-        service_info_match = service_info_regex.search(self.nmap_output)
-        os_info = service_info_match.group(1) if service_info_match else None
-        cpe_info = service_info_match.group(2) if service_info_match else None
+
+    def parse_output(self):
+        """
+        Parses the Nmap XML report and extracts the hosts.
+        The fields of the first host are kept at the top level for single target scans.
+        """
+        hosts = list(self.parse_hosts([self.nmap_output]))
+        first = hosts[0] if hosts else {}
+        os_matches = first.get("os_matches") or []
 
         self.parsed_data = {
-            'host_ip': host_ip,
-            'ports': ports,
-            'mac_address': mac_address,
-            'mac_vendor': mac_vendor,
-            'os_info': os_info,
-            'cpe_info': cpe_info
+            'hosts': hosts,
+            'host_ip': first.get('ip'),
+            'ports': first.get('ports', []),
+            'mac_address': first.get('mac_address'),
+            'mac_vendor': first.get('mac_vendor'),
+            'os_info': os_matches[0]['name'] if os_matches else None,
+            'cpe_info': ", ".join(first.get('cpes', [])) or None
         }
 
         return self
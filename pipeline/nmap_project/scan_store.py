@@ -0,0 +1,543 @@
+"""
+This module contains the ScanStore and IncrementalScanner classes.
+
+ScanStore keeps the history of Nmap scans in a SQLite database: every scan with the hosts it
+found and the state, service and version of every port. Diff reports between scans and trend
+queries over time are answered from it.
+
+IncrementalScanner uses the store to rescan an estate cheaply. A fast discovery pass without
+version detection finds the open ports, the result is compared with the last snapshot, and the
+expensive detection flags (e.g. -sV -O or scripts) only run on new ports, on ports whose service
+name changed since the last discovery pass, and on ports whose details are older than
+max_detail_age. Other ports keep the details of the snapshot.
+
+Example usage:
+    store = ScanStore()
+    scanner = IncrementalScanner(store, flags="-sV -O", max_detail_age=7 * 24 * 3600)
+    result = scanner.rescan("192.168.56.0/24")
+    print(result["diff"])
+    print(store.trend("192.168.56.0/24"))
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pipeline import logger
+from pipeline.config import CACHE_DIR
+from pipeline.nmap_project.nmap_scanner import NmapScanner
+
+
+class ScanStore:
+    """
+    Persistent history of Nmap scans.
+
+    Methods:
+        start_scan(target, kind, flags): Starts a scan and returns its id.
+        record_hosts(scan_id, hosts): Stores the hosts of a scan.
+        finish_scan(scan_id): Marks a scan as finished.
+        latest_scan(target, kinds): The id of the last finished scan of a target.
+        scan_info(scan_id): The target, kind, flags and times of a scan.
+        hosts(scan_id): The hosts of a scan.
+        diff(old_hosts, new_hosts): Compares two sets of hosts.
+        diff_scans(old_scan_id, new_scan_id): Compares two scans.
+        trend(target, limit): Hosts, open ports and services per scan over time.
+        port_history(ip, port): The observations of a port over time.
+    """
+
+    DISCOVERY = "discovery"
+    FULL = "full"
+    RESCAN = "rescan"
+    SNAPSHOT_KINDS = (FULL, RESCAN)
+
+    def __init__(self, db_path=None):
+        """
+        Initializes the ScanStore.
+        Args:
+            db_path (str): The path to the SQLite database. Defaults to scans.sqlite3 in the cache directory.
+        """
+        self.db_path = str(db_path or CACHE_DIR / "scans.sqlite3")
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS scans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    target TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    flags TEXT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS hosts (
+                    scan_id INTEGER NOT NULL REFERENCES scans(id),
+                    ip TEXT NOT NULL,
+                    status TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (scan_id, ip)
+                );
+                CREATE TABLE IF NOT EXISTS ports (
+                    scan_id INTEGER NOT NULL REFERENCES scans(id),
+                    ip TEXT NOT NULL,
+                    port TEXT NOT NULL,
+                    portid INTEGER,
+                    protocol TEXT,
+                    state TEXT,
+                    service TEXT,
+                    product TEXT,
+                    service_version TEXT,
+                    version TEXT,
+                    cpes TEXT,
+                    detailed_at REAL,
+                    PRIMARY KEY (scan_id, ip, port)
+                );
+                CREATE INDEX IF NOT EXISTS scans_by_target ON scans (target, finished_at);
+                CREATE INDEX IF NOT EXISTS ports_by_address ON ports (ip, port);
+                """
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(ports)")]
+            if 'detailed_at' not in columns:
+                self._connection.execute("ALTER TABLE ports ADD COLUMN detailed_at REAL")
+
+
+    def start_scan(self, target, kind=FULL, flags=None):
+        """
+        Starts a scan.
+        Args:
+            target (str): The scanned targets.
+            kind (str): DISCOVERY, FULL or RESCAN. Only FULL and RESCAN scans are snapshots.
+            flags (str): The Nmap flags of the scan.
+        Returns:
+            int: The scan id.
+        """
+        if kind not in (self.DISCOVERY, self.FULL, self.RESCAN):
+            raise ValueError(f"Invalid scan kind: {kind}")
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO scans (target, kind, flags, started_at) VALUES (?, ?, ?, ?)",
+                (target, kind, flags, time.time())
+            )
+            return cursor.lastrowid
+
+
+    def record_hosts(self, scan_id, hosts):
+        """
+        Stores the hosts of a scan with all their ports.
+        Args:
+            scan_id (int): The scan id.
+            hosts (list): Hosts as returned by NmapScanner.parse_host.
+        """
+        with self._lock, self._connection:
+            for host in hosts:
+                data = {key: value for key, value in host.items() if key != "ports"}
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO hosts (scan_id, ip, status, data) VALUES (?, ?, ?, ?)",
+                    (scan_id, host["ip"], host["status"], json.dumps(data))
+                )
+                self._connection.executemany(
+                    """
+                    INSERT OR REPLACE INTO ports
+                    (scan_id, ip, port, portid, protocol, state, service, product, service_version, version, cpes,
+                     detailed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            scan_id, host["ip"], port["port"], port["portid"], port["protocol"], port["state"],
+                            port["service"], port.get("product"), port.get("service_version"), port.get("version"),
+                            ";".join(port.get("cpes") or []), port.get("detailed_at")
+                        )
+                        for port in host["ports"]
+                    ]
+                )
+
+
+    def finish_scan(self, scan_id):
+        """
+        Marks a scan as finished. Unfinished scans are never used as snapshots.
+        Args:
+            scan_id (int): The scan id.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE scans SET finished_at = ? WHERE id = ?", (time.time(), scan_id))
+
+
+    def latest_scan(self, target, kinds=SNAPSHOT_KINDS):
+        """
+        Gets the last finished scan of a target.
+        Args:
+            target (str): The scanned targets.
+            kinds (tuple): The scan kinds to consider. Defaults to the snapshots.
+        Returns:
+            int: The scan id, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f"""
+                SELECT id FROM scans
+                WHERE target = ? AND finished_at IS NOT NULL AND kind IN ({",".join("?" * len(kinds))})
+                ORDER BY id DESC LIMIT 1
+                """,
+                (target, *kinds)
+            ).fetchone()
+        return row["id"] if row else None
+
+
+    def scan_info(self, scan_id):
+        """
+        Gets a scan.
+        Args:
+            scan_id (int): The scan id.
+        Returns:
+            dict: id, target, kind, flags, started_at and finished_at, or None.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM scans WHERE id = ?", (scan_id,)).fetchone()
+        return dict(row) if row else None
+
+
+    def hosts(self, scan_id):
+        """
+        Gets the hosts of a scan in the format of NmapScanner.parse_host.
+        Ports scanned by IncrementalScanner also have the time of their details in detailed_at.
+        Args:
+            scan_id (int): The scan id.
+        Returns:
+            list: The hosts, ordered by address.
+        """
+        with self._lock:
+            host_rows = self._connection.execute(
+                "SELECT ip, data FROM hosts WHERE scan_id = ? ORDER BY ip", (scan_id,)
+            ).fetchall()
+            port_rows = self._connection.execute(
+                "SELECT * FROM ports WHERE scan_id = ? ORDER BY ip, protocol, portid", (scan_id,)
+            ).fetchall()
+
+        hosts = {row["ip"]: {**json.loads(row["data"]), "ports": []} for row in host_rows}
+        for row in port_rows:
+            hosts[row["ip"]]["ports"].append({
+                "port": row["port"],
+                "portid": row["portid"],
+                "protocol": row["protocol"],
+                "state": row["state"],
+                "service": row["service"],
+                "product": row["product"],
+                "service_version": row["service_version"],
+                "version": row["version"],
+                "cpes": [cpe for cpe in (row["cpes"] or "").split(";") if cpe],
+                **({"detailed_at": row["detailed_at"]} if row["detailed_at"] is not None else {})
+            })
+        return list(hosts.values())
+
+
+    @staticmethod
+    def open_ports(hosts):
+        """
+        The open ports of the hosts that are up.
+        Args:
+            hosts (list): Hosts as returned by NmapScanner.parse_host.
+        Returns:
+            dict: (ip, port) to port.
+        """
+        return {
+            (host["ip"], port["port"]): port
+            for host in hosts if host.get("status") in ("up", None)
+            for port in host["ports"] if port["state"] == "open"
+        }
+
+
+    @staticmethod
+    def service_fingerprint(port):
+        """
+        The service, product and version of a port.
+        """
+        return {"service": port.get("service"), "product": port.get("product"), "version": port.get("service_version")}
+
+
+    @classmethod
+    def diff(cls, old_hosts, new_hosts, compare_services=True):
+        """
+        Compares two sets of hosts.
+        Args:
+            old_hosts (list): The earlier hosts.
+            new_hosts (list): The later hosts.
+            compare_services (bool): Report ports whose service, product or version changed.
+                                     Off when one side comes from a discovery scan without versions.
+        Returns:
+            dict: new_hosts and gone_hosts addresses, opened and closed (ip, port) pairs and the
+                  changed ports with their service before and after.
+        """
+        old_ports = cls.open_ports(old_hosts)
+        new_ports = cls.open_ports(new_hosts)
+        old_ips = {host["ip"] for host in old_hosts if host.get("status") in ("up", None)}
+        new_ips = {host["ip"] for host in new_hosts if host.get("status") in ("up", None)}
+
+        changed = []
+        if compare_services:
+            for key in sorted(old_ports.keys() & new_ports.keys()):
+                before = cls.service_fingerprint(old_ports[key])
+                after = cls.service_fingerprint(new_ports[key])
+                if before != after:
+                    changed.append({"ip": key[0], "port": key[1], "before": before, "after": after})
+
+        return {
+            "new_hosts": sorted(new_ips - old_ips),
+            "gone_hosts": sorted(old_ips - new_ips),
+            "opened": sorted(new_ports.keys() - old_ports.keys()),
+            "closed": sorted(old_ports.keys() - new_ports.keys()),
+            "changed": changed
+        }
+
+
+    def diff_scans(self, old_scan_id, new_scan_id):
+        """
+        Compares two stored scans. See diff.
+        """
+        return self.diff(self.hosts(old_scan_id), self.hosts(new_scan_id))
+
+
+    def trend(self, target=None, limit=30):
+        """
+        Counts the hosts, open ports and distinct services of the last snapshots.
+        Args:
+            target (str): The scanned targets, all targets if None.
+            limit (int): The number of scans.
+        Returns:
+            list: Dictionaries with scan_id, target, kind, started_at, hosts, open_ports and services, oldest first.
+        """
+        where = "WHERE s.finished_at IS NOT NULL AND s.kind IN (?, ?)"
+        parameters = list(self.SNAPSHOT_KINDS)
+        if target is not None:
+            where += " AND s.target = ?"
+            parameters.append(target)
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"""
+                SELECT s.id AS scan_id, s.target, s.kind, s.started_at,
+                       (SELECT COUNT(*) FROM hosts h WHERE h.scan_id = s.id AND h.status = 'up') AS hosts,
+                       COUNT(p.port) AS open_ports,
+                       COUNT(DISTINCT COALESCE(p.product, p.service) || ' ' || COALESCE(p.service_version, ''))
+                           AS services
+                FROM scans s
+                LEFT JOIN ports p ON p.scan_id = s.id AND p.state = 'open'
+                {where}
+                GROUP BY s.id
+                ORDER BY s.id DESC
+                LIMIT ?
+                """,
+                (*parameters, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+
+    def port_history(self, ip, port):
+        """
+        Lists the observations of a port over time.
+        Args:
+            ip (str): The host address.
+            port (str): The port, e.g. '22/tcp'.
+        Returns:
+            list: Dictionaries with scan_id, kind, started_at, state, service, product and service_version.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT s.id AS scan_id, s.kind, s.started_at, p.state, p.service, p.product, p.service_version
+                FROM ports p JOIN scans s ON s.id = p.scan_id
+                WHERE p.ip = ? AND p.port = ? AND s.finished_at IS NOT NULL
+                ORDER BY s.id
+                """,
+                (ip, port)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class IncrementalScanner:
+    """
+    Rescans targets with version detection only on new, changed or stale ports.
+    """
+
+    def __init__(self, store, flags="-sV -O", discovery_flags="-T4", firewall=False, script=None,
+                 max_detail_age=None):
+        """
+        Args:
+            store (ScanStore): The scan history.
+            flags (str): The flags of the detailed scan, e.g. '-sV -O'.
+            discovery_flags (str): The flags of the fast discovery pass.
+            firewall (bool): Whether to skip host discovery (-Pn).
+            script (str): The Nmap scripts of the detailed scan.
+            max_detail_age (float): The age in seconds after which the details of an open port
+                                    are scanned again. Never if None.
+        """
+        self.store = store
+        self.flags = flags
+        self.discovery_flags = discovery_flags
+        self.firewall = firewall
+        self.script = script
+        self.max_detail_age = max_detail_age
+
+
+    @staticmethod
+    def port_specification(ports):
+        """
+        The Nmap -p value of ports.
+        Args:
+            ports (list): Ports like '22/tcp' or '53/udp'.
+        Returns:
+            str: e.g. 'T:22,U:53'.
+        """
+        return ",".join(
+            f"{'U' if protocol == 'udp' else 'T'}:{portid}"
+            for portid, _, protocol in sorted(
+                (port.partition("/") for port in ports), key=lambda parts: (parts[2], int(parts[0]))
+            )
+        )
+
+
+    def rescan(self, target, ports=None):
+        """
+        Rescans a target. Without an earlier snapshot every open port is scanned in detail.
+        Otherwise a port is scanned in detail if it is new, if it was never scanned in detail,
+        if the discovery pass reports another service name than the last discovery pass,
+        or if its details are older than max_detail_age. Ports that were scanned in detail but
+        not identified, e.g. tcpwrapped, are not scanned again until their details are stale.
+        If the discovery pass fails, nothing is recorded as a snapshot. Ports whose detailed scan
+        fails keep their earlier details without a detail time, so the next rescan scans them again.
+        Args:
+            target (str): The targets.
+            ports (str): The ports of the discovery pass. Nmap's default ports if None.
+        Returns:
+            dict: The merged hosts, the diff against the last snapshot, the scan id,
+                  the number of ports scanned in detail and the status, 'done' or 'failed'.
+                  A failed rescan has no hosts, diff or scan id.
+        """
+        previous_id = self.store.latest_scan(target)
+        previous_hosts = self.store.hosts(previous_id) if previous_id else []
+        previous_by_ip = {host["ip"]: host for host in previous_hosts}
+        previous_ports = ScanStore.open_ports(previous_hosts)
+        # Rescans record when every port was scanned in detail. Other snapshots do not,
+        # the identified ports of those are as old as the snapshot
+        previous_info = self.store.scan_info(previous_id) if previous_id else None
+        if previous_info and previous_info["kind"] != ScanStore.RESCAN:
+            for port in previous_ports.values():
+                if port.get("product") or port.get("service_version"):
+                    port.setdefault("detailed_at", previous_info["started_at"])
+        # Discovery passes guess the service from the port number and -sV may name it differently,
+        # so the service names of the discovery pass are compared with the last discovery pass
+        previous_discovery_id = self.store.latest_scan(target, (ScanStore.DISCOVERY,))
+        previous_services = {
+            key: port["service"]
+            for key, port in ScanStore.open_ports(self.store.hosts(previous_discovery_id)).items()
+        } if previous_discovery_id else {}
+
+        discovery_id = self.store.start_scan(target, ScanStore.DISCOVERY, self.discovery_flags)
+        discovery = NmapScanner(target=target, flags=self.discovery_flags, ports=ports, firewall=self.firewall)
+        discovered = list(discovery.iter_hosts())
+        if discovery.returncode != 0:
+            # Unfinished scans are not snapshots, the next rescan compares with the last good one
+            logger.error("Discovery pass of %s failed, the rescan is not recorded", target)
+            return {"hosts": [], "diff": None, "scan_id": None, "detailed_ports": 0, "status": "failed"}
+        self.store.record_hosts(discovery_id, discovered)
+        self.store.finish_scan(discovery_id)
+
+        now = time.time()
+        to_scan = {}
+        for (ip, port), found in ScanStore.open_ports(discovered).items():
+            known = previous_ports.get((ip, port))
+            if (
+                not known
+                or known.get("detailed_at") is None
+                or previous_services.get((ip, port), known["service"]) != found["service"]
+                or (self.max_detail_age is not None and now - known["detailed_at"] > self.max_detail_age)
+            ):
+                to_scan.setdefault(ip, []).append(port)
+
+        detailed = {}
+        failed = set()
+        by_specification = {}
+        for ip, host_ports in to_scan.items():
+            by_specification.setdefault(self.port_specification(host_ports), []).append(ip)
+        for specification, ips in by_specification.items():
+            scanner = NmapScanner(
+                target=" ".join(ips), flags=self.flags, ports=specification,
+                firewall=self.firewall, script=self.script
+            )
+            hosts = list(scanner.iter_hosts())
+            if scanner.returncode != 0:
+                logger.error("Detailed scan of %s failed, its ports are scanned again by the next rescan", " ".join(ips))
+                failed.update((ip, port) for ip in ips for port in to_scan[ip])
+                continue
+            for host in hosts:
+                for port in host["ports"]:
+                    port["detailed_at"] = now
+                detailed[host["ip"]] = host
+
+        merged = [self._merge_host(host, detailed.get(host["ip"]), previous_by_ip.get(host["ip"]))
+                  for host in discovered]
+        # Failed ports keep the details of the snapshot but count as never scanned in detail,
+        # the discovery pass is recorded and would hide a changed service from the next rescan
+        for host in merged:
+            for port in host["ports"]:
+                if (host["ip"], port["port"]) in failed:
+                    port.pop("detailed_at", None)
+
+        scan_id = self.store.start_scan(target, ScanStore.RESCAN, self.flags)
+        self.store.record_hosts(scan_id, merged)
+        self.store.finish_scan(scan_id)
+
+        scanned_ports = sum(len(host_ports) for host_ports in to_scan.values()) - len(failed)
+        logger.info(
+            "Rescan of %s: %s open ports, %s scanned in detail, %s reused from scan %s",
+            target, len(ScanStore.open_ports(discovered)), scanned_ports,
+            len(ScanStore.open_ports(discovered)) - scanned_ports, previous_id
+        )
+        return {
+            "hosts": merged,
+            "diff": ScanStore.diff(previous_hosts, merged),
+            "scan_id": scan_id,
+            "detailed_ports": scanned_ports,
+            "status": "done"
+        }
+
+
+    @staticmethod
+    def _merge_host(discovered, detailed, previous):
+        """
+        Combines the discovery result of a host with its detailed scan and its last snapshot.
+        Port states come from the discovery pass, details from the detailed scan or else the snapshot.
+        """
+        detailed_ports = {port["port"]: port for port in (detailed or {}).get("ports", [])}
+        previous_ports = {port["port"]: port for port in (previous or {}).get("ports", [])}
+
+        ports = []
+        for port in discovered["ports"]:
+            source = detailed_ports.get(port["port"])
+            if source is None and port["state"] == "open":
+                source = previous_ports.get(port["port"])
+            ports.append({**(source or port), "state": port["state"]})
+
+        details = detailed or previous or {}
+        os_matches = details.get("os_matches") or discovered["os_matches"]
+        cpes = []
+        for entry in ports + os_matches:
+            cpes += [cpe for cpe in entry["cpes"] if cpe not in cpes]
+
+        return {
+            **discovered,
+            "hostnames": discovered["hostnames"] or details.get("hostnames", []),
+            "ports": ports,
+            "os_matches": os_matches,
+            "cpes": cpes
+        }
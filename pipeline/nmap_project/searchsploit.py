@@ -48,6 +48,10 @@ Methods:
 8. help() -> str:
     - Displays the help screen with all available options and usage examples.
 
+9. search_many(terms_list: List[List[str]], strict_search: bool = False) -> List[Union[str, dict]]:
+    - Searches many queries at once, e.g. one per scanned service.
+    - Uses the in-process ExploitIndex when one is given, so no `searchsploit` process is started.
+
 Example Usage:
     ss = SearchSploit()
 
@@ -71,6 +75,10 @@ Example Usage:
 
     # Display help
     print(ss.help())
+
+    # Search in process with a local index of files_exploits.csv
+    ss = SearchSploit(index=ExploitIndex.load_or_build())
+    print(ss.search_many([["vsftpd", "2.3.4"], ["OpenSSH", "7.6p1"]]))
 """
 
 import subprocess
@@ -83,12 +91,17 @@ class SearchSploit:
     A class to interact with the `searchsploit` tool on a Linux system.
     """
 
-    def __init__(self):
+    def __init__(self, index=None):
         """
         Initializes the base command for `searchsploit` and sets up the logger.
+
+        Parameters:
+        index (ExploitIndex, optional): A local index of the Exploit Database. JSON searches without
+                                        case, exact, exclude or CVE options are answered from it.
         """
         self.base_cmd = ["searchsploit"]
         self.logger = logger
+        self.index = index
 
     def _run_command(self, cmd: List[str], timeout: int = None) -> str:
         """
@@ -140,6 +153,9 @@ class SearchSploit:
         Returns:
         Union[str, dict]: The search results as a string or JSON dictionary.
         """
+        if self.index and json_format and not (case_sensitive or exact_match or exclude or cve):
+            return self.index.search(terms, strict=strict_search)
+
         cmd = self.base_cmd + terms
 
         if case_sensitive:
@@ -166,6 +182,21 @@ class SearchSploit:
                 return f"JSON decode error: {str(e)}"
         return output
 
+    def search_many(self, terms_list: List[List[str]], strict_search: bool = False) -> List[Union[str, dict]]:
+        """
+        Searches many queries, e.g. the services of a scan.
+
+        Parameters:
+        terms_list (List[List[str]]): The search terms of every query.
+        strict_search (bool, optional): Perform a strict search, disabling fuzzy version range matches.
+
+        Returns:
+        List[Union[str, dict]]: The JSON results of every query, in the order of terms_list.
+        """
+        if self.index:
+            return self.index.search_many(terms_list, strict=strict_search)
+        return [self.search(list(terms), strict_search=strict_search) for terms in terms_list]
+
     def show_path(self, edb_id: int) -> str:
         """
         Shows the full path to an exploit by its EDB-ID.
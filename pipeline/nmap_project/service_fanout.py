@@ -0,0 +1,134 @@
+"""
+This module contains the ServiceFanout class, which looks up every distinct service of a scan once.
+
+Scanning many hosts finds the same service, e.g. 'OpenSSH 7.6p1', on dozens of them. The fan-out
+groups the ports by their service fingerprint, looks every fingerprint up once in a batch, keeps the
+results in a TTL cache for the next scans, and maps the results back to every host and port.
+The cost of exploit searches and analyses scales with the distinct services, not the open ports.
+
+Example usage:
+    fanout = ServiceFanout(lambda ports: searchsploit.search_many([search_terms(port) for port in ports]))
+    results = fanout.fan_out(options_list)
+    for options, result in zip(options_list, results):
+        print(options["IP Address"], options["Port Number"], result)
+"""
+
+import threading
+import time
+from cachetools import TTLCache
+from pipeline import logger
+
+
+class ServiceFanout:
+    """
+    Deduplicates service lookups across hosts and ports.
+
+    Attributes:
+        cache (TTLCache): The lookup results by fingerprint.
+        stats (dict): The number of ports, distinct services, lookups and cache hits so far.
+
+    Methods:
+        fingerprint(options): The service fingerprint of a port.
+        group(items): Groups ports by fingerprint.
+        fan_out(items): Looks every distinct fingerprint up once and returns the result of every port.
+    """
+
+    def __init__(self, lookup_many, key=None, ttl=3600, maxsize=4096, timer=time.monotonic):
+        """
+        Args:
+            lookup_many (callable): Called with one representative port per missing fingerprint,
+                                    returns their results in the same order.
+            key (callable): The fingerprint of a port. Defaults to ServiceFanout.fingerprint.
+            ttl (float): The seconds a result is reused.
+            maxsize (int): The maximum number of cached results.
+            timer (callable): The clock of the cache.
+        """
+        self.lookup_many = lookup_many
+        self.key = key or self.fingerprint
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self.stats = {"ports": 0, "services": 0, "lookups": 0, "cache_hits": 0}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def fingerprint(options):
+        """
+        The service fingerprint of a port of NmapPortScannerProject.process_ports.
+
+        Args:
+            options (dict): The port details.
+
+        Returns:
+            tuple: The normalized service name, product and version.
+        """
+        def normalize(value):
+            return " ".join(str(value).lower().split()) if value else ""
+
+        return (
+            normalize(options.get("Service Name")),
+            normalize(options.get("Product")),
+            normalize(options.get("Product Version") or options.get("Version"))
+        )
+
+
+    def group(self, items):
+        """
+        Groups ports by fingerprint.
+
+        Args:
+            items (list): The ports.
+
+        Returns:
+            dict: The ports of every fingerprint, in the order they were first seen.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(self.key(item), []).append(item)
+        return groups
+
+
+    def fan_out(self, items):
+        """
+        Looks every distinct fingerprint up once and maps the results back to the ports.
+        Cached fingerprints are not looked up again until their TTL expires.
+
+        Args:
+            items (list): The ports.
+
+        Returns:
+            list: The result of every port, in the order of items.
+        """
+        keys = [self.key(item) for item in items]
+        representatives = {}
+        for key, item in zip(keys, items):
+            representatives.setdefault(key, item)
+
+        results = {}
+        missing = []
+        with self._lock:
+            for key in representatives:
+                if key in self.cache:
+                    results[key] = self.cache[key]
+                else:
+                    missing.append(key)
+
+        if missing:
+            values = self.lookup_many([representatives[key] for key in missing])
+            if len(values) != len(missing):
+                raise ValueError(f"lookup_many returned {len(values)} results for {len(missing)} services.")
+            with self._lock:
+                for key, value in zip(missing, values):
+                    self.cache[key] = value
+                    results[key] = value
+
+        with self._lock:
+            self.stats["ports"] += len(items)
+            self.stats["services"] += len(representatives)
+            self.stats["lookups"] += len(missing)
+            self.stats["cache_hits"] += len(representatives) - len(missing)
+
+        logger.info(
+            "Fan-out of %s ports: %s distinct services, %s looked up, %s from the cache",
+            len(items), len(representatives), len(missing), len(representatives) - len(missing)
+        )
+        return [results[key] for key in keys]
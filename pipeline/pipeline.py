@@ -7,19 +7,29 @@ This class is in its early stages and will be updated as the project progresses.
 Git Repo: https://github.com/babakbandpey/pipeline
 """
 
+import json
+import os
+import threading
 import uuid
 from typing import Union
 from langchain_openai import ChatOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
 from langchain_community.llms import Ollama
 from langchain_community.embeddings import GPT4AllEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from openai import APIConnectionError
+from jsonschema import SchemaError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 from .logger import logger
-from .config import MAX_INPUT_LENGTH
+from .config import MAX_INPUT_LENGTH, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from .utils.token_utils import TokenCounter
+from .utils.chatbot_utils import ChatbotUtils
+from .utils.json_stream import JsonObjectScanner
 
 
 class PipelineConfig:
@@ -62,8 +72,13 @@ class PipelineSetup(PipelineConfig):
         super().__init__(**kwargs)
         self.chat = None
         self.chat_history = ChatMessageHistory()
+        self.session_histories = {}
+        self._session_lock = threading.Lock()
         self.chat_prompt = None
         self.chain_with_message_history = None
+        self.structured_chains = {}
+        self.structured_metrics = {"calls": 0, "json_mode": 0, "repaired": 0, "retries": 0, "failures": 0}
+        self._metrics_lock = threading.Lock()
         self.vector_store = None
 
         self.setup_chat()
@@ -96,17 +111,20 @@ class PipelineSetup(PipelineConfig):
         self.chat_prompt = prompt
 
 
-    def setup_chain(self) :
+    def setup_chain(self, chat=None) :
         """
         Gets the chat chain for the chatbot.
+        params: chat: The chat model answering the prompt. Defaults to self.chat.
         returns: The chat chain for the chatbot.
         """
-        return self.chat_prompt | self.chat
+        return self.chat_prompt | (chat or self.chat)
 
 
-    def setup_chain_with_message_history(self):
+    def setup_chain_with_message_history(self, structured: Union[bool, dict] = False):
         """
         Sets up a chain with message history.
+        params: structured: Set up a chain of invoke_structured, answering with json_mode_chat.
+                            A JSON schema constrains the answers to the schema.
 
         Returns:
             RunnableWithMessageHistory: A runnable object with message history.
@@ -116,39 +134,142 @@ class PipelineSetup(PipelineConfig):
                 """Chat and chat prompt must be initialized
                 before setting up the chain with message history."""
             )
-        self.chain_with_message_history = RunnableWithMessageHistory(
-            runnable=self.setup_chain(),
-            get_session_history=lambda session_history: self.chat_history,
+        chain = RunnableWithMessageHistory(
+            runnable=self.setup_chain(chat=self.json_mode_chat(self.structured_schema(structured)))
+            if structured else self.setup_chain(),
+            get_session_history=self.get_session_history,
             input_messages_key="input",
             history_messages_key="chat_history",
         )
+        if structured:
+            self.structured_chains[self.structured_key(structured)] = chain
+        else:
+            self.chain_with_message_history = chain
+        return chain
 
 
-    def setup_vector_store(self, all_chunks):
+    def json_mode_chat(self, schema: dict = None):
         """
-        Sets up the vector store with the specified chunks.
-        params: all_chunks: The chunks to set up the vector store with.
-        returns: The initialized vector store.
+        Gets the chat model constrained to JSON output by the provider, if it supports it:
+        the structured outputs or JSON mode of the OpenAI API, or the format of Ollama.
+        params: schema: The JSON schema the answers are constrained to. Any JSON object if None.
+        returns: The constrained chat model, or self.chat if the provider has no JSON mode.
+        """
+        if isinstance(self.chat, Ollama):
+            return self.chat.bind(format=schema or "json")
+        if isinstance(self.chat, ChatOpenAI) and self.openai_api_key:
+            if schema:
+                return self.chat.bind(response_format={
+                    "type": "json_schema",
+                    "json_schema": {"name": "structured_answer", "schema": schema}
+                })
+            return self.chat.bind(response_format={"type": "json_object"})
+        return self.chat
+
+
+    @staticmethod
+    def structured_schema(structured: Union[bool, dict]) -> dict:
+        """
+        Gets the JSON schema of the structured argument of invoke.
+        returns: The schema, or None if any JSON object is accepted.
+        """
+        return structured if isinstance(structured, dict) else None
+
+
+    @classmethod
+    def structured_key(cls, structured: Union[bool, dict]) -> str:
+        """
+        Gets the key of the structured chain answering with the structured argument of invoke.
+        returns: The schema as canonical JSON, or 'json' if any JSON object is accepted.
+        """
+        schema = cls.structured_schema(structured)
+        return json.dumps(schema, sort_keys=True) if schema else "json"
+
+
+    def get_session_history(self, session_id: str = None) -> ChatMessageHistory:
+        """
+        Gets the chat history of a session. Sessions share the chat model and the vector store
+        but not their history, so concurrent conversations do not see each other's messages.
+        params: session_id: The session ID. The default session uses chat_history.
+        returns: The chat history of the session.
+        """
+        if session_id is None or session_id == self.session_id:
+            return self.chat_history
+        with self._session_lock:
+            return self.session_histories.setdefault(session_id, ChatMessageHistory())
+
+
+    def clear_session(self, session_id: str) -> None:
+        """
+        Forgets the chat history of a session.
+        params: session_id: The session ID.
+        """
+        if session_id is None or session_id == self.session_id:
+            self.chat_history.clear()
+            return
+        with self._session_lock:
+            self.session_histories.pop(session_id, None)
+
+
+    @staticmethod
+    def setup_embeddings():
+        """
+        Sets up the embedding model of the vector store.
+        returns: The embeddings.
         """
         model_name = "all-MiniLM-L6-v2.gguf2.f16.gguf"
         gpt4all_kwargs = {'allow_download': 'True'}
 
-        embeding = GPT4AllEmbeddings(
+        return GPT4AllEmbeddings(
             model_name = model_name,
             gpt4all_kwargs = gpt4all_kwargs
         )
 
+
+    def setup_vector_store(self, all_chunks):
+        """
+        Sets up the vector store with the specified chunks.
+        The store is written to the 'persist_directory' kwarg if it is set.
+        params: all_chunks: The chunks to set up the vector store with.
+        returns: The initialized vector store.
+        """
+        embeding = self.setup_embeddings()
+
+        kwargs = {}
         if self.collection_name:
-            self.vector_store = Chroma.from_documents(
-                documents=all_chunks,
-                embedding=embeding,
-                collection_name=self.collection_name
-            )
-        else:
-            self.vector_store = Chroma.from_documents(
-                documents=all_chunks,
-                embedding=embeding
-            )
+            kwargs["collection_name"] = self.collection_name
+        if self._kwargs.get('persist_directory'):
+            kwargs["persist_directory"] = self._kwargs.get('persist_directory')
+        if all(getattr(chunk, "id", None) for chunk in all_chunks):
+            kwargs["ids"] = [chunk.id for chunk in all_chunks]
+
+        self.vector_store = Chroma.from_documents(
+            documents=all_chunks,
+            embedding=embeding,
+            **kwargs
+        )
+
+
+    def load_vector_store(self) -> bool:
+        """
+        Opens the persisted collection in the 'persist_directory' kwarg.
+        returns: True if the collection exists and contains documents.
+        """
+        persist_directory = self._kwargs.get('persist_directory')
+        if not persist_directory or not self.collection_name or not os.path.isdir(persist_directory):
+            return False
+
+        vector_store = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.setup_embeddings(),
+            persist_directory=persist_directory
+        )
+        if not vector_store.get(limit=1)["ids"]:
+            return False
+
+        self.vector_store = vector_store
+        self.logger.info("Loaded collection %s from %s.", self.collection_name, persist_directory)
+        return True
 
 
     def setup_chat(self):
@@ -197,6 +318,10 @@ class LLMConnectionError(PipelineError):
     """Raised when connection to LLM fails"""
     pass
 
+class StructuredOutputError(PipelineError):
+    """Raised when the LLM does not return a valid JSON object for the schema"""
+    pass
+
 class Pipeline(PipelineSetup):
     """
     Represents a pipeline for the chatbot.
@@ -223,19 +348,26 @@ class Pipeline(PipelineSetup):
             self.vector_store.add_texts(all_chunks)
 
 
-    def invoke(self, prompt):
+    def invoke(self, prompt, session_id=None, structured=False, configurable=None):
         """
         Invokes the chatbot with the specified query.
         params: prompt: The prompt to use.
+        params: session_id: The session whose history is used, see get_session_history.
+        params: structured: Answer in the provider's JSON mode, or constrained to a JSON schema,
+                            see invoke_structured.
+        params: configurable: Configurable fields of the chain set for this call only.
         """
-
-        if not self.chain_with_message_history:
-            self.setup_chain_with_message_history()
+        if structured:
+            chain = self.structured_chains.get(self.structured_key(structured))
+        else:
+            chain = self.chain_with_message_history
+        if not chain:
+            chain = self.setup_chain_with_message_history(structured)
 
         try:
-            response = self.chain_with_message_history.invoke(
+            response = chain.invoke(
                 {"input": prompt},
-                {"configurable": {"session_id": self.session_id}},
+                {"configurable": {**(configurable or {}), "session_id": session_id or self.session_id}},
             )
         except APIConnectionError as e:
             raise LLMConnectionError(f"Failed to connect to LLM: {e}") from e
@@ -245,6 +377,99 @@ class Pipeline(PipelineSetup):
         return response
 
 
+    def invoke_structured(self, prompt: str, schema: dict, session_id=None, max_retries: int = 0) -> dict:
+        """
+        Invokes the chatbot and returns its answer as a JSON object validated against a JSON schema.
+        The schema is passed to the provider when it supports it, see json_mode_chat, so the answer
+        is generated to match it. Answers are still validated locally: JSON wrapped in prose or
+        code fences and small syntax errors are repaired. An answer that does not match the schema
+        raises StructuredOutputError, unless max_retries allows sending it back with the error.
+        Only the prompt and the valid answer are kept in the session's history, not the invalid
+        answers and the follow-up prompts. Counts are kept in structured_metrics.
+        params: prompt: The prompt to use.
+        params: schema: The JSON schema of the answer.
+        params: session_id: The session whose history is used, see get_session_history.
+        params: max_retries: The number of follow-up prompts after an invalid answer.
+        returns: The validated answer.
+        """
+        try:
+            validator = validator_for(schema)(schema)
+            validator.check_schema(schema)
+        except SchemaError as e:
+            raise ValueError(f"Invalid JSON schema: {e.message}") from e
+
+        json_mode = self.json_mode_chat(schema) is not self.chat
+        self._count_structured("calls")
+        if json_mode:
+            self._count_structured("json_mode")
+
+        history = self.get_session_history(session_id)
+        kept_messages = list(history.messages)
+        request = (
+            f"{prompt}\n\nRespond only with a JSON object that matches this JSON schema:\n"
+            f"{json.dumps(schema)}"
+        )
+        error = None
+        try:
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    self._count_structured("retries")
+                response = self.invoke(request, session_id=session_id, structured=schema)
+                try:
+                    data = self.parse_structured(response, validator)
+                except ValueError as e:
+                    error = e
+                    self.logger.warning("Invalid structured answer (attempt %s): %s", attempt + 1, e)
+                    request = (
+                        f"Your previous answer was invalid: {e}. "
+                        "Respond again with only the corrected JSON object that matches the JSON schema."
+                    )
+                    continue
+                kept_messages += [HumanMessage(content=prompt), AIMessage(content=json.dumps(data))]
+                return data
+        finally:
+            history.clear()
+            history.add_messages(kept_messages)
+
+        self._count_structured("failures")
+        raise StructuredOutputError(f"No valid answer after {max_retries + 1} attempts: {error}")
+
+
+    def parse_structured(self, response, validator) -> dict:
+        """
+        Extracts, repairs if needed, and validates the JSON object of an answer.
+        params: response: The answer, a string or a message.
+        params: validator: The jsonschema validator of the schema.
+        returns: The JSON object.
+        raises: ValueError: If the answer has no valid JSON object or it does not match the schema.
+        """
+        text = response if isinstance(response, str) else getattr(response, "content", str(response))
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as exc:
+            data = JsonObjectScanner.find(text)
+            if data is None and "{" in text:
+                data = ChatbotUtils.clean_and_parse_json(ChatbotUtils.repair_json(text[text.index("{"):]))
+            if data is None:
+                raise ValueError("the answer is not a JSON object") from exc
+            self._count_structured("repaired")
+
+        if not isinstance(data, dict):
+            raise ValueError("the answer is not a JSON object")
+        error = best_match(validator.iter_errors(data))
+        if error is not None:
+            raise ValueError(f"{error.json_path}: {error.message}")
+        return data
+
+
+    def _count_structured(self, name: str) -> None:
+        """
+        Increments a counter of structured_metrics.
+        """
+        with self._metrics_lock:
+            self.structured_metrics[name] += 1
+
+
     def clear_chat_history(self):
         """
         Clears the chat history.
@@ -330,13 +555,19 @@ class Pipeline(PipelineSetup):
 
     @staticmethod
     def recursive_character_text_splitter(
-        chunk_size=500,
-        chunk_overlap=0
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+        tokenizer: Union[str, TokenCounter] = None,
+        language: Language = None
         ) -> RecursiveCharacterTextSplitter:
         """
         Splits the data into chunks using the specified chunk size and overlap.
         params: chunk_size: The size of the chunks.
         params: chunk_overlap: The overlap between the chunks.
+        params: tokenizer: If set, sizes are measured in tokens of this tokenizer
+                           (a TokenCounter, a tiktoken encoding or model name, or 'approximate')
+                           instead of in characters.
+        params: language: Optional language whose separators are used for splitting.
         returns: The split data.
         """
 
@@ -345,10 +576,18 @@ class Pipeline(PipelineSetup):
         if chunk_overlap < 0:
             raise ValueError("chunk_overlap must be non-negative")
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
-        )
+        splitter_kwargs = {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+        }
+        if tokenizer:
+            counter = tokenizer if isinstance(tokenizer, TokenCounter) else TokenCounter(tokenizer)
+            splitter_kwargs["length_function"] = counter.count
+
+        if language:
+            return RecursiveCharacterTextSplitter.from_language(language=language, **splitter_kwargs)
+
+        text_splitter = RecursiveCharacterTextSplitter(**splitter_kwargs)
         return text_splitter
 
 
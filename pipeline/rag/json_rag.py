@@ -4,11 +4,14 @@ class: JsonRAG
 author: Babak Bandpey
 This module contains the JsonRAG class.
 """
+import json
 import os
-from langchain_community.document_loaders import DirectoryLoader
 from langchain_community.document_loaders.json_loader import JSONLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from pipeline.retrieval import Retrieval
+from pipeline.utils.file_utils import FileUtils
+from pipeline.utils.json_stream import JsonRecordStream
+from pipeline.utils.token_utils import TokenCounter
 
 class JsonRAG(Retrieval):
     """
@@ -20,23 +23,42 @@ class JsonRAG(Retrieval):
         """
         Initializes the JsonRAG object.
         params: kwargs: Dictionary containing configuration parameters.
+                        records_path: If set, the files are streamed and every record
+                        at this dotted path becomes a document ('' for a top-level array).
+                        metadata_fields: The record fields promoted to metadata in records mode.
+                        group_chars: Small records are grouped into documents of up to this many characters.
+                        persist_directory: With a collection_name, a collection persisted there
+                        by an earlier run is loaded instead of embedding the files again.
         """
         super().__init__(**kwargs)
         self.path = kwargs.get('path', None)
         self.auto_clean = kwargs.get('auto_clean', False)
         if not self.path:
             raise ValueError("The path parameter is required.")
+        self.records_path = kwargs.get('records_path')
+        self.metadata_fields = kwargs.get('metadata_fields') or []
+        if isinstance(self.metadata_fields, str):
+            self.metadata_fields = [field for field in self.metadata_fields.split(",") if field]
+        self.group_chars = kwargs.get('group_chars') or 2000
         self.documents = []
         self.check_for_non_ascii_bytes()
-        self.load_documents()
-        self.split_and_store_documents()
+
+        if self.load_vector_store():
+            # The persisted collection is reused instead of embedding the files again
+            return
+        if self.records_path is not None:
+            self.load_and_store_records()
+        else:
+            self.load_documents()
+            self.split_and_store_documents()
 
 
     def _load_documents(self):
         """Loads JSON documents from the filesystem."""
         if os.path.isdir(self.path):
-            loader = DirectoryLoader(self.path, glob="**/*.json", loader_cls=JSONLoader)
-            self.documents = loader.load()
+            for file_path in FileUtils.walk_files(self.path, ".json"):
+                loader = JSONLoader(file_path, jq_schema=".", text_content=False)
+                self.documents.extend(loader.load())
         elif os.path.isfile(self.path) and self.path.endswith(".json"):
             loader = JSONLoader(self.path, jq_schema=".", text_content=False)
             self.documents = loader.load()
@@ -45,6 +67,104 @@ class JsonRAG(Retrieval):
     def split_and_store_documents(self):
         """Splits the documents into chunks and sets up the vector store."""
         self.logger.info("Splitting and storing documents in the local vector database...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=0)
-        all_chunks = self.split_data(text_splitter, self.documents)
-        self.setup_vector_store(all_chunks)
+        all_chunks = self.split_documents(chunk_size=2000, chunk_overlap=0)
+        self.store_chunks(all_chunks)
+
+
+    def load_and_store_records(self, batch_size: int = 256):
+        """
+        Streams the records of the JSON files into the vector store in batches.
+        Records are never split in the middle: small records are grouped into one
+        document, and only records longer than group_chars are cut by the splitter.
+        params: batch_size: The number of documents stored at a time.
+        """
+        if os.path.isdir(self.path):
+            files = FileUtils.walk_files(self.path, ".json")
+        elif os.path.isfile(self.path):
+            files = [self.path]
+        else:
+            raise ValueError(f"Invalid path: {self.path}. No such file or directory.")
+
+        text_splitter = self.recursive_character_text_splitter(
+            chunk_size=self.group_chars,
+            chunk_overlap=0
+        )
+        batch, sizes = [], []
+        for file_path in files:
+            for document in self.iter_record_documents(file_path):
+                if len(document.page_content) > self.group_chars:
+                    batch.extend(self.split_data(text_splitter, [document]))
+                else:
+                    batch.append(document)
+                if len(batch) >= batch_size:
+                    sizes.extend(len(chunk.page_content) for chunk in batch)
+                    self.store_chunks(batch)
+                    batch = []
+
+        if batch:
+            sizes.extend(len(chunk.page_content) for chunk in batch)
+            self.store_chunks(batch)
+
+        self.chunk_stats = TokenCounter.describe(sizes)
+        self.logger.info("Record document sizes in characters: %s", self.chunk_stats)
+
+
+    def iter_record_documents(self, file_path: str):
+        """
+        Yields one document per record, or per group of consecutive small records.
+        params: file_path: The path to the JSON file.
+        """
+        group, group_size, first_index = [], 0, 0
+        for index, record in enumerate(JsonRecordStream(file_path, self.records_path)):
+            text = json.dumps(record, ensure_ascii=False)
+            if group and group_size + len(text) > self.group_chars:
+                yield self._record_document(file_path, group, first_index)
+                group, group_size = [], 0
+            if not group:
+                first_index = index
+            group.append((record, text))
+            group_size += len(text) + 1
+
+        if group:
+            yield self._record_document(file_path, group, first_index)
+
+
+    def _record_document(self, file_path: str, group: list, first_index: int) -> Document:
+        """
+        Creates the document of a group of records.
+        Promoted fields with different values in the group are joined with ';'.
+        params: file_path: The path to the JSON file.
+        params: group: A list of (record, text) tuples.
+        params: first_index: The index of the first record in the file.
+        returns: The document.
+        """
+        metadata = {"source": file_path, "record_index": first_index, "record_count": len(group)}
+        for field in self.metadata_fields:
+            values = []
+            for record, _ in group:
+                value = self._field_value(record, field)
+                if value not in (None, "") and value not in values:
+                    values.append(value)
+            if len(values) == 1:
+                metadata[field] = values[0]
+            elif values:
+                metadata[field] = ";".join(str(value) for value in values)
+
+        return Document(page_content="\n".join(text for _, text in group), metadata=metadata)
+
+
+    @staticmethod
+    def _field_value(record, field: str):
+        """
+        Looks up a dotted field in a record.
+        params: record: The decoded record.
+        params: field: The dotted field, e.g. 'address.addr'.
+        returns: The scalar value, or None if the field is missing or not a scalar.
+        """
+        for key in field.split("."):
+            if not isinstance(record, dict) or key not in record:
+                return None
+            record = record[key]
+        if isinstance(record, (str, int, float, bool)):
+            return record
+        return None
@@ -7,8 +7,8 @@ This module contains the MdRAG class.
 # file: pipeline/markdown_rag.py
 import os
 from langchain_community.document_loaders import UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pipeline.retrieval import Retrieval
+from pipeline.utils.file_utils import FileUtils
 
 
 class MdRAG(Retrieval):
@@ -39,11 +39,9 @@ class MdRAG(Retrieval):
             raise ValueError(f"Invalid path: {self.path}. No such file or directory.")
 
         if os.path.isdir(self.path):
-            for root, _, files in os.walk(self.path):
-                for file in files:
-                    if file.endswith(".md"):
-                        loader = UnstructuredMarkdownLoader(os.path.join(root, file))
-                        self.documents.extend(loader.load_and_split())
+            for file_path in FileUtils.walk_files(self.path, ".md"):
+                loader = UnstructuredMarkdownLoader(file_path)
+                self.documents.extend(loader.load_and_split())
         else:
             loader = UnstructuredMarkdownLoader(self.path)
             self.documents = loader.load_and_split()
@@ -55,6 +53,5 @@ class MdRAG(Retrieval):
         """
         Splits the documents into chunks and sets up the vector store.
         """
-        markdown_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-        all_chunks = self.split_data(markdown_splitter, self.documents)
-        self.setup_vector_store(all_chunks)
+        all_chunks = self.split_documents(chunk_size=2000, chunk_overlap=200)
+        self.store_chunks(all_chunks)
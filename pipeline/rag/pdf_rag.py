@@ -4,8 +4,8 @@ The user can load PDF documents from a local directory
 # file: pipeline/pdf_rag.py
 import os
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pipeline.retrieval import Retrieval
+from pipeline.utils.file_utils import FileUtils
 
 class PdfRAG(Retrieval):
     """
@@ -35,15 +35,13 @@ class PdfRAG(Retrieval):
             raise ValueError(f"Invalid path: {self.path}. No such file or directory.")
 
         if os.path.isdir(self.path):
-            for root, _, files in os.walk(self.path):
-                for file in files:
-                    if file.endswith(".pdf"):
-                        loader = PyPDFLoader(
-                            os.path.join(root, file),
-                            extract_images=self.extract_images,
-                            headers=self.headers,
-                        )
-                        self.documents.extend(loader.load_and_split())
+            for file_path in FileUtils.walk_files(self.path, ".pdf"):
+                loader = PyPDFLoader(
+                    file_path,
+                    extract_images=self.extract_images,
+                    headers=self.headers,
+                )
+                self.documents.extend(loader.load_and_split())
         else:
             loader = PyPDFLoader(
                 self.path,
@@ -58,6 +56,5 @@ class PdfRAG(Retrieval):
 
     def split_and_store_documents(self):
         """Splits the documents into chunks and sets up the vector store."""
-        pdf_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-        all_chunks = self.split_data(pdf_splitter, self.documents)
-        self.setup_vector_store(all_chunks)
+        all_chunks = self.split_documents(chunk_size=2000, chunk_overlap=200)
+        self.store_chunks(all_chunks)
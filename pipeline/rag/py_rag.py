@@ -5,12 +5,44 @@ This module contains the PythonRAG class.
 The user can load Python code from a local directory or a git repository
 and set up a RAG pipeline.
 """
+import multiprocessing
 import os
-from git import Repo
-from langchain_community.document_loaders.generic import GenericLoader
+import time
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_community.document_loaders.blob_loaders import Blob
 from langchain_community.document_loaders.parsers import LanguageParser
-from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_text_splitters import Language
+from openai import APIConnectionError
+from pipeline.pipeline import LLMConnectionError, PipelineError
 from pipeline.retrieval import Retrieval
+from pipeline.utils.file_utils import FileUtils
+from pipeline.utils.repo_cache import RepositoryCache
+from pipeline.utils.symbol_index import SymbolIndex
+
+_PARSER = None
+
+
+def parse_python_file(file_path: str, module: str) -> tuple:
+    """
+    Parses a Python file into documents and symbols. Runs in the worker processes of PyRAG.
+    params: file_path: The path to the file.
+    params: module: The module name of the file.
+    returns: A tuple of (file_path, documents, symbols, parse time in seconds).
+    """
+    global _PARSER  # pylint: disable=global-statement
+    if _PARSER is None:
+        _PARSER = LanguageParser(language=Language.PYTHON, parser_threshold=500)
+
+    started = time.perf_counter()
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+        source = file.read()
+    documents = list(_PARSER.lazy_parse(Blob.from_data(source, path=file_path)))
+    symbols = SymbolIndex.parse(file_path, module, source)
+    return file_path, documents, symbols, time.perf_counter() - started
+
 
 class PyRAG(Retrieval):
     """
@@ -32,15 +64,40 @@ class PyRAG(Retrieval):
             self.exclude = [self.exclude]
 
         self.documents = []
+        self.repository = None
+        self.commit = None
+        self.symbol_index = None
+        self.symbol_chain = None
+        self.structured_symbol_chains = {}
+        self.parse_executor = None
+        self.max_symbol_matches = kwargs.get('max_symbol_matches', 5)
 
         if self.git_url:
             self.clone_repository()
 
-        self.load_documents()
-        self.split_and_store_documents()
+        self.symbol_index = SymbolIndex(self.path if os.path.isdir(self.path or "") else None)
+        try:
+            if not self.update_index():
+                if self.parse_executor is None and self.needs_parse_pool():
+                    self.parse_executor = self.start_parse_pool()
+                self.clear_persisted_collection()
+                self.load_documents()
+                if self.documents or not self.vector_store:
+                    self.split_and_store_documents()
+        finally:
+            if self.parse_executor:
+                self.parse_executor.shutdown()
+                self.parse_executor = None
+        self.save_symbol_index()
+
+        if self.repository and self.collection_name:
+            self.repository.mark_indexed(self.collection_name, self.commit)
 
     def clone_repository(self):
-        """Clones the git repository to the specified path."""
+        """
+        Clones the git repository to the specified path, or updates an earlier clone.
+        Clones are shallow, later runs only fetch the new commits.
+        """
         if not self.git_url or not self.path:
             raise ValueError("Both git_url and path to clone the repo to must be provided.")
 
@@ -49,8 +106,8 @@ class PyRAG(Retrieval):
             raise ValueError(f"Invalid git_url: {self.git_url}")
 
         try:
-            Repo.clone_from(self.git_url, to_path=self.path)
-            self.logger.info("Repository cloned from %s to %s", self.git_url, self.path)
+            self.repository = RepositoryCache(self.path, self.git_url, depth=self._kwargs.get('clone_depth', 1))
+            self.commit = self.repository.sync()
         except Exception as e:
             self.logger.error("Failed to clone repository: %s", e)
             raise
@@ -62,26 +119,291 @@ class PyRAG(Retrieval):
         return git_url.startswith("https://") or git_url.startswith("git@")
 
 
+    def update_index(self) -> bool:
+        """
+        Re-indexes only the files changed since the last indexed commit.
+        Chunks of changed and deleted files are removed from the persisted vector store,
+        then the changed files are parsed and stored again, in the parse pool only if there
+        are enough of them, see needs_parse_pool.
+        Needs a cloned repository, a collection_name and a persist_directory.
+        returns: True if the index was updated, False if a full index is needed.
+        """
+        if not self.repository or not self.collection_name or not self._kwargs.get('persist_directory'):
+            return False
+
+        changes = self.repository.changed_files(
+            self.repository.last_indexed(self.collection_name),
+            self.commit
+        )
+        symbol_index_path = self.symbol_index_path()
+        if changes is None or not os.path.isfile(symbol_index_path):
+            return False
+
+        # The workers are started before the vector store is opened, see start_parse_pool
+        indexable = set(self._python_files())
+        changed_files = [file_path for file_path in changes["changed"] if file_path in indexable]
+        if self.needs_parse_pool(changed_files):
+            self.parse_executor = self.start_parse_pool()
+        if not self.load_vector_store():
+            return False
+
+        self.symbol_index = SymbolIndex.load(symbol_index_path)
+        stale = changes["changed"] + changes["deleted"]
+        if stale:
+            self.vector_store.delete(where={"source": {"$in": stale}})
+        for file_path in stale:
+            self.symbol_index.remove_file(file_path)
+
+        self.load_files(changed_files)
+        if self.documents:
+            self.split_and_store_documents()
+
+        self.logger.info(
+            "Index %s updated to %s: %s files re-indexed, %s removed.",
+            self.collection_name,
+            self.commit[:12],
+            len(changed_files),
+            len(changes["deleted"])
+        )
+        return True
+
+
+    def clear_persisted_collection(self) -> None:
+        """
+        Deletes the chunks of an earlier index from the persisted collection before a full index,
+        so the chunks of every file are not stored a second time under new ids.
+        """
+        if not self.load_vector_store():
+            return
+        self.logger.info("Clearing collection %s for a full re-index.", self.collection_name)
+        self.vector_store.delete_collection()
+        self.vector_store = None
+        self.metadata_index = {}
+
+
+    def _python_files(self):
+        """Yields the Python files of the path that are not excluded."""
+        return FileUtils.walk_files(self.path, ".py", exclude=self.exclude or None, use_gitignore=True)
+
+
+    def needs_parse_pool(self, file_paths=None) -> bool:
+        """
+        Whether the files are worth parsing in worker processes. Starting the workers costs
+        more than parsing a few files, so only more than 'parse_pool_threshold' Python files
+        (default: 32) are parsed in a pool. Only that many files of the directory are walked.
+        params: file_paths: The files to parse, e.g. the changed files of an update.
+                            Defaults to the Python files of the path.
+        returns: True if start_parse_pool should be called.
+        """
+        threshold = self._kwargs.get('parse_pool_threshold', 32)
+        if file_paths is not None:
+            return len(file_paths) > threshold
+        if not os.path.isdir(self.path or ""):
+            return False
+        return next(islice(self._python_files(), threshold, None), None) is not None
+
+
+    def start_parse_pool(self):
+        """
+        Starts the worker processes parsing the files, see load_files.
+        Workers are forked only where fork is the platform's default start method, and they are
+        started before the vector store and the embedding model start their threads.
+        returns: The ProcessPoolExecutor, or None if 'parse_workers' is 1.
+        """
+        workers = self._kwargs.get('parse_workers') or os.cpu_count() or 1
+        if workers <= 1:
+            return None
+
+        # Spawned workers import the package again, config skips the passphrase prompt in them
+        method = "fork" if multiprocessing.get_start_method() == "fork" else "spawn"
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        # The first task starts the forked workers
+        executor.submit(os.getpid).result()
+        return executor
+
+
+    def load_files(self, file_paths) -> None:
+        """
+        Parses Python files into documents and adds their symbols to the symbol index.
+        Files are parsed in the 'parse_workers' processes (default: one per CPU) of the pool
+        started by start_parse_pool, or in this process if no pool was started, see
+        needs_parse_pool. The results are handled as they finish. Once 'parse_batch_size'
+        documents are loaded, they are split and stored while the remaining files are still parsed.
+        params: file_paths: The paths of the files.
+        """
+        workers = (self._kwargs.get('parse_workers') or os.cpu_count() or 1) if self.parse_executor else 1
+        batch_size = self._kwargs.get('parse_batch_size') or 1000
+
+        started = time.perf_counter()
+        files = documents = 0
+        parse_time = 0.0
+        for file_path, file_documents, symbols, elapsed in self._parse_files(file_paths, workers):
+            self.documents.extend(file_documents)
+            self.symbol_index.add_symbols(file_path, symbols)
+            files += 1
+            documents += len(file_documents)
+            parse_time += elapsed
+
+            if len(self.documents) >= batch_size:
+                self.split_and_store_documents()
+                self.documents = []
+
+        wall_time = time.perf_counter() - started
+        self.logger.info(
+            "Parsed %s files into %s documents in %.2fs with %s workers"
+            " (%.1f files/s, %.1f ms parse time per file).",
+            files,
+            documents,
+            wall_time,
+            workers,
+            files / wall_time if wall_time else 0.0,
+            1000 * parse_time / files if files else 0.0
+        )
+
+
+    def _parse_files(self, file_paths, workers: int):
+        """
+        Parses files in the process pool and yields the results as they finish.
+        At most a few files per worker are queued, so the file walk is consumed lazily.
+        params: file_paths: The paths of the files.
+        params: workers: The number of worker processes. 1 parses in this process.
+        """
+        tasks = ((file_path, self.symbol_index.module_name(file_path)) for file_path in file_paths)
+
+        if workers <= 1 or self.parse_executor is None:
+            for task in tasks:
+                yield parse_python_file(*task)
+            return
+
+        pending = set()
+        for task in tasks:
+            pending.add(self.parse_executor.submit(parse_python_file, *task))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+    def symbol_index_path(self) -> str:
+        """
+        The path of the persisted symbol index, next to the persisted vector store.
+        returns: The path, or None if the vector store is not persisted.
+        """
+        persist_directory = self._kwargs.get('persist_directory')
+        if not persist_directory or not self.collection_name:
+            return None
+        return os.path.join(persist_directory, f"{self.collection_name}.symbols.json")
+
+
+    def save_symbol_index(self) -> None:
+        """Persists the symbol index with the vector store, so incremental updates can extend it."""
+        symbol_index_path = self.symbol_index_path()
+        if symbol_index_path:
+            os.makedirs(os.path.dirname(symbol_index_path), exist_ok=True)
+            self.symbol_index.save(symbol_index_path)
+
+
+    def lookup_symbol(self, name: str) -> list:
+        """
+        Looks up a module, class, function or method by name.
+        params: name: The name or qualified name, e.g. 'Pipeline.modify_chat_history'.
+        returns: A list of documents holding the exact source span of every match.
+        """
+        return [self._symbol_document(symbol) for symbol in self.symbol_index.lookup(name)]
+
+
+    @staticmethod
+    def _symbol_document(symbol: dict) -> Document:
+        """Creates a document from the source span of a symbol."""
+        return Document(
+            page_content=SymbolIndex.source(symbol),
+            metadata={
+                "source": symbol["file"],
+                "symbol": f"{symbol['module']}.{symbol['qualname']}" if symbol["kind"] != "module" else symbol["module"],
+                "kind": symbol["kind"],
+                "start_line": symbol["start"],
+                "end_line": symbol["end"],
+                "calls": ";".join(symbol["calls"])
+            }
+        )
+
+
+    def invoke(self, prompt, session_id=None, structured=False, configurable=None, *, metadata_filter=None) -> str:
+        """
+        Invokes the chatbot with the specified query.
+        A question naming known symbols in backticks, by qualified name or by a name that is not
+        an ordinary word is answered from their source spans directly, without the query rewrite
+        and the vector search. See SymbolIndex.find_in_text.
+        params: prompt: The prompt to use.
+        params: session_id: The session whose history is used, see Retrieval.invoke.
+        params: structured: Answer in the provider's JSON mode or to a JSON schema, see invoke_structured.
+        params: configurable: Configurable fields of the retrieval chain, see Retrieval.invoke.
+        params: metadata_filter: Optional filter on the chunk metadata, see Retrieval.invoke.
+        returns: The answer from the chatbot.
+        """
+        if not isinstance(prompt, str):
+            raise ValueError("prompt must be a string")
+
+        symbols = self.symbol_index.find_in_text(prompt) if self.symbol_index else []
+        if not symbols or len(symbols) > self.max_symbol_matches:
+            return super().invoke(
+                prompt, session_id, structured, configurable, metadata_filter=metadata_filter
+            )
+
+        # The filter does not apply to symbols but is kept for the following queries
+        if metadata_filter is not None:
+            if metadata_filter:
+                self.build_metadata_filter(metadata_filter)
+            self.set_session_filter(session_id, metadata_filter)
+
+        self.logger.info(
+            "Answering from the source of %s.",
+            ", ".join(f"{symbol['module']}:{symbol['qualname']}" for symbol in symbols)
+        )
+        sanitized_prompt = self.sanitize_input(prompt)
+        chat_history = self.get_session_history(session_id)
+        if structured:
+            key = self.structured_key(structured)
+            if key not in self.structured_symbol_chains:
+                self.structured_symbol_chains[key] = create_stuff_documents_chain(
+                    self.json_mode_chat(self.structured_schema(structured)), self.chat_prompt
+                )
+            chain = self.structured_symbol_chains[key]
+        else:
+            if self.symbol_chain is None:
+                self.symbol_chain = create_stuff_documents_chain(self.chat, self.chat_prompt)
+            chain = self.symbol_chain
+
+        try:
+            answer = chain.invoke({
+                "input": sanitized_prompt,
+                "context": [self._symbol_document(symbol) for symbol in symbols],
+                "chat_history": chat_history.messages
+            })
+        except APIConnectionError as e:
+            raise LLMConnectionError(f"Failed to connect to LLM: {e}") from e
+        except Exception as e:
+            raise PipelineError(f"Error invoking chatbot: {e}") from e
+
+        chat_history.add_user_message(sanitized_prompt)
+        chat_history.add_ai_message(answer)
+        return answer
+
+
     def _load_documents(self):
         """Loads Python documents from the filesystem."""
         if not os.path.exists(self.path):
             raise ValueError(f"Invalid path: {self.path}. No such file or directory.")
 
-        loader = GenericLoader.from_filesystem(
-                path=self.path,
-                glob="**/*",
-                suffixes=[".py"],
-                exclude=self.exclude,
-                parser=LanguageParser(language=Language.PYTHON, parser_threshold=500),
-            )
-        self.documents = loader.load()
+        self.load_files(self._python_files())
         self.logger.info("Loaded %s documents.", len(self.documents))
 
 
     def split_and_store_documents(self):
         """Splits the documents into chunks and sets up the vector store."""
-        python_splitter = RecursiveCharacterTextSplitter.from_language(
-            language=Language.PYTHON, chunk_size=2000, chunk_overlap=200
+        all_chunks = self.split_documents(
+            chunk_size=2000, chunk_overlap=200, language=Language.PYTHON
         )
-        all_chunks = self.split_data(python_splitter, self.documents)
-        self.setup_vector_store(all_chunks)
+        self.store_chunks(all_chunks)
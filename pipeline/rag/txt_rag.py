@@ -6,10 +6,10 @@ This module contains the TextRAG class.
 """
 import json
 import os
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import TextLoader
 from pipeline.retrieval import Retrieval
 from pipeline.utils.chatbot_utils import ChatbotUtils
+from pipeline.utils.file_utils import FileUtils
 
 
 class TxtRAG(Retrieval):
@@ -37,8 +37,8 @@ class TxtRAG(Retrieval):
     def _load_documents(self):
         """Loads text documents from the filesystem."""
         if os.path.isdir(self.path):
-            loader = DirectoryLoader(self.path, glob="**/*.txt", loader_cls=TextLoader)
-            self.documents = loader.load()
+            for file_path in FileUtils.walk_files(self.path, ".txt"):
+                self.documents.extend(TextLoader(file_path).load())
         elif os.path.isfile(self.path) and self.path.endswith(".txt"):
             loader = TextLoader(self.path)
             self.documents = loader.load()
@@ -68,6 +68,5 @@ class TxtRAG(Retrieval):
     def split_and_store_documents(self):
         """Splits the documents into chunks and sets up the vector store."""
         self.logger.info("Splitting and storing documents in the local vector database...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=0)
-        all_chunks = self.split_data(text_splitter, self.documents)
-        self.setup_vector_store(all_chunks)
+        all_chunks = self.split_documents(chunk_size=2000, chunk_overlap=0)
+        self.store_chunks(all_chunks)
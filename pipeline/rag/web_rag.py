@@ -6,9 +6,14 @@ This module contains the WebRAG class, which is a pipeline for a chatbot that re
 documents from a website and answers questions based on the retrieved documents.
 """
 
-from langchain_community.document_loaders import WebBaseLoader
+import html
+import re
+from langchain_core.documents import Document
+from pipeline.config import DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
 from pipeline.retrieval import Retrieval
 from pipeline.utils.chatbot_utils import ChatbotUtils
+from pipeline.utils.html_extractor import HtmlTextExtractor
+from pipeline.utils.web_crawler import WebCrawler
 
 class WebRAG(Retrieval):
     """
@@ -16,11 +21,18 @@ class WebRAG(Retrieval):
     answers questions based on the retrieved documents.
     """
 
+    TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+    CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
     def __init__(self, **kwargs):
         """
         Initializes the WebRAG object.
         params: base_url: The base URL of the Ollama server.
         params: model: The name of the model to use.
+        params: crawl_depth: If set, the site is crawled this many links deep from the URL.
+        params: max_pages: The maximum number of pages crawled.
+        params: allowed_domains: The domains the crawler may follow links to.
+        params: crawl_delay: The minimum number of seconds between two requests to one host.
         """
         super().__init__(**kwargs)
 
@@ -31,9 +43,10 @@ class WebRAG(Retrieval):
 
         try:
             self.load_documents()
-            text_splitter = self.recursive_character_text_splitter()
-            all_chunks = self.split_data(text_splitter, self.documents)
-            self.setup_vector_store(all_chunks)
+            all_chunks = self.split_documents(
+                chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP
+            )
+            self.store_chunks(all_chunks)
         except Exception as e:
             self.logger.exception("Error initializing WebRAG: %s", e)
             raise
@@ -44,8 +57,78 @@ class WebRAG(Retrieval):
         params: url: The URL to load the data from.
         """
         try:
-            loader = WebBaseLoader(self.url)
-            self.documents = loader.load()
+            self.documents = self.crawl()
         except Exception as e:
-            self.logger.exception("Error loading data from URL %s: %s", url=self.url, e=e)
+            self.logger.exception("Error loading data from URL %s: %s", self.url, e)
             raise
+
+
+    def crawl(self) -> list:
+        """
+        Crawls the site from the URL and extracts the main text of the HTML pages.
+        Inside a running event loop, await acrawl instead.
+        returns: The documents, see acrawl.
+        """
+        return WebCrawler.run(self.acrawl())
+
+
+    async def acrawl(self) -> list:
+        """
+        Crawls the site from the URL and extracts the main text of the HTML pages.
+        Other text and JSON pages are kept as their decoded text, other content is skipped.
+        Without crawl_depth only the URL itself is loaded, through the crawler with depth 0,
+        so single pages use the same cache and text extraction as crawled sites.
+        returns: The documents.
+        """
+        allowed_domains = self._kwargs.get('allowed_domains')
+        if isinstance(allowed_domains, str):
+            allowed_domains = [domain for domain in allowed_domains.split(",") if domain]
+
+        crawler = WebCrawler(
+            max_depth=self._kwargs.get('crawl_depth') or 0,
+            max_pages=self._kwargs.get('max_pages') or 100,
+            allowed_domains=allowed_domains,
+            delay=self._kwargs.get('crawl_delay') or 0.0
+        )
+
+        extractor = HtmlTextExtractor()
+        documents = []
+        for page in await crawler.crawl_async(self.url):
+            content_type = (page["content_type"] or "text/html").lower()
+            metadata = {"source": page["url"], "depth": page["depth"]}
+            if "html" in content_type:
+                title = self.TITLE_PATTERN.search(page["body"])
+                if title:
+                    metadata["title"] = html.unescape(title.group(1).decode("utf-8", "replace").strip())
+                text = extractor.extract(page["url"], page["body"])
+            elif content_type.startswith("text/") or "json" in content_type:
+                text = self.decode_body(page["body"], content_type).strip()
+            else:
+                continue
+            if text:
+                documents.append(Document(page_content=text, metadata=metadata))
+
+        stats = extractor.stats
+        self.logger.info(
+            "Loaded %s documents from %s, boilerplate removal kept %s of %s bytes.",
+            len(documents),
+            self.url,
+            stats["text_size"],
+            stats["original_size"]
+        )
+        return documents
+
+
+    @classmethod
+    def decode_body(cls, body: bytes, content_type: str) -> str:
+        """
+        Decodes a page with the charset of its Content-Type header.
+        params: body: The content.
+        params: content_type: The Content-Type header.
+        returns: The text, UTF-8 if the charset is missing or unknown.
+        """
+        charset = cls.CHARSET_PATTERN.search(content_type or "")
+        try:
+            return body.decode(charset.group(1) if charset else "utf-8", "replace")
+        except LookupError:
+            return body.decode("utf-8", "replace")
@@ -5,20 +5,47 @@ author: Babak Bandpey
 This Python code is part of a class named Retrieval.
 """
 
-import os
+import json
 import sys
+import uuid
 from abc import abstractmethod
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import MessagesPlaceholder, ChatPromptTemplate
+from langchain_core.runnables import ConfigurableField
 from .pipeline import Pipeline
+from .config import APPROX_CHARS_PER_TOKEN
 from .utils.file_utils import FileUtils
+from .utils.token_utils import TokenCounter
+from .utils.dedup_utils import MinHashDeduplicator
+from .utils.encoding_audit import EncodingAudit
 
 class Retrieval(Pipeline):
     """
     Pipeline for a chatbot that retrieves documents and answers questions
     based on the retrieved documents.
     """
+    def __init__(self, **kwargs):
+        """
+        Initializes the Retrieval object.
+        params: kwargs: Dictionary containing configuration parameters.
+                        dedup_threshold: If set, near-duplicate chunks above this
+                        estimated similarity are dropped before embedding.
+                        metadata_filter: A filter on the chunk metadata applied
+                        before the similarity search, e.g. {"year": {"$gte": 2023}}.
+                        It is the default of every session, see invoke.
+        """
+        super().__init__(**kwargs)
+        self.chunk_stats = None
+        self.metadata_index = {}
+        self.metadata_filter = kwargs.get('metadata_filter')
+        self.session_filters = {}
+        self.search_kwargs = {"k": 50, "fetch_k": 50}
+        self.deduplicator = None
+        if kwargs.get('dedup_threshold'):
+            self.deduplicator = MinHashDeduplicator(threshold=kwargs.get('dedup_threshold'))
+
+
     def setup_chat_prompt(self, system_prompt_template=None, output_type=None):
         """
         Sets up the prompt for the chatbot.
@@ -49,14 +76,20 @@ class Retrieval(Pipeline):
         super().setup_chat_prompt(system_prompt_template, output_type)
 
 
-    def setup_chain(self, search_type=None, search_kwargs=None):
+    def setup_chain(self, chat=None, search_type=None, search_kwargs=None, metadata_filter=None):
         '''
         Set up the chatbot pipeline chain.
 
         This method creates a chain of processing steps for the chatbot pipeline.
 
+        params: chat: The chat model writing the answer. Defaults to self.chat.
+                      The search query is always written by self.chat.
         params: search_type: The type of search to use.
-        params: search_kwargs: The keyword arguments for the search.
+        params: search_kwargs: The keyword arguments for the search. Defaults to self.search_kwargs.
+        params: metadata_filter: A filter on the chunk metadata that narrows the candidates
+                                 before the similarity search. Defaults to self.metadata_filter.
+                                 The search_kwargs of the retriever, and so the filter, can be
+                                 replaced per call through the "search_kwargs" configurable field.
 
         Returns:
             The retrieval chain for the retrieval chatbot pipeline.
@@ -71,11 +104,20 @@ class Retrieval(Pipeline):
             )
 
         if search_kwargs is None:
-            search_kwargs = {"k": 50, "fetch_k": 50}
+            search_kwargs = self.search_kwargs
         elif not isinstance(search_kwargs, dict):
             raise ValueError("search_kwargs must be a dictionary")
-        elif not all(isinstance(v, int) and v > 0 for v in search_kwargs.values()):
-            raise ValueError("All values in search_kwargs must be positive integers")
+        elif not all(
+            isinstance(search_kwargs[key], int) and search_kwargs[key] > 0
+            for key in ("k", "fetch_k") if key in search_kwargs
+        ):
+            raise ValueError("k and fetch_k in search_kwargs must be positive integers")
+        self.search_kwargs = search_kwargs
+
+        if metadata_filter is None:
+            metadata_filter = self.metadata_filter
+        if metadata_filter:
+            search_kwargs = {**search_kwargs, "filter": self.build_metadata_filter(metadata_filter)}
 
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -94,11 +136,13 @@ class Retrieval(Pipeline):
         retriever = self.vector_store.as_retriever(
             search_type=search_type,
             search_kwargs=search_kwargs
+        ).configurable_fields(
+            search_kwargs=ConfigurableField(id="search_kwargs", name="Search kwargs")
         )
 
         retriever_chain = create_history_aware_retriever(self.chat, retriever, prompt)
 
-        doc_combination_chain = create_stuff_documents_chain(self.chat, self.chat_prompt)
+        doc_combination_chain = create_stuff_documents_chain(chat or self.chat, self.chat_prompt)
         return create_retrieval_chain(
             retriever_chain,
             doc_combination_chain
@@ -120,6 +164,168 @@ class Retrieval(Pipeline):
             self.logger.error("PermissionError occurred: %s", e)
 
 
+    def split_documents(self, chunk_size=2000, chunk_overlap=0, language=None) -> list:
+        """
+        Splits the loaded documents into chunks and reports the chunk size distribution.
+        The 'chunk_size', 'chunk_overlap' and 'tokenizer' kwargs override the defaults of the RAG.
+        With a tokenizer, the character defaults are converted to tokens.
+        Without an explicit 'chunk_overlap', the default overlap is scaled to the chunk size
+        and kept below it.
+        params: chunk_size: The default chunk size in characters.
+        params: chunk_overlap: The default chunk overlap in characters.
+        params: language: Optional language whose separators are used for splitting.
+        returns: The chunks.
+        """
+        tokenizer = self._kwargs.get('tokenizer')
+        counter = TokenCounter(tokenizer) if tokenizer else None
+        if tokenizer:
+            chunk_size //= APPROX_CHARS_PER_TOKEN
+            chunk_overlap //= APPROX_CHARS_PER_TOKEN
+
+        default_size = max(chunk_size, 1)
+        chunk_size = self._kwargs.get('chunk_size') or chunk_size
+        if self._kwargs.get('chunk_overlap') is not None:
+            chunk_overlap = self._kwargs.get('chunk_overlap')
+        else:
+            chunk_overlap = max(min(chunk_overlap * chunk_size // default_size, chunk_size - 1), 0)
+
+        text_splitter = self.recursive_character_text_splitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            tokenizer=counter,
+            language=language
+        )
+        all_chunks = self.split_data(text_splitter, self.documents)
+
+        length_function = counter.count if counter else len
+        self.chunk_stats = TokenCounter.describe(
+            [length_function(chunk.page_content) for chunk in all_chunks]
+        )
+        self.logger.info(
+            "Chunk sizes in %s: %s",
+            "tokens" if tokenizer else "characters",
+            self.chunk_stats
+        )
+        return all_chunks
+
+
+    def store_chunks(self, all_chunks: list) -> None:
+        """
+        Stores the chunks in the vector store, creating it on the first call.
+        Near-duplicate chunks are dropped first when deduplication is enabled. Chunks stored
+        by earlier calls that are duplicated in this call are updated with their new provenance.
+        params: all_chunks: The chunks to store.
+        """
+        updated = []
+        if self.deduplicator:
+            all_chunks = self.deduplicator.deduplicate(all_chunks)
+            updated = [chunk for chunk in self.deduplicator.updated if chunk.id]
+
+        for chunk in all_chunks:
+            chunk.id = chunk.id or str(uuid.uuid4())
+
+        if updated and self.vector_store:
+            self.vector_store.delete(ids=[chunk.id for chunk in updated])
+            self.vector_store.add_documents(updated)
+
+        if not all_chunks:
+            self.logger.warning("No chunks to store in the vector store.")
+            return
+
+        self.index_metadata(all_chunks)
+
+        if not self.vector_store:
+            self.setup_vector_store(all_chunks)
+        else:
+            self.vector_store.add_documents(all_chunks)
+
+
+    def index_metadata(self, chunks: list) -> None:
+        """
+        Makes the metadata of the chunks filterable and records the values of every field.
+        Vector stores only filter on scalar values, so lists are joined with ';',
+        dictionaries are stored as JSON and empty values are dropped.
+        params: chunks: The chunks about to be stored.
+        """
+        for chunk in chunks:
+            metadata = {}
+            for field, value in chunk.metadata.items():
+                if value is None:
+                    continue
+                if isinstance(value, (list, tuple, set)):
+                    value = ";".join(str(item) for item in value)
+                elif isinstance(value, dict):
+                    value = json.dumps(value, sort_keys=True)
+                metadata[field] = value
+                self.metadata_index.setdefault(field, set()).add(value)
+            chunk.metadata = metadata
+
+        self.logger.info(
+            "Metadata index: %s",
+            {field: len(values) for field, values in self.metadata_index.items()}
+        )
+
+
+    def load_vector_store(self) -> bool:
+        """
+        Opens the persisted collection and rebuilds the metadata index from its chunks,
+        so filters on a loaded collection are checked like on a new one.
+        returns: True if the collection exists and contains documents.
+        """
+        if not super().load_vector_store():
+            return False
+        self.metadata_index = {}
+        for metadata in self.vector_store.get(include=["metadatas"])["metadatas"]:
+            for field, value in (metadata or {}).items():
+                self.metadata_index.setdefault(field, set()).add(value)
+        self.logger.info(
+            "Metadata index: %s",
+            {field: len(values) for field, values in self.metadata_index.items()}
+        )
+        return True
+
+
+    _FILTER_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+
+    def build_metadata_filter(self, metadata_filter: dict) -> dict:
+        """
+        Converts a metadata filter into the vector store's filter expression.
+        Several fields are combined with '$and', e.g.
+        {"policy": "Log Management", "year": {"$gte": 2023}} becomes
+        {"$and": [{"policy": "Log Management"}, {"year": {"$gte": 2023}}]}.
+        params: metadata_filter: A dictionary of field to value or {operator: value}.
+                                 '$and' and '$or' lists are passed through.
+        returns: The filter expression.
+        """
+        if not isinstance(metadata_filter, dict) or not metadata_filter:
+            raise ValueError("metadata_filter must be a non-empty dictionary")
+
+        conditions = []
+        for field, condition in metadata_filter.items():
+            if field in ("$and", "$or"):
+                if not isinstance(condition, list) or not condition:
+                    raise ValueError(f"{field} in metadata_filter must be a non-empty list")
+                conditions.append({field: [self.build_metadata_filter(item) for item in condition]})
+                continue
+
+            if isinstance(condition, dict):
+                for operator in condition:
+                    if operator not in self._FILTER_OPERATORS:
+                        raise ValueError(
+                            f"Invalid operator {operator} for {field} in metadata_filter."
+                            f" Must be one of {self._FILTER_OPERATORS}."
+                        )
+
+            if self.metadata_index and field not in self.metadata_index:
+                self.logger.warning(
+                    "Metadata field '%s' is not in the index, the filter matches no chunks.",
+                    field
+                )
+            conditions.append({field: condition})
+
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
     @abstractmethod
     def _load_documents(self):
         """
@@ -128,50 +334,105 @@ class Retrieval(Pipeline):
         """
 
 
-    def invoke(self, prompt) -> str:
+    def invoke(self, prompt, session_id=None, structured=False, configurable=None, *, metadata_filter=None) -> str:
         """
         Invokes the chatbot with the specified query.
         params: prompt: The prompt to use.
+        params: session_id: The session whose history is used. Sessions share the vector store,
+                            so one instance can answer concurrent conversations.
+        params: structured: Answer in the provider's JSON mode or to a JSON schema, see invoke_structured.
+        params: configurable: Configurable fields of the chain set for this call only.
+                              The search_kwargs field is set from the session's filter.
+        params: metadata_filter: Optional filter on the chunk metadata for this and the
+                                 following queries of the session, see build_metadata_filter.
+                                 None keeps the session's filter and {} clears it.
         returns: The answer from the chatbot.
         """
         if not isinstance(prompt, str):
             raise ValueError("prompt must be a string")
 
+        if metadata_filter is not None:
+            if metadata_filter:
+                self.build_metadata_filter(metadata_filter)
+            self.set_session_filter(session_id, metadata_filter)
+
+        # The filter is passed with the call, so sessions with different filters share the chain
+        session_filter = self.get_session_filter(session_id)
+        search_kwargs = dict(self.search_kwargs)
+        if session_filter:
+            search_kwargs["filter"] = self.build_metadata_filter(session_filter)
+
         sanitized_prompt = self.sanitize_input(prompt)
-        self.chat_history.add_user_message(sanitized_prompt)
+        chat_history = self.get_session_history(session_id)
+        chat_history.add_user_message(sanitized_prompt)
 
-        response = super().invoke(sanitized_prompt)
+        response = super().invoke(
+            sanitized_prompt, session_id, structured,
+            configurable={**(configurable or {}), "search_kwargs": search_kwargs}
+        )
         answer = response.get("answer", "No answer found")
 
-        self.chat_history.add_ai_message(answer)
+        chat_history.add_ai_message(answer)
         return answer
 
 
+    def get_session_filter(self, session_id: str = None) -> dict:
+        """
+        Gets the metadata filter of a session.
+        params: session_id: The session ID. The default session uses metadata_filter.
+        returns: The filter, the metadata_filter kwarg if the session has not set one.
+        """
+        if session_id is None or session_id == self.session_id:
+            return self.metadata_filter
+        with self._session_lock:
+            return self.session_filters.get(session_id, self.metadata_filter)
+
+
+    def set_session_filter(self, session_id: str, metadata_filter: dict) -> None:
+        """
+        Sets the metadata filter of a session.
+        params: session_id: The session ID. The default session uses metadata_filter.
+        params: metadata_filter: The filter, or {} to search all chunks.
+        """
+        if session_id is None or session_id == self.session_id:
+            self.metadata_filter = metadata_filter or None
+            return
+        with self._session_lock:
+            self.session_filters[session_id] = metadata_filter
+
+
+    def clear_session(self, session_id: str) -> None:
+        """
+        Forgets the chat history and the metadata filter of a session.
+        params: session_id: The session ID.
+        """
+        super().clear_session(session_id)
+        with self._session_lock:
+            self.session_filters.pop(session_id, None)
+
+
     def check_for_non_ascii_bytes(self):
         """
-        Checks for non-ASCII bytes in a text file or directory.
-        If non-ASCII bytes are found, the user is prompted to clean the file.
-        """
-        def detect_and_clean(file_path):
-            self.logger.info("Checking file: %s for non-ASCII bytes...", file_path)
-            non_ascii_positions = FileUtils.find_non_ascii_bytes(file_path)
-            if non_ascii_positions:
-                self.logger.warning("Non-ASCII bytes found in file: %s", file_path)
-                self.logger.warning(non_ascii_positions)
-                if self.auto_clean:
-                    FileUtils.clean_non_ascii_positions(file_path, non_ascii_positions)
-                else:
-                    raise ValueError(
-                        f"Non-ASCII bytes found in file: {file_path}."
-                         "Please clean the file manually."
-                    )
+        Checks for non-ASCII bytes in a text file or recursively in a directory.
+        Files known to be clean from earlier runs are skipped.
+        If non-ASCII bytes are found, the files are cleaned when auto_clean is set,
+        otherwise the user is asked to clean them.
+        """
+        audit = EncodingAudit(max_workers=self._kwargs.get('audit_workers'))
+        dirty_files = audit.audit(self.path)
 
-        if not os.path.exists(self.path):
-            raise ValueError(f"Invalid path: {self.path}. No such file or directory.")
-        if os.path.isdir(self.path):
-            for file in os.listdir(self.path):
-                if file.endswith(".txt") or file.endswith(".md"):
-                    file_path = os.path.join(self.path, file)
-                    detect_and_clean(file_path)
-        else:
-            detect_and_clean(self.path)
+        for file_path, non_ascii_positions in dirty_files.items():
+            self.logger.warning(
+                "Non-ASCII bytes found in file: %s (%s bytes in %s ranges)",
+                file_path,
+                sum(end - start for start, end in non_ascii_positions),
+                len(non_ascii_positions)
+            )
+            if self.auto_clean:
+                FileUtils.clean_non_ascii_positions(file_path, non_ascii_positions)
+
+        if dirty_files and not self.auto_clean:
+            raise ValueError(
+                f"Non-ASCII bytes found in files: {', '.join(dirty_files)}."
+                " Please clean the files manually."
+            )
@@ -2,6 +2,7 @@
 import json
 import re
 from typing import Union
+from .json_stream import JsonObjectScanner
 from .logger import logger
 
 class ChatbotUtils:
@@ -40,72 +41,49 @@ class ChatbotUtils:
             return None
 
 
+    @staticmethod
+    def has_commands(json_data) -> bool:
+        """
+        Checks if a JSON object has a 'commands' list with at least one 'command'.
+        """
+        commands = json_data.get('commands')
+        return isinstance(commands, list) and any(
+            isinstance(command, dict) and 'command' in command for command in commands
+        )
+
+
     @staticmethod
     def extract_commands_json(text):
         """
         Extracts the JSON object that contains 'commands' and 'command' keys from the given text.
 
         Args:
-        text (str): The text containing JSON data.
+        text (str or iterable): The text containing JSON data, or the chunks of a streamed response.
 
         Returns:
         dict: The extracted JSON object as a Python dictionary.
         """
-        json_pattern = re.compile(r'\{.*?\}', re.DOTALL)
-
-        # Find all matches in the text
-        matches = json_pattern.findall(text)
-        print(matches)
-        print(len(matches))
-        # Join matches to form complete JSON objects
-        json_candidates = []
-        current_json = ""
-        for match in matches:
-            current_json += match
-            try:
-                json_data = json.loads(current_json)
-                json_candidates.append(json_data)
-                current_json = ""
-            except json.JSONDecodeError:
-                # Continue appending until we get a valid JSON
-                continue
-        print(json_candidates)
-        for json_data in json_candidates:
-            # Check if the JSON object contains the specific keys
-            if 'commands' in json_data and isinstance(json_data['commands'], list):
-                for command in json_data['commands']:
-                    if 'command' in command:
-                        return json_data
-
-        raise ValueError("No JSON object with the required keys found in the response")
+        json_data = JsonObjectScanner.find(text, ChatbotUtils.has_commands)
+        if json_data is None:
+            raise ValueError("No JSON object with the required keys found in the response")
+        return json_data
 
 
     @staticmethod
     def extract_json(response):
         """
-        Extracts and returns the JSON part from the given response string.
+        Extracts and returns the first JSON object in the given response.
 
         Args:
-        response (str): The response string containing JSON data.
+        response (str or iterable): The response string containing JSON data, or the chunks of a streamed response.
 
         Returns:
         dict: The extracted JSON data as a Python dictionary.
         """
-        # Regular expression to find JSON-like content
-        json_pattern = re.compile(r'\{(?:[^{}]|(?R))*\}')
-
-        # Search for the JSON part in the response
-        match = json_pattern.search(response)
-
-        if match:
-            json_str = match.group(0)
-            try:
-                json_data = json.loads(json_str)
-                return json_data
-            except json.JSONDecodeError as exc:
-                raise ValueError("Extracted data is not valid JSON") from exc
-        else:
+        json_data = JsonObjectScanner.find(response)
+        if json_data is None:
             raise ValueError("No JSON data found in the response")
+        return json_data
 
 
     @staticmethod
@@ -0,0 +1,182 @@
+"""
+This module contains the MinHashDeduplicator class.
+It finds near-duplicate chunks with MinHash signatures and LSH banding,
+so repeated paragraphs are embedded, stored and retrieved only once.
+"""
+import random
+import re
+import zlib
+from .logger import logger
+
+
+class MinHashDeduplicator:
+    """
+    Drops near-duplicate documents and merges their provenance into the kept document.
+    The LSH index is kept between calls, so later batches are deduplicated against earlier ones.
+    """
+
+    _MERSENNE_PRIME = (1 << 61) - 1
+    _MAX_HASH = (1 << 32) - 1
+    _WORD_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        """
+        Initializes the MinHashDeduplicator.
+        params: threshold: The estimated Jaccard similarity above which documents are duplicates.
+        params: num_perm: The number of hash permutations in a signature.
+        params: shingle_size: The number of words in a shingle.
+        params: seed: The seed for the permutations.
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in the range (0, 1]")
+        if num_perm <= 0 or shingle_size <= 0:
+            raise ValueError("num_perm and shingle_size must be greater than 0")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = self.optimal_bands(threshold, num_perm)
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, self._MERSENNE_PRIME), rng.randrange(0, self._MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = []
+        self._documents = []
+        self.updated = []
+        self.stats = {"seen": 0, "dropped": 0}
+
+
+    @staticmethod
+    def optimal_bands(threshold: float, num_perm: int) -> tuple:
+        """
+        Chooses the number of bands and rows whose S-curve threshold (1/b)^(1/r)
+        is closest to the requested threshold.
+        params: threshold: The similarity threshold.
+        params: num_perm: The number of hash permutations.
+        returns: A tuple of (bands, rows).
+        """
+        best = (num_perm, 1)
+        best_error = float("inf")
+        for rows in range(1, num_perm + 1):
+            bands = num_perm // rows
+            error = abs((1 / bands) ** (1 / rows) - threshold)
+            if error < best_error:
+                best, best_error = (bands, rows), error
+        return best
+
+
+    def signature(self, text: str) -> tuple:
+        """
+        Computes the MinHash signature of the word shingles of the text.
+        params: text: The text to sign.
+        returns: The signature as a tuple of num_perm integers.
+        """
+        words = self._WORD_PATTERN.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        hashes = {
+            zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+            for i in range(max(len(words) - size + 1, 1))
+        }
+
+        prime, max_hash = self._MERSENNE_PRIME, self._MAX_HASH
+        return tuple(
+            min(((a * h + b) % prime) & max_hash for h in hashes)
+            for a, b in self._permutations
+        )
+
+
+    def similarity(self, first: tuple, second: tuple) -> float:
+        """
+        Estimates the Jaccard similarity of two signatures.
+        params: first: The first signature.
+        params: second: The second signature.
+        returns: The fraction of equal signature slots.
+        """
+        return sum(1 for x, y in zip(first, second) if x == y) / self.num_perm
+
+
+    def deduplicate(self, documents: list) -> list:
+        """
+        Removes documents that are near-duplicates of a document seen before.
+        The sources of dropped documents are recorded on the kept document in the
+        'duplicate_sources' and 'duplicate_count' metadata fields. Documents kept by
+        earlier calls are usually stored already, so those whose provenance changed
+        are listed in 'updated' until the next call.
+        params: documents: The documents to deduplicate.
+        returns: The documents that were kept.
+        """
+        kept = []
+        self.updated = []
+        earlier = len(self._documents)
+        for document in documents:
+            self.stats["seen"] += 1
+            signature = self.signature(document.page_content)
+            match = self._find_duplicate(signature)
+
+            if match is not None:
+                self._merge_provenance(self._documents[match], document)
+                if match < earlier and self._documents[match] not in self.updated:
+                    self.updated.append(self._documents[match])
+                self.stats["dropped"] += 1
+                continue
+
+            index = len(self._signatures)
+            self._signatures.append(signature)
+            self._documents.append(document)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, []).append(index)
+            kept.append(document)
+
+        logger.info(
+            "Deduplication kept %s of %s chunks (%s dropped in total).",
+            len(kept),
+            len(documents),
+            self.stats["dropped"]
+        )
+        return kept
+
+
+    def _band_keys(self, signature: tuple):
+        """
+        Yields the LSH bucket key of every band of the signature.
+        """
+        for band in range(self.bands):
+            yield signature[band * self.rows:(band + 1) * self.rows]
+
+
+    def _find_duplicate(self, signature: tuple):
+        """
+        Looks up the candidates sharing a band with the signature and verifies them.
+        returns: The index of the first duplicate, or None.
+        """
+        checked = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if self.similarity(signature, self._signatures[candidate]) >= self.threshold:
+                    return candidate
+        return None
+
+
+    @staticmethod
+    def _merge_provenance(kept, duplicate) -> None:
+        """
+        Records the source of the duplicate on the kept document.
+        Metadata values stay scalar so that vector stores accept them.
+        """
+        kept.metadata["duplicate_count"] = kept.metadata.get("duplicate_count", 0) + 1
+
+        source = duplicate.metadata.get("source")
+        if not source or source == kept.metadata.get("source"):
+            return
+
+        sources = kept.metadata.get("duplicate_sources", "")
+        sources = sources.split(";") if sources else []
+        if source not in sources:
+            sources.append(str(source))
+            kept.metadata["duplicate_sources"] = ";".join(sources)
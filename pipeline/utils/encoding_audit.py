@@ -0,0 +1,175 @@
+"""
+This module contains the EncodingAudit class.
+It scans text files recursively for non-ASCII bytes in a worker pool and
+remembers files already known to be clean, so repeated RAG builds skip them.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import chardet
+from ..config import CACHE_DIR
+from .file_utils import FileUtils
+from .logger import logger
+
+
+class EncodingAudit:
+    """
+    Recursive non-ASCII audit with a (path, size, mtime, hash) cache of clean files.
+    """
+
+    def __init__(self, cache_path=None, max_workers: int = None):
+        """
+        Initializes the EncodingAudit.
+        params: cache_path: The JSON file remembering clean files.
+        params: max_workers: The number of worker threads scanning files.
+        """
+        self.cache_path = str(cache_path or CACHE_DIR / "encoding_audit.json")
+        self.max_workers = max_workers
+        self._cache = self._load_cache()
+
+
+    def _load_cache(self) -> dict:
+        """
+        Loads the clean-file cache.
+        returns: A dictionary of path to {'size', 'mtime', 'sha256'}.
+        """
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable encoding audit cache %s: %s", self.cache_path, e)
+            return {}
+
+
+    def _save_cache(self) -> None:
+        """
+        Writes the clean-file cache atomically.
+        """
+        temp_path = None
+        try:
+            # A unique temporary file, so concurrent audits do not write to the same one
+            descriptor, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.cache_path)),
+                prefix=f"{os.path.basename(self.cache_path)}.",
+                suffix=".tmp"
+            )
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(self._cache, file)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not write encoding audit cache %s: %s", self.cache_path, e)
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    @staticmethod
+    def collect_files(path: str, extensions=(".txt", ".md")) -> list:
+        """
+        Collects the files to audit, pruning the directories the RAG loaders skip.
+        params: path: A file or a directory that is searched recursively.
+        params: extensions: The extensions of the files to audit in directories.
+        returns: A list of file paths.
+        """
+        if not os.path.exists(path):
+            raise ValueError(f"Invalid path: {path}. No such file or directory.")
+        return list(FileUtils.walk_files(path, extensions))
+
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        """
+        Hashes a file in blocks.
+        returns: The sha256 hex digest of the content.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+    def _scan(self, file_path: str, size: int, mtime: float, cached: dict = None) -> tuple:
+        """
+        Scans one file in a worker, hashing it in the same pass.
+        A touched file of the cached size is hashed first and not scanned if its content is unchanged.
+        returns: A tuple of (file_path, cache entry, non-ASCII ranges, whether the file was scanned).
+        """
+        if cached and cached["size"] == size and self._hash_file(file_path) == cached["sha256"]:
+            return file_path, {**cached, "mtime": mtime}, [], False
+
+        digest = hashlib.sha256()
+        ranges = FileUtils.find_non_ascii_bytes(file_path, digest)
+        return file_path, {"size": size, "mtime": mtime, "sha256": digest.hexdigest()}, ranges, True
+
+
+    def audit(self, path: str, extensions=(".txt", ".md")) -> dict:
+        """
+        Audits a file or a directory tree for non-ASCII bytes.
+        Files with the cached size and mtime are skipped, touched files whose hash is unchanged
+        are not scanned again.
+        params: path: A file or a directory that is searched recursively.
+        params: extensions: The extensions of the files to audit in directories.
+        returns: A dictionary of file path to non-ASCII ranges for every file that is not clean.
+        """
+        pending = []
+        skipped = 0
+        for file_path in self.collect_files(path, extensions):
+            file_path = os.path.abspath(file_path)
+            stat = os.stat(file_path)
+            cached = self._cache.get(file_path)
+            if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+                skipped += 1
+                continue
+            pending.append((file_path, stat.st_size, stat.st_mtime, cached))
+
+        dirty = {}
+        scanned = 0
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = executor.map(lambda args: self._scan(*args), pending)
+                for file_path, entry, ranges, was_scanned in results:
+                    scanned += was_scanned
+                    if ranges:
+                        dirty[file_path] = ranges
+                        self._cache.pop(file_path, None)
+                    else:
+                        self._cache[file_path] = entry
+            self._save_cache()
+
+        logger.info(
+            "Encoding audit of %s: %s files scanned, %s skipped as clean, %s with non-ASCII bytes.",
+            path,
+            scanned,
+            skipped + len(pending) - scanned,
+            len(dirty)
+        )
+        return dirty
+
+
+    @staticmethod
+    def detect_encoding(file_path: str, sample_size: int = 64 * 1024) -> dict:
+        """
+        Detects the encoding of a file from samples of its head, middle and tail.
+        params: file_path: The path to the file.
+        params: sample_size: The number of bytes read at each sample position.
+        returns: The chardet result with 'encoding', 'confidence' and 'language'.
+        """
+        detector = chardet.UniversalDetector()
+        size = os.path.getsize(file_path)
+        offsets = [0]
+        if size > sample_size * 3:
+            offsets += [size // 2, size - sample_size]
+        elif size > sample_size:
+            offsets.append(sample_size)
+
+        with open(file_path, 'rb') as file:
+            for offset in offsets:
+                file.seek(offset)
+                detector.feed(file.read(sample_size))
+                if detector.done:
+                    break
+        return detector.close()
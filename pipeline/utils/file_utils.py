@@ -1,31 +1,96 @@
+import mmap
 import os
+import re
+import shutil
+import tempfile
 from .logger import logger
+from .path_filter import PathFilter
 
 class FileUtils:
     """Utility class for file operations."""
 
+    NON_ASCII_PATTERN = re.compile(rb'[\x80-\xff]+')
+    ASCII_BYTES = bytes(range(0x80))
+    SCAN_BLOCK_SIZE = 1 << 20
+    DEFAULT_EXCLUDE_DIRS = [".env/", ".git/", "env/", ".venv/", "venv/", "node_modules/", "__pycache__/"]
+
     @staticmethod
     def get_files(root_path=".", extension=".py", exclude_dirs=None) -> list:
         """
         Get all files with the specified extension in the codebase, excluding certain directories.
         params: root_path: The root directory to start searching for files.
-        params: extension: The file extension to search for.
-        params: exclude_dirs: Directories to exclude from the search.
+        params: extension: The file extension, or a list of extensions, to search for.
+        params: exclude_dirs: Directory names or glob patterns to exclude from the search.
         """
+        return list(FileUtils.walk_files(root_path, extension, exclude=exclude_dirs))
 
-        if exclude_dirs is None:
-            exclude_dirs = [".env", ".git", "env"]
-
-        # controlling if the root_path is a file
+    @staticmethod
+    def walk_files(root_path=".", extensions=".py", exclude=None, use_gitignore=False):
+        """
+        Lazily yields the files below root_path, depth first and sorted by name.
+        Excluded directories are pruned before they are entered.
+        params: root_path: The root directory, or a single file which is yielded as is.
+        params: extensions: An extension or a list of extensions to match, None for all files.
+        params: exclude: Names or .gitignore style glob patterns to exclude.
+                         Defaults to DEFAULT_EXCLUDE_DIRS.
+        params: use_gitignore: Whether .gitignore files found in the tree are honoured.
+                               Off by default, so data directories are loaded completely;
+                               on for source trees.
+        returns: A generator of file paths.
+        """
         if os.path.isfile(root_path):
-            return [root_path]
+            yield root_path
+            return
+
+        if isinstance(extensions, str):
+            extensions = (extensions,)
+        extensions = tuple(extensions) if extensions else None
+
+        root_abs = os.path.abspath(root_path)
+        patterns = FileUtils.DEFAULT_EXCLUDE_DIRS if exclude is None else exclude
+        patterns = [
+            "/" + os.path.relpath(p, root_abs).replace(os.sep, "/")
+            if os.path.isabs(p) else p
+            for p in patterns
+        ]
+        exclude_filter = PathFilter(patterns)
+
+        def is_excluded(rel_path, is_dir, ignore_files):
+            if exclude_filter.match(rel_path, is_dir):
+                return True
+            # The deepest .gitignore decides first
+            for base, path_filter in reversed(ignore_files):
+                result = path_filter.match(rel_path[len(base):], is_dir)
+                if result is not None:
+                    return result
+            return False
 
-        files = []
-        for root, _, filenames in os.walk(root_path):
-            if any(exclude in root for exclude in exclude_dirs):
+        stack = [(root_path, "", [])]
+        while stack:
+            directory, rel_dir, ignore_files = stack.pop()
+
+            gitignore = os.path.join(directory, ".gitignore")
+            if use_gitignore and os.path.isfile(gitignore):
+                ignore_files = ignore_files + [(rel_dir, PathFilter.from_file(gitignore))]
+
+            try:
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning("Skipping unreadable directory %s: %s", directory, e)
                 continue
-            files.extend(os.path.join(root, f) for f in filenames if f.endswith(extension))
-        return files
+
+            subdirectories = []
+            for entry in entries:
+                rel_path = rel_dir + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_excluded(rel_path, True, ignore_files):
+                        subdirectories.append((entry.path, rel_path + "/", ignore_files))
+                elif (extensions is None or entry.name.endswith(extensions)) \
+                        and not is_excluded(rel_path, False, ignore_files):
+                    yield entry.path
+
+            stack.extend(reversed(subdirectories))
 
     @staticmethod
     def write_to_file(file_path, content, mode='w', encoding='utf-8'):
@@ -76,6 +141,8 @@ class FileUtils:
     def prepend_to_file(file_path, content, encoding='utf-8'):
         """
         Prepend content to a file.
+        The file is streamed into a temporary file behind the content and renamed
+        over the original, so it is never held in memory as a whole.
         params: file_path: The path to the file.
         params: content: The content to prepend to the file.
         params: encoding: The encoding to use for writing the file.
@@ -86,37 +153,84 @@ class FileUtils:
                     file.write(content)
                 logger.info("File created and content written successfully: %s", file_path)
             else:
-                with open(file_path, 'r+', encoding=encoding) as file:
-                    file_content = file.read()
-                    file.seek(0, 0)
-                    file.write(content + file_content)
+                descriptor, temp_path = FileUtils.temp_file(file_path)
+                with os.fdopen(descriptor, 'w', encoding=encoding) as temp_file, \
+                        open(file_path, 'r', encoding=encoding) as file:
+                    temp_file.write(content)
+                    shutil.copyfileobj(file, temp_file)
+                FileUtils.replace_file(temp_path, file_path)
                 logger.info("Content prepended successfully: %s", file_path)
         except FileNotFoundError as e:
             logger.error("Error: %s", e)
 
     @staticmethod
-    def clean_non_ascii_positions(file_path, positions, replacement_byte=b' '):
+    def temp_file(file_path, suffix=".tmp"):
+        """
+        Creates a unique temporary file next to a file, so concurrent writers never share one.
+        params: file_path: The file the temporary file replaces later, see replace_file.
+        params: suffix: The suffix of the temporary file name.
+        returns: A tuple of (OS-level file descriptor, path).
+        """
+        return tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(file_path)),
+            prefix=f"{os.path.basename(file_path)}.",
+            suffix=suffix
+        )
+
+    @staticmethod
+    def replace_file(temp_path, file_path):
         """
-        Cleans non-ASCII bytes from a text file at specified positions.
+        Moves a temporary file of temp_file over a file atomically.
+        mkstemp creates files only the owner can read, so the temporary file first gets the
+        permissions of the file it replaces, or of a newly created file.
+        params: temp_path: The path to the temporary file.
+        params: file_path: The path to the file.
+        """
+        if not os.path.exists(file_path):
+            with open(file_path, 'a', encoding='utf-8'):
+                pass
+        shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+
+    @staticmethod
+    def clean_non_ascii_positions(file_path, positions=None, replacement_byte=b' '):
+        """
+        Cleans non-ASCII bytes from a text file in place through a memory map.
+        Memory use is constant regardless of the file size.
         params: file_path: The path to the text file.
-        params: positions: A list of tuples with positions and values of non-ASCII bytes.
+        params: positions: A list of (start, end) ranges as returned by find_non_ascii_bytes.
+                           If None, every non-ASCII byte in the file is replaced.
         params: replacement_byte: The byte to replace non-ASCII bytes with.
         """
         try:
             if len(replacement_byte) != 1:
                 raise ValueError("replacement_byte must be a single byte.")
+            if replacement_byte[0] > 0x7F:
+                raise ValueError("replacement_byte must be an ASCII byte.")
 
-            replacement_byte_int = replacement_byte[0]  # Get the integer value of the replacement byte
-
-            with open(file_path, 'rb') as file:
-                data = bytearray(file.read())
+            block_size = FileUtils.SCAN_BLOCK_SIZE
 
-            for pos, _ in positions:
-                if pos < len(data):
-                    data[pos] = replacement_byte_int
+            with open(file_path, 'r+b') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size == 0:
+                    return
 
-            with open(file_path, 'wb') as file:
-                file.write(data)
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE) as data:
+                    if positions is None:
+                        table = bytes(range(0x80)) + replacement_byte * 0x80
+                        for offset in range(0, size, block_size):
+                            block = data[offset:offset + block_size]
+                            cleaned = block.translate(table)
+                            if cleaned != block:
+                                data[offset:offset + len(block)] = cleaned
+                    else:
+                        filler = replacement_byte * block_size
+                        for start, end in positions:
+                            end = min(end, size)
+                            for offset in range(start, end, block_size):
+                                length = min(block_size, end - offset)
+                                data[offset:offset + length] = filler[:length]
+                    data.flush()
 
             logger.info("Non-ASCII bytes cleaned from file: %s", file_path)
         except FileNotFoundError as e:
@@ -127,17 +241,53 @@ class FileUtils:
             logger.error("An error occurred: %s", e)
 
     @staticmethod
-    def find_non_ascii_bytes(file_path):
+    def iter_non_ascii_ranges(file_path, digest=None):
+        """
+        Yields the ranges of consecutive non-ASCII bytes in a memory-mapped file.
+        Blocks without non-ASCII bytes are skipped with a single bytes.translate call.
+        params: file_path: The path to the text file.
+        params: digest: Optional hashlib object updated with every block, so the file is hashed in the same pass.
+        returns: A generator of (start, end) tuples, end being exclusive.
+        """
+        block_size = FileUtils.SCAN_BLOCK_SIZE
+
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                run_start, run_end = None, None
+                for offset in range(0, size, block_size):
+                    block = data[offset:offset + block_size]
+                    if digest is not None:
+                        digest.update(block)
+                    if not block.translate(None, FileUtils.ASCII_BYTES):
+                        continue
+
+                    for match in FileUtils.NON_ASCII_PATTERN.finditer(block):
+                        start, end = offset + match.start(), offset + match.end()
+                        if start == run_end:
+                            # The run continues across the block boundary
+                            run_end = end
+                            continue
+                        if run_start is not None:
+                            yield run_start, run_end
+                        run_start, run_end = start, end
+
+                if run_start is not None:
+                    yield run_start, run_end
+
+    @staticmethod
+    def find_non_ascii_bytes(file_path, digest=None):
         """
         Finds non-ASCII bytes in a text file.
         params: file_path: The path to the text file.
-        returns: A list of tuples containing the position and byte value of non-ASCII bytes.
+        params: digest: Optional hashlib object updated with the content, see iter_non_ascii_ranges.
+        returns: A list of (start, end) ranges of consecutive non-ASCII bytes, end being exclusive.
         """
         try:
-            with open(file_path, 'rb') as file:
-                data = file.read()
-            non_ascii_positions = [(i, byte) for i, byte in enumerate(data) if byte > 0x7F]
-            return non_ascii_positions
+            return list(FileUtils.iter_non_ascii_ranges(file_path, digest))
         except FileNotFoundError as e:
             logger.error("Error: %s", e)
             return []
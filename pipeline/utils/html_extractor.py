@@ -0,0 +1,181 @@
+"""
+This module contains the HtmlTextExtractor class.
+It reduces HTML pages to their main text, dropping navigation, footers,
+cookie banners and other boilerplate before the text is embedded.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from bs4 import BeautifulSoup
+from ..config import CACHE_DIR
+from .logger import logger
+
+
+class HtmlTextExtractor:
+    """
+    Boilerplate-stripping HTML to text converter with an on-disk cache
+    keyed by URL. Every entry starts with the hash of the content it was extracted from.
+
+    Example usage:
+        extractor = HtmlTextExtractor()
+        text = extractor.extract("https://example.com/", html)
+    """
+
+    BOILERPLATE_TAGS = (
+        "script", "style", "noscript", "template", "iframe", "svg", "canvas",
+        "nav", "footer", "aside", "button"
+    )
+    BOILERPLATE_ROLES = ("navigation", "banner", "contentinfo", "complementary", "search", "dialog")
+    # Matches whole class names and ids such as "cookie-banner", "main-menu" or "share_links",
+    # but not "sharedContent" or "menu-item-article".
+    BOILERPLATE_PATTERN = re.compile(
+        r"^(?:[a-z0-9]+[-_])?"
+        r"(?:cookies?|consent|gdpr|banner|nav|navbar|navigation|menu|sidebar|footer|breadcrumbs?"
+        r"|ads?|advert|advertisement|promo|popup|modal|newsletter|subscribe|share|social)"
+        r"(?:[-_](?:bar|box|banner|links|buttons|icons|wrapper|container|widget|notice|popup|modal))?$",
+        re.IGNORECASE
+    )
+    # Forms with less text than this are search boxes, logins and sign-ups.
+    FORM_TEXT_LIMIT = 200
+    _BLANK_LINES = re.compile(r"\n\s*\n+")
+    _SPACES = re.compile(r"[ \t\r\f\v]+")
+
+    def __init__(self, cache_dir=None, parser: str = None):
+        """
+        Initializes the HtmlTextExtractor.
+        params: cache_dir: The directory of the cache, or False to disable caching.
+        params: parser: The BeautifulSoup parser. Defaults to lxml if it is installed.
+        """
+        self.cache_dir = None if cache_dir is False else str(cache_dir or CACHE_DIR / "extracted")
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.parser = parser or self._default_parser()
+        self.stats = {"pages": 0, "cached": 0, "original_size": 0, "text_size": 0}
+
+
+    @staticmethod
+    def _default_parser() -> str:
+        """
+        Chooses lxml when it is installed, the standard library parser otherwise.
+        returns: The parser name.
+        """
+        try:
+            import lxml  # pylint: disable=import-outside-toplevel,unused-import
+            return "lxml"
+        except ImportError:
+            return "html.parser"
+
+
+    def _cache_path(self, url: str) -> str:
+        url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{url_key}.txt")
+
+
+    def extract(self, url: str, html) -> str:
+        """
+        Extracts the main text of a page, from the cache if the page is unchanged.
+        params: url: The URL of the page.
+        params: html: The HTML as bytes or str.
+        returns: The text.
+        """
+        raw = html.encode("utf-8") if isinstance(html, str) else html
+        cache_path = content_hash = None
+        if self.cache_dir:
+            cache_path = self._cache_path(url)
+            content_hash = hashlib.sha256(raw).hexdigest()
+            try:
+                with open(cache_path, 'r', encoding='utf-8', newline='') as file:
+                    if file.readline().rstrip("\n") == content_hash:
+                        text = file.read()
+                        self._report(url, len(raw), len(text), cached=True)
+                        return text
+            except OSError:
+                pass
+
+        text = self.html_to_text(raw)
+        self._report(url, len(raw), len(text), cached=False)
+
+        if cache_path:
+            self._store(cache_path, content_hash, text)
+        return text
+
+
+    def _store(self, cache_path: str, content_hash: str, text: str) -> None:
+        """
+        Stores extracted text after the hash of its content, replacing the older version of the URL.
+        """
+        try:
+            handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with open(handle, 'w', encoding='utf-8', newline='') as file:
+                    file.write(f"{content_hash}\n{text}")
+                os.replace(temp_path, cache_path)
+            except OSError:
+                os.remove(temp_path)
+                raise
+        except OSError as e:
+            logger.warning("Could not cache extracted text %s: %s", cache_path, e)
+
+
+    def _report(self, url: str, original_size: int, text_size: int, cached: bool) -> None:
+        """
+        Logs the size reduction of a page and adds it to the totals.
+        """
+        self.stats["pages"] += 1
+        self.stats["cached"] += int(cached)
+        self.stats["original_size"] += original_size
+        self.stats["text_size"] += text_size
+        logger.info(
+            "Extracted %s%s: %s -> %s bytes (%.1f%% removed).",
+            url,
+            " (cached)" if cached else "",
+            original_size,
+            text_size,
+            100 * (1 - text_size / original_size) if original_size else 0.0
+        )
+
+
+    def html_to_text(self, html) -> str:
+        """
+        Converts HTML into text without boilerplate.
+        The <main> element, or the only <article>, is preferred when the page has one.
+        params: html: The HTML as bytes or str.
+        returns: The text with collapsed whitespace.
+        """
+        soup = BeautifulSoup(html, self.parser)
+
+        for element in soup(self.BOILERPLATE_TAGS):
+            element.decompose()
+
+        content = {id(parent) for element in soup.find_all(("main", "article")) for parent in element.parents}
+        for element in soup.find_all(True):
+            if not element.decomposed and id(element) not in content and self._is_boilerplate(element):
+                element.decompose()
+
+        root = soup.find("main")
+        if root is None:
+            articles = soup.find_all("article")
+            root = articles[0] if len(articles) == 1 else soup.body or soup
+
+        text = root.get_text("\n")
+        text = self._SPACES.sub(" ", text)
+        text = "\n".join(line.strip() for line in text.split("\n"))
+        return self._BLANK_LINES.sub("\n\n", text).strip()
+
+
+    def _is_boilerplate(self, element) -> bool:
+        """
+        Matches elements whose role, class or id mark them as boilerplate, and forms with little text.
+        The caller skips the elements containing <main> or <article>.
+        """
+        if element.name in ("html", "body", "main", "article"):
+            return False
+        if element.get("role") in self.BOILERPLATE_ROLES:
+            return True
+        if element.get("aria-hidden") == "true":
+            return True
+        if element.name == "form" and len(element.get_text(" ", strip=True)) < self.FORM_TEXT_LIMIT:
+            return True
+        names = list(element.get("class") or []) + [element.get("id") or ""]
+        return any(self.BOILERPLATE_PATTERN.match(name) for name in names)
@@ -0,0 +1,399 @@
+"""
+This module contains the JsonRecordStream class.
+It iterates over the elements of an array inside a JSON file without loading
+the file into memory, so multi-gigabyte exports can be indexed record by record.
+"""
+import json
+import re
+from .logger import logger
+
+
+class JsonRecordStream:
+    """
+    Incremental reader yielding the records at a dotted path of a JSON file.
+
+    The path selects the value to iterate, e.g. 'nmaprun.host' for
+    {"nmaprun": {"host": [...]}}. An empty path selects the top-level value.
+    '*' matches every key of an object or every element of an array.
+    Arrays at the end of the path yield their elements, other values are yielded as is.
+    Values outside the path are skipped without being decoded, and only the
+    record being decoded is held in memory.
+
+    Example usage:
+        for record in JsonRecordStream("export.json", "nmaprun.host"):
+            print(record["address"])
+    """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+    _STRUCTURAL = re.compile(r'["\[\]{}]')
+    _STRING_END = re.compile(r'["\\]')
+    _NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+    def __init__(self, file_path: str, path: str = "", block_size: int = 1 << 16, encoding: str = 'utf-8'):
+        """
+        Initializes the JsonRecordStream.
+        params: file_path: The path to the JSON file.
+        params: path: The dotted path to the records.
+        params: block_size: The number of characters read at a time.
+        params: encoding: The encoding of the file.
+        """
+        if block_size <= 0:
+            raise ValueError("block_size must be greater than 0")
+
+        self.file_path = file_path
+        self.path = [segment for segment in path.split(".") if segment] if path else []
+        self.block_size = block_size
+        self.encoding = encoding
+        self._decoder = json.JSONDecoder()
+        self._file = None
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+
+    def __iter__(self):
+        with open(self.file_path, 'r', encoding=self.encoding) as self._file:
+            self._buffer, self._pos, self._eof = "", 0, False
+            found = yield from self._walk(self.path)
+
+        if not found:
+            logger.warning("Path '%s' not found in %s.", ".".join(self.path), self.file_path)
+
+
+    def _fill(self, size: int = None) -> bool:
+        """
+        Reads more characters into the buffer, dropping the consumed part first.
+        params: size: The minimum number of characters to read.
+        returns: False if the end of the file was reached.
+        """
+        if self._eof:
+            return False
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+        data = self._file.read(max(size or 0, self.block_size))
+        if not data:
+            self._eof = True
+            return False
+        self._buffer += data
+        return True
+
+
+    def _peek(self) -> str:
+        """
+        Skips whitespace and returns the next character without consuming it.
+        returns: The next character, or '' at the end of the file.
+        """
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+
+    def _expect(self, chars: str) -> str:
+        """
+        Consumes the next character, which must be one of chars.
+        returns: The consumed character.
+        """
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(
+                f"Invalid JSON in {self.file_path}: expected one of {chars!r}, found {char or 'end of file'!r}."
+            )
+        self._pos += 1
+        return char
+
+
+    def _decode(self):
+        """
+        Decodes the next value, reading more of the file until it is complete.
+        returns: The decoded value.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number cut by the end of the buffer, e.g. '3.' of '3.75', continues in the next block
+                cut = (
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and self._NUMBER_TAIL.fullmatch(self._buffer, end)
+                )
+                if not cut or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Read at least as much as is buffered, so large values are retried a logarithmic number of times
+            self._fill(len(self._buffer) - self._pos)
+
+
+    def _skip(self) -> None:
+        """
+        Skips the next value without decoding it.
+        """
+        char = self._peek()
+        if char not in "[{\"":
+            self._decode()
+            return
+
+        depth = 0
+        in_string = False
+        while True:
+            pattern = self._STRING_END if in_string else self._STRUCTURAL
+            match = pattern.search(self._buffer, self._pos)
+            if match is None:
+                self._pos = len(self._buffer)
+                if not self._fill():
+                    raise ValueError(f"Invalid JSON in {self.file_path}: unexpected end of file.")
+                continue
+
+            char = match.group()
+            if char == "\\":
+                if match.end() >= len(self._buffer):
+                    self._pos = match.start()
+                    if not self._fill():
+                        raise ValueError(f"Invalid JSON in {self.file_path}: unexpected end of file.")
+                    continue
+                self._pos = match.end() + 1
+                continue
+
+            self._pos = match.end()
+            if char == '"':
+                in_string = not in_string
+                if not in_string and depth == 0:
+                    return
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+    def _items(self):
+        """
+        Iterates over the members of the object or the elements of the array
+        that starts at the current position, leaving each value unconsumed.
+        Yields the key of each member, or the index of each element.
+        """
+        opening = self._expect("[{")
+        closing = "]" if opening == "[" else "}"
+        index = 0
+
+        if self._peek() == closing:
+            self._pos += 1
+            return
+
+        while True:
+            if opening == "{":
+                key = self._decode()
+                if not isinstance(key, str):
+                    raise ValueError(f"Invalid JSON in {self.file_path}: object keys must be strings.")
+                self._expect(":")
+                yield key
+            else:
+                yield index
+                index += 1
+
+            if self._expect("," + closing) == closing:
+                return
+
+
+    def _walk(self, path: list):
+        """
+        Yields the records below the current position.
+        params: path: The remaining path segments.
+        returns: Whether the path was found.
+        """
+        if not path:
+            if self._peek() == "[":
+                for _ in self._items():
+                    yield self._decode()
+            else:
+                yield self._decode()
+            return True
+
+        if self._peek() not in "[{":
+            self._skip()
+            return False
+
+        segment, found = path[0], False
+        for key in self._items():
+            if segment == "*" or str(key) == segment:
+                found = (yield from self._walk(path[1:])) or found
+            else:
+                self._skip()
+        return found
+
+
+class JsonObjectScanner:
+    """
+    Incremental scanner finding the first JSON object in free text, e.g. an LLM answer.
+
+    Text is fed in chunks as it arrives, for example the tokens of a streamed response.
+    Braces are matched in a single pass that knows about strings and escapes, so every
+    character is looked at once. As soon as the closing brace of an object arrives it is
+    decoded, and the first object (or nested object) accepted by the predicate is returned,
+    so the caller can stop the generation early. Objects that are not valid JSON are
+    searched for valid nested objects instead.
+
+    Example usage:
+        scanner = JsonObjectScanner(lambda data: "commands" in data)
+        for token in llm.stream(prompt):
+            if scanner.feed(token.content) is not None:
+                break
+        print(scanner.result)
+    """
+
+    _OUTSIDE_STRING = re.compile(r'[{}"]')
+    _INSIDE_STRING = re.compile(r'["\\]')
+    _NON_SPACE = re.compile(r"\S")
+
+    def __init__(self, predicate=None):
+        """
+        Initializes the JsonObjectScanner.
+        params: predicate: Called with every decoded object, returns True for the object to find.
+                           Any object is accepted if None.
+        """
+        self.predicate = predicate
+        self.result = None
+        self._reset()
+
+
+    def _reset(self) -> None:
+        """
+        Forgets the current candidate.
+        """
+        self._parts = []
+        self._size = 0
+        self._depth = 0
+        self._opens = []
+        self._pairs = []
+        self._expect_key = False
+        self._in_string = False
+        self._escape = False
+
+
+    def feed(self, chunk: str):
+        """
+        Scans the next chunk of text.
+        A brace that is not followed by a key or a closing brace, e.g. in 'use { often',
+        does not start a candidate, so it does not hide the objects after it.
+        params: chunk: The text.
+        returns: The first matching object once it is complete, None until then.
+        """
+        if self.result is not None or not chunk:
+            return self.result
+
+        start = pos = 0
+        if self._depth == 0:
+            start = pos = chunk.find("{")
+            if start < 0:
+                return None
+
+        while pos < len(chunk):
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            if self._expect_key:
+                match = self._NON_SPACE.search(chunk, pos)
+                if not match:
+                    break
+                if match.group() not in '"}':
+                    self._reset()
+                    start = pos = chunk.find("{", match.start())
+                    if start < 0:
+                        return None
+                    continue
+                self._expect_key = False
+                pos = match.start()
+
+            match = (self._INSIDE_STRING if self._in_string else self._OUTSIDE_STRING).search(chunk, pos)
+            if not match:
+                break
+            char, pos = match.group(), match.end()
+
+            if self._in_string:
+                if char == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._expect_key = self._depth == 0
+                self._depth += 1
+                self._opens.append(self._size + pos - 1 - start)
+            else:
+                self._depth -= 1
+                self._pairs.append((self._opens.pop(), self._size + pos - start))
+                if self._depth == 0:
+                    self._parts.append(chunk[start:pos])
+                    candidate, pairs = "".join(self._parts), self._pairs
+                    self._reset()
+                    self.result = self._match(candidate, pairs)
+                    if self.result is not None:
+                        return self.result
+                    start = pos = chunk.find("{", pos)
+                    if start < 0:
+                        return None
+
+        self._parts.append(chunk[start:])
+        self._size += len(chunk) - start
+        return None
+
+
+    def _match(self, candidate: str, pairs: list):
+        """
+        Decodes a balanced candidate and returns the first matching object in it.
+        If the candidate is not valid JSON, the objects nested in it are decoded instead,
+        outermost first, without recursion.
+        params: candidate: The text from the opening to the closing brace.
+        params: pairs: The (start, end) offsets of the candidate and every object nested in it.
+        """
+        decoded_end = -1
+        for start, end in sorted(pairs):
+            if start < decoded_end:
+                continue
+            try:
+                value = json.loads(candidate[start:end])
+            except (json.JSONDecodeError, RecursionError):
+                logger.debug("Skipping invalid JSON object: %s", candidate[start:start + 80])
+                continue
+            decoded_end = end
+
+            stack = [value]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, dict):
+                    if self.predicate is None or self.predicate(value):
+                        return value
+                    stack += reversed(list(value.values()))
+                elif isinstance(value, list):
+                    stack += reversed(value)
+        return None
+
+
+    @classmethod
+    def find(cls, text, predicate=None):
+        """
+        Finds the first JSON object in a text or in an iterable of chunks.
+        Iteration stops at the closing brace of the object, so a streamed generation is not read further.
+        params: text: A string, or an iterable of strings or message chunks with a content attribute.
+        params: predicate: See __init__.
+        returns: The object, or None if there is no matching object.
+        """
+        scanner = cls(predicate)
+        if isinstance(text, str):
+            return scanner.feed(text)
+
+        for chunk in text:
+            if scanner.feed(getattr(chunk, "content", chunk)) is not None:
+                break
+        return scanner.result
@@ -0,0 +1,141 @@
+"""
+This module contains the PathFilter class.
+It matches relative paths against glob and .gitignore style patterns.
+"""
+import re
+from .logger import logger
+
+
+class PathFilter:
+    """
+    Matches relative paths ('/' separated) against .gitignore style patterns.
+
+    Supported syntax:
+        - blank lines and lines starting with '#' are ignored
+        - '!' negates a pattern and re-includes what an earlier pattern excluded
+        - a trailing '/' only matches directories
+        - a pattern containing '/' is anchored to the base directory,
+          otherwise it matches a name at any depth
+        - '*', '?', '[...]' and '**' behave like in .gitignore
+    """
+
+    def __init__(self, patterns=None):
+        """
+        Initializes the PathFilter.
+        params: patterns: An iterable of patterns.
+        """
+        self.rules = []
+        for pattern in patterns or []:
+            self.rules.extend(self._compile(pattern))
+
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "PathFilter":
+        """
+        Creates a PathFilter from a .gitignore file.
+        params: file_path: The path to the .gitignore file.
+        returns: The PathFilter, empty if the file cannot be read.
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                return cls(file.read().splitlines())
+        except OSError as e:
+            logger.warning("Could not read ignore file %s: %s", file_path, e)
+            return cls()
+
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        """
+        Translates a glob pattern into a regular expression.
+        params: pattern: The glob pattern without negation and anchoring markers.
+        returns: The regular expression source.
+        """
+        regex = ""
+        i, length = 0, len(pattern)
+        while i < length:
+            char = pattern[i]
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+                continue
+            if char == "*":
+                regex += "[^/]*"
+            elif char == "?":
+                regex += "[^/]"
+            elif char == "[":
+                end = pattern.find("]", i + 1)
+                if end == -1:
+                    regex += re.escape(char)
+                else:
+                    body = pattern[i + 1:end]
+                    if body.startswith("!"):
+                        body = "^" + body[1:]
+                    regex += f"[{body}]"
+                    i = end
+            elif char == "\\" and i + 1 < length:
+                i += 1
+                regex += re.escape(pattern[i])
+            else:
+                regex += re.escape(char)
+            i += 1
+        return regex
+
+
+    @classmethod
+    def _compile(cls, pattern: str) -> list:
+        """
+        Compiles a pattern into rules of (regex, negated, dir_only).
+        A pattern excluding everything below a directory ('dir/**') also yields a
+        rule for the directory itself, so walkers can prune it without descending.
+        params: pattern: The pattern.
+        returns: A list of rules.
+        """
+        pattern = pattern.rstrip("\n").rstrip()
+        if not pattern or pattern.startswith("#"):
+            return []
+
+        negated = pattern.startswith("!")
+        if negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\"):
+            pattern = pattern[1:]
+
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            return []
+
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+
+        rules = [(re.compile(prefix + cls._translate(pattern) + r"\Z"), negated, dir_only)]
+
+        for suffix in ("/**/*", "/**"):
+            if not negated and pattern.endswith(suffix) and len(pattern) > len(suffix):
+                directory = pattern[:-len(suffix)]
+                rules.append((re.compile(prefix + cls._translate(directory) + r"\Z"), False, True))
+                break
+
+        return rules
+
+
+    def match(self, rel_path: str, is_dir: bool = False):
+        """
+        Matches a relative path against the patterns. The last matching pattern wins.
+        params: rel_path: The path relative to the base directory, '/' separated.
+        params: is_dir: Whether the path is a directory.
+        returns: True if the path is excluded, False if it is re-included by a
+                 negated pattern, None if no pattern matches.
+        """
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
@@ -3,6 +3,7 @@ Shared utility functions.
 """
 
 import datetime
+import json
 import os
 import secrets
 import sys
@@ -139,6 +140,104 @@ class PipelineUtils():
             help="Auto clean the non ascii characters",
             default=True)
 
+        parser.add_argument(
+            "--tokenizer",
+            type=str,
+            required=False,
+            help="Size chunks in tokens of this tokenizer (e.g. cl100k_base, gpt-4o or approximate)",
+            default=None)
+
+        parser.add_argument(
+            "--chunk_size",
+            type=int,
+            required=False,
+            help="The chunk size, in tokens if a tokenizer is set, otherwise in characters",
+            default=None)
+
+        parser.add_argument(
+            "--chunk_overlap",
+            type=int,
+            required=False,
+            help="The chunk overlap, in the same unit as the chunk size",
+            default=None)
+
+        parser.add_argument(
+            "--dedup_threshold",
+            type=float,
+            required=False,
+            help="Drop near-duplicate chunks above this similarity (0-1) before embedding",
+            default=None)
+
+        parser.add_argument(
+            "--parse_workers",
+            type=int,
+            required=False,
+            help="The number of processes parsing Python files (default: one per CPU)",
+            default=None)
+
+        parser.add_argument(
+            "--persist_directory",
+            type=str,
+            required=False,
+            help="Keep the vector store in this directory, so it can be updated incrementally",
+            default=None)
+
+        parser.add_argument(
+            "--crawl_depth",
+            type=int,
+            required=False,
+            help="Crawl the website this many links deep from the URL",
+            default=None)
+
+        parser.add_argument(
+            "--max_pages",
+            type=int,
+            required=False,
+            help="The maximum number of pages crawled",
+            default=None)
+
+        parser.add_argument(
+            "--allowed_domains",
+            type=str,
+            required=False,
+            help="Comma-separated domains the crawler may follow links to",
+            default=None)
+
+        parser.add_argument(
+            "--crawl_delay",
+            type=float,
+            required=False,
+            help="The minimum number of seconds between two requests to one host",
+            default=None)
+
+        parser.add_argument(
+            "--records_path",
+            type=str,
+            required=False,
+            help="Stream JSON files and index every record at this dotted path ('' for a top-level array)",
+            default=None)
+
+        parser.add_argument(
+            "--metadata_fields",
+            type=str,
+            required=False,
+            help="Comma-separated record fields stored as metadata in JSON records mode",
+            default=None)
+
+        parser.add_argument(
+            "--group_chars",
+            type=int,
+            required=False,
+            help="Group small JSON records into documents of up to this many characters",
+            default=None)
+
+        parser.add_argument(
+            "--metadata_filter",
+            type=json.loads,
+            required=False,
+            help='Only search chunks whose metadata match, e.g. \'{"year": {"$gte": 2023}}\'',
+            default=None)
+
         parser.add_argument(
             '--create-questionnaire',
             action='store_true',
@@ -348,20 +447,16 @@ class PipelineUtils():
         kwargs = PipelineUtils.get_kwargs(args)
 
         if args.type == "py":
-            base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            exclude_patterns = [
-                "env/**/*",
-                "env1/**/*",
-                "venv/**/*",
-                ".git/**/*",
-                ".idea/**/*",
-                ".vscode/**/*",
-                "**/__pycache__/**/*",
-                "**/.pytest_cache/**/*"
+            kwargs["exclude"] = [
+                "env/",
+                "env1/",
+                "venv/",
+                ".git/",
+                ".idea/",
+                ".vscode/",
+                "__pycache__/",
+                ".pytest_cache/"
             ]
-            exclude_paths = [os.path.join(base_path, pattern) for pattern in exclude_patterns]
-
-            kwargs["exclude"] = exclude_paths
 
             return RAGFactory.get_rag_class("py", **kwargs)
 
@@ -0,0 +1,168 @@
+"""
+This module contains the RepositoryCache class.
+It keeps one shallow clone per repository, updates it with fetches instead of
+new clones, and remembers the last indexed commit so that only the files
+changed since then have to be indexed again.
+"""
+import json
+import os
+from git import GitCommandError, Repo
+from ..config import CACHE_DIR
+from .file_utils import FileUtils
+from .logger import logger
+
+
+class RepositoryCache:
+    """
+    Shallow clone cache with git-diff-driven change detection.
+
+    Example usage:
+        cache = RepositoryCache("/data/repo", "https://github.com/org/repo.git")
+        head = cache.sync()
+        changes = cache.changed_files(cache.last_indexed("code"), head)
+        ...
+        cache.mark_indexed("code", head)
+    """
+
+    def __init__(self, path: str, git_url: str = None, depth: int = 1, state_path=None):
+        """
+        Initializes the RepositoryCache.
+        params: path: The directory of the clone.
+        params: git_url: The URL of the repository. Not needed for an existing clone.
+        params: depth: The history depth of clones and fetches. None clones the full
+                       history without blobs (partial clone) instead.
+        params: state_path: The JSON file remembering the last indexed commits.
+        """
+        if depth is not None and depth <= 0:
+            raise ValueError("depth must be greater than 0 or None")
+
+        self.path = path
+        self.git_url = git_url
+        self.depth = depth
+        self.state_path = str(state_path or CACHE_DIR / "repositories.json")
+        self.repo = None
+
+
+    def sync(self) -> str:
+        """
+        Clones the repository, or fetches and resets an existing clone to the remote HEAD.
+        returns: The SHA of the checked out commit.
+        """
+        if os.path.isdir(os.path.join(self.path, ".git")):
+            self.repo = Repo(self.path)
+            self._fetch()
+        elif os.path.exists(self.path) and os.listdir(self.path):
+            raise ValueError(f"Cannot clone into {self.path}: the directory exists and is not a git repository.")
+        else:
+            if not self.git_url:
+                raise ValueError(f"No git repository at {self.path} and no git_url to clone from.")
+            options = {"depth": self.depth, "single_branch": True} if self.depth else {"filter": "blob:none"}
+            self.repo = Repo.clone_from(self.git_url, to_path=self.path, **options)
+            logger.info("Repository cloned from %s to %s", self.git_url, self.path)
+
+        return self.repo.head.commit.hexsha
+
+
+    def _fetch(self) -> None:
+        """
+        Fetches the remote branch and resets the working tree to it.
+        """
+        if not self.repo.remotes:
+            logger.info("Repository %s has no remote, using the working tree as is.", self.path)
+            return
+
+        remote = self.repo.remotes[0]
+        if self.git_url and self.git_url not in remote.urls:
+            raise ValueError(f"Repository at {self.path} is a clone of {next(remote.urls)}, not {self.git_url}.")
+
+        branch = self.repo.active_branch.name if not self.repo.head.is_detached else "HEAD"
+        old_head = self.repo.head.commit.hexsha
+        options = {"depth": self.depth} if self.depth else {}
+        remote.fetch(branch, **options)
+        self.repo.git.reset("--hard", "FETCH_HEAD")
+        logger.info(
+            "Repository %s fetched: %s -> %s",
+            self.path,
+            old_head[:12],
+            self.repo.head.commit.hexsha[:12]
+        )
+
+
+    def changed_files(self, old_commit: str, new_commit: str = "HEAD") -> dict:
+        """
+        Lists the files that changed between two commits.
+        Renamed files are reported as a deletion of the old and an addition of the new path.
+        params: old_commit: The last indexed commit.
+        params: new_commit: The commit to compare with.
+        returns: A dictionary with 'changed' (added or modified) and 'deleted' lists of
+                 paths joined to the clone directory, or None if the commits cannot be
+                 compared (e.g. the old commit is unknown) and a full re-index is needed.
+        """
+        if not old_commit:
+            return None
+
+        repo = self.repo or Repo(self.path)
+        try:
+            output = repo.git.diff("--name-status", "-M", "--no-color", old_commit, new_commit)
+        except GitCommandError as e:
+            logger.warning("Cannot diff %s..%s, a full re-index is needed: %s", old_commit, new_commit, e)
+            return None
+
+        changes = {"changed": [], "deleted": []}
+        for line in output.splitlines():
+            fields = line.split("\t")
+            status = fields[0][:1]
+            if status in ("R", "C"):
+                if status == "R":
+                    changes["deleted"].append(os.path.join(self.path, fields[1]))
+                changes["changed"].append(os.path.join(self.path, fields[2]))
+            elif status == "D":
+                changes["deleted"].append(os.path.join(self.path, fields[1]))
+            elif status in ("A", "M", "T"):
+                changes["changed"].append(os.path.join(self.path, fields[1]))
+
+        logger.info(
+            "%s files changed and %s deleted between %s and %s.",
+            len(changes["changed"]),
+            len(changes["deleted"]),
+            old_commit[:12],
+            new_commit[:12]
+        )
+        return changes
+
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+
+    def last_indexed(self, index_name: str) -> str:
+        """
+        Gets the last commit indexed into an index.
+        params: index_name: The name of the index, e.g. the collection name.
+        returns: The commit SHA, or None.
+        """
+        return self._load_state().get(os.path.abspath(self.path), {}).get(index_name)
+
+
+    def mark_indexed(self, index_name: str, commit: str) -> None:
+        """
+        Records the commit indexed into an index.
+        params: index_name: The name of the index, e.g. the collection name.
+        params: commit: The commit SHA.
+        """
+        state = self._load_state()
+        state.setdefault(os.path.abspath(self.path), {})[index_name] = commit
+        temp_path = None
+        try:
+            descriptor, temp_path = FileUtils.temp_file(self.state_path)
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(state, file, indent=2)
+            FileUtils.replace_file(temp_path, self.state_path)
+        except OSError as e:
+            logger.warning("Could not write repository state %s: %s", self.state_path, e)
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,137 @@
+"""
+This module contains the ReportWriter class.
+It collects report fragments in memory and writes them with a few large
+writes, instead of opening, appending and closing the file for every fragment.
+"""
+import os
+import shutil
+import time
+from .file_utils import FileUtils
+from .logger import logger
+
+
+class ReportWriter:
+    """
+    Buffered report sink.
+
+    Fragments are buffered in memory and flushed to a temporary body file next to
+    the target when the buffer is full or the flush interval has passed.
+    On close the report is assembled from the header slot, the existing file
+    (when appending) and the body, and renamed over the target atomically.
+
+    Example usage:
+        with ReportWriter("report.md") as report:
+            report.write("## Section")
+            report.set_header("# Title")
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        append: bool = False,
+        flush_size: int = 64 * 1024,
+        flush_interval: float = 30.0,
+        separator: str = "\n\n",
+        encoding: str = 'utf-8'
+    ):
+        """
+        Initializes the ReportWriter.
+        params: file_path: The path to the report.
+        params: append: Keep the current content of the report and add to it.
+        params: flush_size: The number of buffered characters that triggers a flush.
+        params: flush_interval: The number of seconds after which buffered fragments are flushed.
+        params: separator: The text written after every fragment.
+        params: encoding: The encoding of the report.
+        """
+        self.file_path = file_path
+        self.append = append
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.separator = separator
+        self.encoding = encoding
+
+        self.header = ""
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        descriptor, self._body_path = FileUtils.temp_file(file_path, ".body.tmp")
+        # Stays open between flushes, close() closes it
+        self._body = os.fdopen(descriptor, 'w', encoding=encoding)  # pylint: disable=consider-using-with
+        self.closed = False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            logger.warning("Report %s closed after an error, keeping the partial report.", self.file_path)
+        self.close()
+        return False
+
+
+    def write(self, content: str) -> None:
+        """
+        Adds a fragment to the report.
+        params: content: The fragment.
+        """
+        if self.closed:
+            raise ValueError(f"Report {self.file_path} is already closed.")
+
+        self._buffer.append(content)
+        self._buffer.append(self.separator)
+        self._buffered += len(content) + len(self.separator)
+
+        if self._buffered >= self.flush_size \
+                or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+
+    def set_header(self, content: str) -> None:
+        """
+        Sets the text placed in front of the report when it is assembled.
+        params: content: The header.
+        """
+        self.header = content
+
+
+    def flush(self) -> None:
+        """
+        Writes the buffered fragments to the temporary body file.
+        """
+        if self._buffer:
+            self._body.write("".join(self._buffer))
+            self._body.flush()
+            self._buffer.clear()
+            self._buffered = 0
+        self._last_flush = time.monotonic()
+
+
+    def close(self) -> None:
+        """
+        Assembles the report and moves it over the target atomically.
+        """
+        if self.closed:
+            return
+
+        self.flush()
+        self._body.close()
+        self.closed = True
+
+        keep_existing = self.append and os.path.exists(self.file_path)
+        if not self.header and not keep_existing:
+            FileUtils.replace_file(self._body_path, self.file_path)
+        else:
+            descriptor, assembly_path = FileUtils.temp_file(self.file_path)
+            with os.fdopen(descriptor, 'w', encoding=self.encoding) as report:
+                if self.header:
+                    report.write(self.header)
+                    report.write(self.separator)
+                for part_path in ([self.file_path] if keep_existing else []) + [self._body_path]:
+                    with open(part_path, 'r', encoding=self.encoding) as part:
+                        shutil.copyfileobj(part, report)
+            FileUtils.replace_file(assembly_path, self.file_path)
+            os.remove(self._body_path)
+
+        logger.info("Report written successfully: %s", self.file_path)
@@ -0,0 +1,295 @@
+"""
+This module contains the SymbolIndex class.
+It records the modules, classes, functions and methods of Python files with
+their line ranges and the names they call, so questions naming a symbol can be
+answered from its exact source instead of a vector search.
+"""
+import ast
+import json
+import os
+import re
+from .file_utils import FileUtils
+from .logger import logger
+
+
+class _SymbolVisitor(ast.NodeVisitor):
+    """
+    Collects the definitions of a module with their qualified names.
+    """
+
+    def __init__(self, module: str, file_path: str):
+        self.module = module
+        self.file_path = file_path
+        self.stack = []
+        self.symbols = []
+
+
+    def _add(self, node, kind: str) -> dict:
+        start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        symbol = {
+            "name": node.name,
+            "qualname": ".".join([entry["name"] for entry in self.stack] + [node.name]),
+            "module": self.module,
+            "kind": kind,
+            "file": self.file_path,
+            "start": start,
+            "end": node.end_lineno,
+            "calls": []
+        }
+        self.symbols.append(symbol)
+        return symbol
+
+
+    def _visit_scope(self, node, kind: str) -> None:
+        symbol = self._add(node, kind)
+        self.stack.append(symbol)
+        self.generic_visit(node)
+        self.stack.pop()
+        symbol["calls"] = sorted(set(symbol["calls"]))
+
+
+    def visit_ClassDef(self, node):  # pylint: disable=invalid-name
+        """Records a class and the symbols defined in it."""
+        self._visit_scope(node, "class")
+
+
+    def visit_FunctionDef(self, node):  # pylint: disable=invalid-name
+        """Records a function, or a method if it is defined in a class."""
+        parent = self.stack[-1]["kind"] if self.stack else None
+        self._visit_scope(node, "method" if parent == "class" else "function")
+
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+    def visit_Call(self, node):  # pylint: disable=invalid-name
+        """Records the name a call calls in the enclosing symbol."""
+        if self.stack:
+            function = node.func
+            if isinstance(function, ast.Name):
+                self.stack[-1]["calls"].append(function.id)
+            elif isinstance(function, ast.Attribute):
+                self.stack[-1]["calls"].append(function.attr)
+        self.generic_visit(node)
+
+
+class SymbolIndex:
+    """
+    Index of Python symbols by name and qualified name.
+
+    Example usage:
+        index = SymbolIndex("path/to/project")
+        index.add_file("path/to/project/pipeline/pipeline.py")
+        for symbol in index.lookup("Pipeline.modify_chat_history"):
+            print(index.source(symbol))
+    """
+
+    # Backticked, dotted and called names, and names that are not ordinary words:
+    # snake_case, _private and CamelCase with a capital after the first letter.
+    # A capitalized word like 'Pipeline' may start a sentence, so it only matches in backticks.
+    _CANDIDATE_PATTERN = re.compile(
+        r"`([A-Za-z_][\w.]*)`"
+        r"|\b([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+)\b"
+        r"|\b([A-Za-z_]\w*)\("
+        r"|\b([A-Za-z]\w*_\w+|_\w+|[A-Z][a-z0-9]+[A-Z]\w*|[A-Z]{2,}[a-z]\w*)\b"
+    )
+
+    def __init__(self, root_path: str = None):
+        """
+        Initializes the SymbolIndex.
+        params: root_path: The directory module names are computed from.
+        """
+        self.root_path = root_path
+        self.files = {}
+        self._by_name = {}
+
+
+    def module_name(self, file_path: str) -> str:
+        """
+        Computes the dotted module name of a file.
+        params: file_path: The path to the file.
+        returns: The module name, e.g. 'pipeline.rag.py_rag'.
+        """
+        root = self.root_path if self.root_path and os.path.isdir(self.root_path) else os.path.dirname(file_path)
+        relative = os.path.relpath(file_path, root)
+        parts = os.path.splitext(relative)[0].replace(os.sep, "/").split("/")
+        if parts[-1] == "__init__" and len(parts) > 1:
+            parts.pop()
+        return ".".join(part for part in parts if part not in (".", ".."))
+
+
+    @staticmethod
+    def parse(file_path: str, module: str, source: str = None) -> list:
+        """
+        Parses the symbols of a Python file.
+        params: file_path: The path to the file.
+        params: module: The module name of the file.
+        params: source: The source code, read from the file if None.
+        returns: A list of symbols, the module itself first. Empty if the file does not parse.
+        """
+        if source is None:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                source = file.read()
+        try:
+            tree = ast.parse(source, filename=file_path)
+        except (SyntaxError, ValueError) as e:
+            logger.warning("Skipping symbols of %s: %s", file_path, e)
+            return []
+
+        visitor = _SymbolVisitor(module, file_path)
+        visitor.visit(tree)
+        module_symbol = {
+            "name": module.rsplit(".", 1)[-1],
+            "qualname": module,
+            "module": module,
+            "kind": "module",
+            "file": file_path,
+            "start": 1,
+            "end": max(len(source.splitlines()), 1),
+            "calls": []
+        }
+        return [module_symbol] + visitor.symbols
+
+
+    def add_file(self, file_path: str, source: str = None) -> list:
+        """
+        Parses a file and adds its symbols, replacing earlier symbols of the file.
+        params: file_path: The path to the file.
+        params: source: The source code, read from the file if None.
+        returns: The symbols of the file.
+        """
+        return self.add_symbols(file_path, self.parse(file_path, self.module_name(file_path), source))
+
+
+    def add_symbols(self, file_path: str, symbols: list) -> list:
+        """
+        Adds parsed symbols of a file, replacing earlier symbols of the file.
+        params: file_path: The path to the file.
+        params: symbols: The symbols as returned by parse.
+        returns: The symbols.
+        """
+        self.remove_file(file_path)
+        self.files[file_path] = symbols
+        for symbol in symbols:
+            for key in self._keys(symbol):
+                self._by_name.setdefault(key, []).append(symbol)
+        return symbols
+
+
+    def remove_file(self, file_path: str) -> None:
+        """
+        Removes the symbols of a file.
+        params: file_path: The path to the file.
+        """
+        for symbol in self.files.pop(file_path, []):
+            for key in self._keys(symbol):
+                entries = self._by_name.get(key, [])
+                if symbol in entries:
+                    entries.remove(symbol)
+                if not entries:
+                    self._by_name.pop(key, None)
+
+
+    @staticmethod
+    def _keys(symbol: dict) -> set:
+        """
+        The names a symbol can be looked up by: its name, every dotted suffix of
+        its qualified name, and its name qualified with the module.
+        """
+        parts = symbol["qualname"].split(".")
+        keys = {".".join(parts[i:]) for i in range(len(parts))}
+        if symbol["kind"] != "module":
+            keys.add(f"{symbol['module']}.{symbol['qualname']}")
+        return keys
+
+
+    def lookup(self, name: str) -> list:
+        """
+        Looks up the symbols with a name or a qualified name.
+        params: name: e.g. 'modify_chat_history', 'Pipeline.modify_chat_history'
+                      or 'pipeline.pipeline.Pipeline.modify_chat_history'.
+        returns: A list of symbols.
+        """
+        return list(self._by_name.get(name, []))
+
+
+    def callers(self, name: str) -> list:
+        """
+        Finds the functions and methods calling a name.
+        params: name: The called name, e.g. 'invoke'.
+        returns: A list of symbols.
+        """
+        name = name.rsplit(".", 1)[-1]
+        return [
+            symbol
+            for symbols in self.files.values()
+            for symbol in symbols
+            if name in symbol["calls"]
+        ]
+
+
+    def find_in_text(self, text: str) -> list:
+        """
+        Finds the symbols named in a question. Qualified names are preferred, so
+        'Pipeline.invoke' does not also match every other 'invoke'. Plain words only match
+        when they cannot be prose, see _CANDIDATE_PATTERN.
+        params: text: The question.
+        returns: A list of symbols, empty if the text names no known symbol.
+        """
+        candidates = []
+        for match in self._CANDIDATE_PATTERN.finditer(text):
+            name = next(group for group in match.groups() if group).strip(".")
+            if name not in candidates:
+                candidates.append(name)
+
+        found = []
+        for name in sorted(candidates, key=lambda name: -name.count(".")):
+            if any(name in self._keys(symbol) for symbol in found):
+                continue
+            for symbol in self.lookup(name):
+                if symbol not in found:
+                    found.append(symbol)
+        return found
+
+
+    @staticmethod
+    def source(symbol: dict) -> str:
+        """
+        Reads the source span of a symbol.
+        params: symbol: The symbol.
+        returns: The source lines from start to end.
+        """
+        with open(symbol["file"], 'r', encoding='utf-8', errors='replace') as file:
+            lines = file.readlines()
+        return "".join(lines[symbol["start"] - 1:symbol["end"]])
+
+
+    def save(self, file_path: str) -> None:
+        """
+        Writes the index to a JSON file.
+        params: file_path: The path to the JSON file.
+        """
+        descriptor, temp_path = FileUtils.temp_file(file_path)
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump({"root_path": self.root_path, "files": self.files}, file)
+            FileUtils.replace_file(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+    @classmethod
+    def load(cls, file_path: str) -> "SymbolIndex":
+        """
+        Reads an index written by save.
+        params: file_path: The path to the JSON file.
+        returns: The SymbolIndex.
+        """
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        index = cls(data.get("root_path"))
+        for path, symbols in data.get("files", {}).items():
+            index.add_symbols(path, symbols)
+        return index
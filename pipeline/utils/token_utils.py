@@ -0,0 +1,115 @@
+"""
+This module contains the TokenCounter class.
+It measures text in tokens of a chosen tokenizer so chunks can be sized
+by what the model actually consumes instead of by characters.
+"""
+import math
+import re
+import statistics
+from .logger import logger
+
+
+class TokenCounter:
+    """
+    Counts tokens with a tiktoken encoding, or with a fast approximation
+    when tiktoken or the requested encoding is not available.
+    """
+
+    APPROXIMATE = "approximate"
+
+    # Latin words, digit runs, single non-ASCII characters and single symbols
+    _APPROX_PATTERN = re.compile(r"([A-Za-z]+)|(\d+)|([^\x00-\x7F])|[^\sA-Za-z\d]")
+
+    def __init__(self, tokenizer: str = None):
+        """
+        Initializes the TokenCounter.
+        params: tokenizer: A tiktoken encoding (e.g. 'cl100k_base') or model name (e.g. 'gpt-4o').
+                           None or 'approximate' selects the approximate counter.
+        """
+        self.tokenizer = tokenizer or self.APPROXIMATE
+        self._encoding = None
+
+        if self.tokenizer != self.APPROXIMATE:
+            self._encoding = self._load_encoding(self.tokenizer)
+            if self._encoding is None:
+                self.tokenizer = self.APPROXIMATE
+
+
+    @staticmethod
+    def _load_encoding(tokenizer: str):
+        """
+        Loads a tiktoken encoding by encoding name or model name.
+        params: tokenizer: The encoding or model name.
+        returns: The encoding, or None if it could not be loaded.
+        """
+        try:
+            import tiktoken
+        except ImportError:
+            logger.warning("tiktoken is not installed. Falling back to approximate token counts.")
+            return None
+
+        try:
+            try:
+                return tiktoken.encoding_for_model(tokenizer)
+            except KeyError:
+                return tiktoken.get_encoding(tokenizer)
+        except Exception as e:
+            logger.warning(
+                "Could not load tokenizer '%s': %s. Falling back to approximate token counts.",
+                tokenizer,
+                e
+            )
+            return None
+
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens in the text.
+        params: text: The text to measure.
+        returns: The number of tokens.
+        """
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return self.approximate_count(text)
+
+
+    @staticmethod
+    def approximate_count(text: str) -> int:
+        """
+        Approximates the token count of BPE tokenizers without encoding the text.
+        Latin words count one token per four letters, digits one per three,
+        and every non-ASCII character or symbol one token.
+        params: text: The text to measure.
+        returns: The approximate number of tokens.
+        """
+        tokens = 0
+        for match in TokenCounter._APPROX_PATTERN.finditer(text):
+            if match.lastindex == 1:
+                tokens += math.ceil(len(match.group(1)) / 4)
+            elif match.lastindex == 2:
+                tokens += math.ceil(len(match.group(2)) / 3)
+            else:
+                tokens += 1
+        return tokens
+
+
+    @staticmethod
+    def describe(sizes: list) -> dict:
+        """
+        Summarizes the distribution of chunk sizes.
+        params: sizes: The sizes of the chunks.
+        returns: A dictionary with count, total, min, max, mean, p50 and p95.
+        """
+        if not sizes:
+            return {"count": 0, "total": 0, "min": 0, "max": 0, "mean": 0, "p50": 0, "p95": 0}
+
+        ordered = sorted(sizes)
+        return {
+            "count": len(ordered),
+            "total": sum(ordered),
+            "min": ordered[0],
+            "max": ordered[-1],
+            "mean": round(statistics.fmean(ordered), 1),
+            "p50": ordered[(len(ordered) - 1) // 2],
+            "p95": ordered[math.ceil(0.95 * len(ordered)) - 1],
+        }
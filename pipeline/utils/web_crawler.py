@@ -0,0 +1,349 @@
+"""
+This module contains the WebCrawler and HttpCache classes.
+The crawler fetches pages concurrently over a pooled HTTP client, follows links
+within depth and domain limits, and revalidates cached pages with ETag and
+Last-Modified so re-crawls only download pages that changed.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag, urljoin, urlparse
+import aiohttp
+from bs4 import BeautifulSoup
+from ..config import CACHE_DIR
+from .file_utils import FileUtils
+from .logger import logger
+
+
+class HttpCache:
+    """
+    On-disk cache of HTTP responses with their validators.
+    Every URL is stored as '<sha256>.json' (headers) and '<sha256>.body' (content).
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Initializes the HttpCache.
+        params: cache_dir: The directory of the cache.
+        """
+        self.cache_dir = str(cache_dir or CACHE_DIR / "web")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+    def _path(self, url: str, suffix: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+
+    def get(self, url: str) -> dict:
+        """
+        Gets the cached entry of a URL.
+        params: url: The URL.
+        returns: A dictionary with 'etag', 'last_modified', 'content_type' and 'body', or None.
+        """
+        try:
+            with open(self._path(url, ".json"), 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            with open(self._path(url, ".body"), 'rb') as file:
+                entry["body"] = file.read()
+            return entry
+        except (OSError, json.JSONDecodeError):
+            return None
+
+
+    def headers(self, url: str) -> dict:
+        """
+        Builds the conditional request headers for a cached URL.
+        params: url: The URL.
+        returns: A dictionary of If-None-Match and If-Modified-Since headers.
+        """
+        try:
+            with open(self._path(url, ".json"), 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+    def put(self, url: str, body: bytes, etag: str = None, last_modified: str = None, content_type: str = None):
+        """
+        Stores a response that carries at least one validator.
+        params: url: The URL.
+        params: body: The content.
+        params: etag: The ETag header.
+        params: last_modified: The Last-Modified header.
+        params: content_type: The Content-Type header.
+        """
+        if not etag and not last_modified:
+            return
+
+        entry = {"url": url, "etag": etag, "last_modified": last_modified, "content_type": content_type}
+        for suffix, data, mode in ((".body", body, 'wb'), (".json", json.dumps(entry), 'w')):
+            path = self._path(url, suffix)
+            temp_path = None
+            try:
+                descriptor, temp_path = FileUtils.temp_file(path)
+                with os.fdopen(descriptor, mode, **({} if 'b' in mode else {"encoding": 'utf-8'})) as file:
+                    file.write(data)
+                FileUtils.replace_file(temp_path, path)
+            except OSError as e:
+                logger.warning("Could not cache %s: %s", url, e)
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return
+
+
+    def remove(self, url: str):
+        """
+        Removes the cached entry of a URL.
+        params: url: The URL.
+        """
+        for suffix in (".json", ".body"):
+            try:
+                os.remove(self._path(url, suffix))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not remove the cached %s: %s", url, e)
+
+
+class WebCrawler:
+    """
+    Asynchronous crawler with a pooled HTTP client, per-host concurrency caps
+    and politeness delays.
+
+    Example usage:
+        crawler = WebCrawler(max_depth=2, max_pages=200, delay=0.5)
+        pages = crawler.crawl(["https://docs.example.com/"])
+    """
+
+    def __init__(
+        self,
+        max_depth: int = 1,
+        max_pages: int = 100,
+        allowed_domains=None,
+        max_connections: int = 20,
+        per_host: int = 4,
+        delay: float = 0.0,
+        timeout: float = 30.0,
+        cache=None,
+        user_agent: str = "pipeline-crawler/1.0"
+    ):
+        """
+        Initializes the WebCrawler.
+        params: max_depth: The number of links followed from the start URLs. 0 fetches only the start URLs.
+        params: max_pages: The maximum number of pages fetched.
+        params: allowed_domains: The domains links may lead to. Defaults to the domains of the start URLs.
+        params: max_connections: The size of the connection pool.
+        params: per_host: The maximum number of concurrent requests to one host.
+        params: delay: The minimum number of seconds between two requests to one host.
+        params: timeout: The timeout of a request in seconds.
+        params: cache: An HttpCache, False to disable caching, or None for the default cache.
+        params: user_agent: The User-Agent header.
+        """
+        if max_depth < 0 or max_pages <= 0:
+            raise ValueError("max_depth must be 0 or greater and max_pages greater than 0")
+        if max_connections <= 0 or per_host <= 0:
+            raise ValueError("max_connections and per_host must be greater than 0")
+
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.allowed_domains = list(allowed_domains) if allowed_domains else None
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.delay = delay
+        self.timeout = timeout
+        self.cache = HttpCache() if cache is None else cache or None
+        self.user_agent = user_agent
+        self.stats = {"fetched": 0, "not_modified": 0, "failed": 0}
+
+
+    def crawl(self, start_urls) -> list:
+        """
+        Crawls from the start URLs. Inside a running event loop, await crawl_async instead.
+        params: start_urls: A URL or a list of URLs.
+        returns: A list of pages, see crawl_async.
+        """
+        return self.run(self.crawl_async(start_urls))
+
+
+    @staticmethod
+    def run(coroutine):
+        """
+        Runs a coroutine to completion from synchronous code. asyncio.run is only used when
+        no event loop is running in this thread, e.g. not in a notebook or an async server.
+        Otherwise the coroutine runs in its own loop in a worker thread, and this call blocks.
+        params: coroutine: The coroutine.
+        returns: The result of the coroutine.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+
+    async def crawl_async(self, start_urls) -> list:
+        """
+        Crawls from the start URLs.
+        params: start_urls: A URL or a list of URLs.
+        returns: A list of pages in fetch order. Every page is a dictionary with
+                 'url', 'status', 'content_type', 'body' (bytes), 'depth' and 'from_cache'.
+        """
+        if isinstance(start_urls, str):
+            start_urls = [start_urls]
+
+        domains = self.allowed_domains or [urlparse(url).hostname for url in start_urls]
+        self.stats = {"fetched": 0, "not_modified": 0, "failed": 0}
+        started = time.monotonic()
+
+        queue = asyncio.Queue()
+        seen = set()
+        pages = []
+        host_limits = {}
+        host_next_request = {}
+
+        def schedule(url, depth):
+            url = urldefrag(url)[0]
+            parsed = urlparse(url)
+            if parsed.scheme not in ("http", "https") or url in seen or len(seen) >= self.max_pages:
+                return
+            host = parsed.hostname or ""
+            if not any(host == domain or host.endswith(f".{domain}") for domain in domains):
+                return
+            seen.add(url)
+            queue.put_nowait((url, depth))
+
+        async def polite(host):
+            # Reserves the next request slot of the host and waits for it
+            now = time.monotonic()
+            slot = max(now, host_next_request.get(host, now))
+            host_next_request[host] = slot + self.delay
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+        async def worker(session):
+            while True:
+                url, depth = await queue.get()
+                try:
+                    host = urlparse(url).hostname
+                    limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+                    async with limit:
+                        await polite(host)
+                        page = await self._fetch(session, url)
+                    if page:
+                        page["depth"] = depth
+                        pages.append(page)
+                        if depth < self.max_depth and "html" in (page["content_type"] or ""):
+                            for link in self.extract_links(url, page["body"]):
+                                schedule(link, depth + 1)
+                except Exception as e:
+                    logger.error("Error crawling %s: %s", url, e)
+                    self.stats["failed"] += 1
+                finally:
+                    queue.task_done()
+
+        for url in start_urls:
+            schedule(url, 0)
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": self.user_agent}
+        ) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(self.max_connections)]
+            await queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        logger.info(
+            "Crawled %s pages in %.2fs (%s downloaded, %s not modified, %s failed).",
+            len(pages),
+            time.monotonic() - started,
+            self.stats["fetched"],
+            self.stats["not_modified"],
+            self.stats["failed"]
+        )
+        return pages
+
+
+    async def _fetch(self, session, url: str) -> dict:
+        """
+        Fetches a page, revalidating the cached copy if there is one.
+        params: session: The aiohttp session.
+        params: url: The URL.
+        returns: The page, or None if the request failed.
+        """
+        headers = self.cache.headers(url) if self.cache else {}
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and self.cache:
+                    cached = self.cache.get(url)
+                    if cached is not None:
+                        self.stats["not_modified"] += 1
+                        return {
+                            "url": url,
+                            "status": 200,
+                            "content_type": cached.get("content_type"),
+                            "body": cached["body"],
+                            "from_cache": True
+                        }
+                    if headers:
+                        # The cached body is gone, so the page is fetched again without validators
+                        self.cache.remove(url)
+                        response.release()
+                        return await self._fetch(session, url)
+
+                if response.status >= 400:
+                    logger.warning("Fetching %s failed with status %s.", url, response.status)
+                    self.stats["failed"] += 1
+                    return None
+
+                body = await response.read()
+                content_type = response.headers.get("Content-Type")
+                if self.cache:
+                    self.cache.put(
+                        url,
+                        body,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                        content_type=content_type
+                    )
+                self.stats["fetched"] += 1
+                return {
+                    "url": url,
+                    "status": response.status,
+                    "content_type": content_type,
+                    "body": body,
+                    "from_cache": False
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Fetching %s failed: %s", url, e)
+            self.stats["failed"] += 1
+            return None
+
+
+    @staticmethod
+    def extract_links(base_url: str, body: bytes) -> list:
+        """
+        Extracts the absolute links of a HTML page.
+        params: base_url: The URL of the page.
+        params: body: The HTML.
+        returns: A list of URLs without fragments.
+        """
+        soup = BeautifulSoup(body, "html.parser")
+        base = soup.find("base", href=True)
+        base_url = urljoin(base_url, base["href"]) if base else base_url
+        return [urldefrag(urljoin(base_url, anchor["href"]))[0] for anchor in soup.find_all("a", href=True)]
@@ -0,0 +1,159 @@
+"""
+This module contains the CaptionLedger class.
+It records the caption download status of every video in a SQLite database,
+so repeated playlist runs skip finished videos without starting yt-dlp.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+class CaptionLedger:
+    """
+    Persistent video id -> status, title and caption path ledger.
+    The ledger is safe to use from the worker threads of a playlist download.
+    """
+
+    DONE = "done"
+    NO_CAPTIONS = "no_captions"
+    FAILED = "failed"
+
+    def __init__(self, db_path):
+        """
+        Initializes the CaptionLedger.
+        Args:
+            db_path (str): The path to the SQLite database.
+        """
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS captions (
+                    video_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    title TEXT,
+                    caption_path TEXT,
+                    subtitle_path TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(captions)")]
+            if 'subtitle_path' not in columns:
+                self._connection.execute("ALTER TABLE captions ADD COLUMN subtitle_path TEXT")
+            if 'attempts' not in columns:
+                self._connection.execute("ALTER TABLE captions ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    @staticmethod
+    def video_id_from_url(video_url):
+        """
+        Extract the video id from a YouTube URL without contacting YouTube.
+        Args:
+            video_url (str): A watch, youtu.be, shorts, embed or live URL.
+        Returns:
+            str: The video id, or None if the URL does not contain one.
+        """
+        parsed = urlparse(video_url)
+        host = (parsed.hostname or "").lower()
+        if host == "youtu.be":
+            return parsed.path.strip("/").split("/")[0] or None
+        if host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+            video_ids = parse_qs(parsed.query).get("v")
+            if video_ids:
+                return video_ids[0]
+            parts = parsed.path.strip("/").split("/")
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                return parts[1]
+        return None
+
+    def get(self, video_id):
+        """
+        Get the ledger entry of a video.
+        Args:
+            video_id (str): The video id.
+        Returns:
+            dict: The entry with status, title, caption_path, subtitle_path, error, attempts and updated_at, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM captions WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, video_id, status, title=None, caption_path=None, error=None, subtitle_path=None):
+        """
+        Record the outcome of a download.
+        attempts counts the failed downloads in a row and is reset by any other outcome.
+        Args:
+            video_id (str): The video id.
+            status (str): DONE, NO_CAPTIONS or FAILED.
+            title (str): The video title.
+            caption_path (str): The path of the cleaned caption file.
+            error (str): The error message of a failed download.
+            subtitle_path (str): The path of the VTT file, if it was kept.
+        """
+        if status not in (self.DONE, self.NO_CAPTIONS, self.FAILED):
+            raise ValueError(f"Invalid status: {status}")
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO captions
+                (video_id, status, title, caption_path, subtitle_path, error, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    status = excluded.status,
+                    title = COALESCE(excluded.title, captions.title),
+                    caption_path = excluded.caption_path,
+                    subtitle_path = excluded.subtitle_path,
+                    error = excluded.error,
+                    attempts = CASE WHEN excluded.status = ? THEN captions.attempts + 1 ELSE 0 END,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    video_id, status, title, caption_path, subtitle_path, error,
+                    1 if status == self.FAILED else 0, time.time(), self.FAILED
+                )
+            )
+
+    def finished_path(self, video_id):
+        """
+        Get the caption path of a finished video whose caption file still exists.
+        Args:
+            video_id (str): The video id.
+        Returns:
+            str: The caption path, or None.
+        """
+        entry = self.get(video_id)
+        if entry and entry["status"] == self.DONE and entry["caption_path"] \
+                and os.path.exists(entry["caption_path"]):
+            return entry["caption_path"]
+        return None
+
+    def summary(self):
+        """
+        Count the videos per status.
+        Returns:
+            dict: A dictionary of status to number of videos.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM captions GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,251 @@
+"""
+This module contains the VttParser class.
+It reads WebVTT captions line by line and yields timestamped text segments,
+so captions of any length are parsed in constant memory and keep their timing.
+"""
+
+import re
+from langchain_core.documents import Document
+
+
+class VttParser:
+    """
+    Streaming WebVTT parser.
+
+    Example usage:
+        for start, end, text in VttParser.parse_file("video.en.vtt"):
+            print(f"{start:.1f}-{end:.1f}: {text}")
+    """
+
+    CUE_TIMING = re.compile(
+        r'^((?:\d+:)?\d{2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}\.\d{3})'
+    )
+    INLINE_TIMESTAMP = re.compile(r'<(?:\d+:)?\d{2}:\d{2}\.\d{3}>')
+    TAG = re.compile(r'</?[a-zA-Z][^>]*>')
+    ENTITIES = (('&lt;', '<'), ('&gt;', '>'), ('&nbsp;', ' '), ('&lrm;', ''), ('&rlm;', ''), ('&amp;', '&'))
+
+    @staticmethod
+    def parse_timestamp(timestamp):
+        """
+        Convert a VTT timestamp into seconds.
+        Args:
+            timestamp (str): A timestamp like '01:02:03.500' or '02:03.500'.
+        Returns:
+            float: The number of seconds.
+        """
+        seconds = 0.0
+        for part in timestamp.split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+
+    @staticmethod
+    def format_timestamp(seconds):
+        """
+        Format seconds as HH:MM:SS.
+        Args:
+            seconds (float): The number of seconds.
+        Returns:
+            str: The formatted time.
+        """
+        seconds = int(seconds)
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    @classmethod
+    def clean_text(cls, line):
+        """
+        Remove inline timestamps, formatting tags and entities from a cue text line.
+        Args:
+            line (str): The cue text line.
+        Returns:
+            str: The plain text.
+        """
+        if '<' in line:
+            line = cls.TAG.sub('', cls.INLINE_TIMESTAMP.sub('', line))
+        if '&' in line:
+            for entity, char in cls.ENTITIES:
+                line = line.replace(entity, char)
+        return line.strip()
+
+    @classmethod
+    def iter_segments(cls, lines):
+        """
+        Parse VTT lines into segments. Header, NOTE, STYLE and REGION blocks and cue
+        identifiers are skipped, and the text lines of a cue are joined with newlines.
+        Args:
+            lines (iterable): The lines of a VTT file, e.g. an open file.
+        Yields:
+            tuple: (start, end, text) with start and end in seconds.
+        """
+        # cue_lines is None outside of a cue
+        cue_start = cue_end = cue_lines = None
+        for line in lines:
+            line = line.rstrip('\r\n')
+
+            # Only an empty line ends a cue, auto-generated cues start with a ' ' line
+            if not line:
+                if cue_lines:
+                    yield cue_start, cue_end, '\n'.join(cue_lines)
+                cue_lines = None
+                continue
+
+            if cue_lines is not None:
+                text = cls.clean_text(line)
+                if text:
+                    cue_lines.append(text)
+                continue
+
+            # Outside of cues only timing lines matter. Header, NOTE, STYLE and
+            # REGION blocks and cue identifiers never contain '-->'.
+            timing = cls.CUE_TIMING.match(line)
+            if timing:
+                cue_start = cls.parse_timestamp(timing.group(1))
+                cue_end = cls.parse_timestamp(timing.group(2))
+                cue_lines = []
+
+        if cue_lines:
+            yield cue_start, cue_end, '\n'.join(cue_lines)
+
+    @staticmethod
+    def drop_repeated_lines(segments):
+        """
+        Drop cue lines that repeat the line before them. Auto-generated captions
+        show every line twice, once as new text and once as context in the next cue.
+        Args:
+            segments (iterable): (start, end, text) segments.
+        Yields:
+            tuple: (start, end, text) segments with only their new lines.
+        """
+        previous = None
+        for start, end, text in segments:
+            lines = []
+            for line in text.split('\n'):
+                if line != previous:
+                    lines.append(line)
+                    previous = line
+            if lines:
+                yield start, end, '\n'.join(lines)
+
+    @staticmethod
+    def overlap_length(tail, words):
+        """
+        Find the longest suffix of tail that is a prefix of words, in linear time.
+        The prefix function of 'words + separator + tail' ends with the length of that overlap.
+        Args:
+            tail (list): The last words already emitted.
+            words (list): The words of the next cue.
+        Returns:
+            int: The number of leading words of words that repeat the end of tail.
+        """
+        tail = tail[-len(words):] if words else []
+        sequence = words + [None] + tail
+        prefix = [0] * len(sequence)
+        for i in range(1, len(sequence)):
+            k = prefix[i - 1]
+            while k and sequence[i] != sequence[k]:
+                k = prefix[k - 1]
+            if sequence[i] == sequence[k]:
+                k += 1
+            prefix[i] = k
+        return prefix[-1] if tail else 0
+
+    @classmethod
+    def merge_overlaps(cls, segments, min_words=3, window=200):
+        """
+        Remove the text a cue repeats from the cues before it. Auto-generated captions roll:
+        every line reappears as the first line of the next cue, and some cues repeat a phrase
+        with a shifting prefix and suffix. Only the new words of every cue are kept, with its
+        line breaks. Phrases that were spoken twice are kept: a short overlap is only removed
+        when it covers the whole last line of the previous cue or crosses its line break.
+        Args:
+            segments (iterable): (start, end, text) segments.
+            min_words (int): The shortest overlap removed when it lies within the last line
+                             of the previous cue. Overlaps covering that line need two words.
+            window (int): The number of emitted words an overlap is searched in.
+        Yields:
+            tuple: (start, end, text) segments with only their new text.
+        """
+        tail = []
+        previous_lines = []
+        for start, end, text in segments:
+            lines = [line.split() for line in text.split('\n')]
+            words = [word for line in lines for word in line]
+            repeated = next(
+                (count for count in range(min(len(lines), len(previous_lines)), 0, -1)
+                 if lines[:count] == previous_lines[-count:]),
+                0
+            )
+            overlap = sum(len(line) for line in lines[:repeated])
+            if not overlap and previous_lines:
+                overlap = cls.overlap_length(tail, words)
+                covers_line = overlap >= len(previous_lines[-1])
+                if overlap < (2 if covers_line else min_words):
+                    overlap = 0
+
+            new_lines = []
+            skip = overlap
+            for line in lines:
+                if skip >= len(line):
+                    skip -= len(line)
+                    continue
+                new_lines.append(' '.join(line[skip:]))
+                skip = 0
+
+            tail = (tail + words[overlap:])[-window:]
+            previous_lines = lines
+            if new_lines:
+                yield start, end, '\n'.join(new_lines)
+
+    @classmethod
+    def parse_file(cls, file_path):
+        """
+        Parse a VTT file into segments without reading it into memory at once.
+        Args:
+            file_path (str): The path to the VTT file.
+        Yields:
+            tuple: (start, end, text) with start and end in seconds.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from cls.iter_segments(f)
+
+    @classmethod
+    def to_documents(cls, segments, metadata=None, max_chars=1000):
+        """
+        Group consecutive segments into documents with time metadata.
+        Args:
+            segments (iterable): (start, end, text) segments.
+            metadata (dict): Metadata added to every document, e.g. source and title.
+                             A 'source' URL gets a '&t=' or '?t=' link to the start time as 'timestamp_url'.
+            max_chars (int): The maximum length of a document. A longer segment becomes a document of its own.
+        Yields:
+            Document: Documents with 'start', 'end' (seconds) and 'start_time' (HH:MM:SS) metadata.
+                      The lines of the segments are joined with spaces.
+        """
+        metadata = metadata or {}
+        texts, start, end, length = [], None, None, 0
+        for segment_start, segment_end, text in segments:
+            if texts and length + len(text) + 1 > max_chars:
+                yield cls._document(texts, start, end, metadata)
+                texts, length = [], 0
+            if not texts:
+                start = segment_start
+            text = text.replace('\n', ' ')
+            texts.append(text)
+            end = segment_end
+            length += len(text) + 1
+
+        if texts:
+            yield cls._document(texts, start, end, metadata)
+
+    @classmethod
+    def _document(cls, texts, start, end, metadata):
+        document_metadata = dict(metadata)
+        document_metadata.update({
+            'start': start,
+            'end': end,
+            'start_time': cls.format_timestamp(start),
+        })
+        source = metadata.get('source')
+        if isinstance(source, str) and source.startswith('http'):
+            separator = '&' if '?' in source else '?'
+            document_metadata['timestamp_url'] = f"{source}{separator}t={int(start)}s"
+        return Document(page_content=' '.join(texts), metadata=document_metadata)
@@ -11,39 +11,62 @@ formatting tags, and metadata lines. The cleaned subtitles are saved as text fil
 
 2. **Cleaning Subtitles method**:
    - Takes subtitle_content as input, which is the raw subtitle text.
-   - Splits the subtitle content into lines and processes each line to remove unwanted parts:
-     - Skips lines that are either the 'WEBVTT' header, timestamp lines, or alignment information.
-     - Removes timestamp tags and formatting tags (`<c>` and `</c>`).
+   - Parses it with `VttParser` into timestamped cue segments:
+     - Skips the 'WEBVTT' header, NOTE/STYLE/REGION blocks, cue identifiers and timing lines.
+     - Removes inline timestamp tags, formatting tags (`<c>` and `</c>`) and HTML entities.
      - Strips leading and trailing whitespace from each line.
-     - Ensures no duplicate consecutive lines are added to the cleaned list.
-   - Removes metadata lines if they exist at the beginning.
-   - Joins the cleaned lines into a single string, ensuring no more than two consecutive newlines.
-   - Returns the cleaned subtitle text.
+     - Removes the words each rolling cue repeats from the end of the cues before it.
+   - Returns the cleaned subtitle text. `clean_subtitle_file` does the same for a file, line by line.
+   - `caption_documents` keeps the timing and returns documents with start/end times and a
+     timestamped URL, so answers can link to the moment in the video.
 
 3. **Downloading Captions**:
    - Takes a video_url as input.
-   - Uses the `yt-dlp` command-line tool to fetch video information in JSON format.
-   - Extracts the video ID and title from the fetched information.
-   - Sanitizes the video title to create a safe filename.
-   - Constructs an output template path using the video ID and sanitized title.
-   - Uses `yt-dlp` again to download the auto-generated subtitles in VTT format, saving them to the specified output directory.
+   - Looks the video ID up in the SQLite caption ledger and returns finished captions without running `yt-dlp`.
+   - Uses a single `yt-dlp` call to fetch the video information in JSON format and download the
+     auto-generated subtitles in VTT format to the specified output directory.
+   - Locates the subtitle file from the requested subtitles in the video information.
+   - Sanitizes the video title to create a safe filename for the cleaned captions.
+   - Records the outcome in the ledger.
+
+4. **Streaming Playlists**:
+   - `stream_playlist` and `stream_videos` turn the captions of every video into documents as soon as they
+     are cleaned and pass them through a bounded queue to embedding workers, e.g. `rag.store_chunks`.
+   - The number of download and embedding workers and the queue size are configurable.
 
 In summary, this class provides functionality to download subtitles from YouTube videos and clean them for better readability.
 """
 
 import os
+import queue
 import subprocess
 import json
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import re
 from pipeline.logger import logger
+from pipeline.ytdpl.caption_ledger import CaptionLedger
+from pipeline.ytdpl.vtt_parser import VttParser
 
 class YouTubeCaptionDownloader:
     """
     A class to download and clean subtitles from YouTube videos.
     """
-    def __init__(self, output_dir = "/app/yt"):
+    def __init__(self, output_dir = "/app/yt", ledger_path=None, keep_vtt=False, max_attempts=3, retry_backoff=300.0):
+        """
+        Args:
+            output_dir (str): The directory the captions are saved to.
+            ledger_path (str): The SQLite ledger of downloaded videos. Defaults to captions.sqlite3 in output_dir.
+            keep_vtt (bool): Keep the timestamped VTT files after cleaning.
+            max_attempts (int): The number of failed downloads of a video before it is skipped.
+            retry_backoff (float): The seconds to wait before retrying a failed video, doubled after every failure.
+        """
         self.output_dir = output_dir
+        self.keep_vtt = keep_vtt
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.ledger = CaptionLedger(ledger_path or os.path.join(self.output_dir, 'captions.sqlite3'))
 
     def clean_subtitle(self, subtitle_content):
         """
@@ -53,89 +76,123 @@ class YouTubeCaptionDownloader:
         Returns:
             str: The cleaned subtitle text.
         """
-        lines = subtitle_content.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            if line == 'WEBVTT' or re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}', line) or 'align:start position:0%' in line:
-                continue
-            line = re.sub(r'<\d{2}:\d{2}:\d{2}\.\d{3}>', '', line)
-            line = re.sub(r'</?c>', '', line)
-            line = line.strip()
-            if line and (not cleaned_lines or line != cleaned_lines[-1]):
-                cleaned_lines.append(line)
-
-        if cleaned_lines and cleaned_lines[0].startswith('Kind:'):
-            cleaned_lines = cleaned_lines[2:]
-
-        cleaned_text = re.sub(r'\n{3,}', '\n\n', '\n'.join(cleaned_lines)).strip()
-        return cleaned_text
-
-    def download_captions(self, video_url):
+        segments = VttParser.merge_overlaps(VttParser.iter_segments(subtitle_content.splitlines()))
+        return '\n'.join(text for _, _, text in segments)
+
+    def clean_subtitle_file(self, subtitle_path, txt_path):
+        """
+        Clean a VTT file into a text file line by line, without reading it into memory.
+        Args:
+            subtitle_path (str): The path to the VTT file.
+            txt_path (str): The path to the cleaned text file.
+        """
+        segments = VttParser.merge_overlaps(VttParser.parse_file(subtitle_path))
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            for i, (_, _, text) in enumerate(segments):
+                f.write(f"\n{text}" if i else text)
+
+    def caption_documents(self, video_url, max_chars=1000, retry_failed=False):
+        """
+        Get the captions of a video as documents with time metadata.
+        The VTT file is kept after the download so the timing is available.
+        Args:
+            video_url (str): The URL of the YouTube video.
+            max_chars (int): The maximum length of a document.
+            retry_failed (bool): See download_captions.
+        Returns:
+            list: Documents with source, title, video_id, start, end, start_time and timestamp_url metadata,
+                  empty if the video has no captions.
+        """
+        if not self.download_captions(video_url, retry_failed=retry_failed, keep_vtt=True):
+            return []
+
+        video_id = self.ledger.video_id_from_url(video_url)
+        entry = self.ledger.get(video_id) if video_id else None
+        if not entry or not entry["subtitle_path"]:
+            return []
+
+        metadata = {
+            'source': f'https://www.youtube.com/watch?v={video_id}',
+            'title': entry['title'],
+            'video_id': video_id,
+        }
+        segments = VttParser.merge_overlaps(VttParser.parse_file(entry["subtitle_path"]))
+        return list(VttParser.to_documents(segments, metadata, max_chars=max_chars))
+
+    def download_captions(self, video_url, retry_failed=False, keep_vtt=None):
         """
         Download and clean the captions for a YouTube video.
+        The ledger is consulted first, so finished videos cost no yt-dlp call.
+        Metadata and subtitles are fetched with a single yt-dlp invocation.
         Args:
             video_url (str): The URL of the YouTube video.
+            retry_failed (bool): Try again videos that had no captions, and failed videos
+                                 before their backoff ends or after max_attempts.
+                                 Otherwise failed videos are retried with a backoff.
+            keep_vtt (bool): Keep the VTT file next to the cleaned text. Defaults to self.keep_vtt.
         Returns:
             str: The path to the saved text file with cleaned captions, or None if captions were not downloaded.
         """
+        keep_vtt = self.keep_vtt if keep_vtt is None else keep_vtt
+        video_id = self.ledger.video_id_from_url(video_url)
+        if video_id:
+            entry = self.ledger.get(video_id)
+            caption_path = self.ledger.finished_path(video_id)
+            if caption_path and keep_vtt and not (entry["subtitle_path"] and os.path.exists(entry["subtitle_path"])):
+                caption_path = None
+            if caption_path:
+                logger.info("Captions already downloaded for: %s", entry["title"])
+                return caption_path
+            if entry and not retry_failed and self.should_skip(entry):
+                logger.info("Skipping %s, earlier attempt ended with: %s", video_url, entry["status"])
+                return None
 
         try:
-            # Get video info
-            cmd = ['yt-dlp', '-J', '--no-playlist', video_url]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            video_info = json.loads(result.stdout)
-
-            video_id = video_info['id']
-            video_title = video_info['title']
-
-            txt_path = self.get_txt_path(video_id, video_title)
-
-            # **Modification starts here**
-            # Check if the .txt caption file already exists
-            if os.path.exists(txt_path):
-                print(f"Captions already downloaded for: {video_title}")
-                return txt_path
-            # **Modification ends here**
-
-            output_template = os.path.join(self.output_dir, f'{video_id}_{self.sanitize_title(video_title)}.%(ext)s')
-
-            # Download captions
             cmd = ['yt-dlp',
                    '--skip-download',
                    '--write-auto-sub',
-                    # "--write-sub",
-                   '--sub-format',
-                #    'vtt',
-                    'none',
-                   '--output', output_template,
+                   '--sub-format', 'vtt',
+                   '--no-simulate',
+                   '--dump-json',
+                   '--no-playlist',
+                   '--no-warnings',
+                   '--output', os.path.join(self.output_dir, '%(id)s.%(ext)s'),
                    video_url]
-
             result = subprocess.run(cmd, capture_output=True, text=True)
 
-            # Check if captions were downloaded
-            subtitle_file = next((f for f in os.listdir(self.output_dir) if f.startswith(f'{video_id}_{self.sanitize_title(video_title)}') and f.endswith('.vtt')), None)
-
-            if subtitle_file is None:
-                print(f"No captions found for: {video_title}")
+            if result.returncode != 0 or not result.stdout.strip():
+                error = (result.stderr or "").strip().splitlines()[-1:] or [f"exit code {result.returncode}"]
+                logger.error("Error downloading captions for %s: %s", video_url, error[0])
+                if video_id:
+                    self.ledger.record(video_id, self.ledger.FAILED, error=error[0])
                 return None
 
-            subtitle_path = os.path.join(self.output_dir, subtitle_file)
-
-            with open(subtitle_path, 'r', encoding='utf-8') as f:
-                subtitle_content = f.read()
-
-            cleaned_subtitle = self.clean_subtitle(subtitle_content)
-
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(cleaned_subtitle)
+            video_info = json.loads(result.stdout.strip().splitlines()[-1])
+            video_id = video_info['id']
+            video_title = video_info['title']
 
-            os.remove(subtitle_path)
+            subtitle_path = self.get_subtitle_path(video_info)
+            if subtitle_path is None or not os.path.exists(subtitle_path):
+                logger.info("No captions found for: %s", video_title)
+                self.ledger.record(video_id, self.ledger.NO_CAPTIONS, title=video_title)
+                return None
 
-            print(f"Downloaded and cleaned captions for: {video_title}")
+            txt_path = self.get_txt_path(video_id, video_title)
+            self.clean_subtitle_file(subtitle_path, txt_path)
+
+            if not keep_vtt:
+                os.remove(subtitle_path)
+                subtitle_path = None
+            self.ledger.record(
+                video_id,
+                self.ledger.DONE,
+                title=video_title,
+                caption_path=txt_path,
+                subtitle_path=subtitle_path
+            )
+
+            logger.info("Downloaded and cleaned captions for: %s", video_title)
             return txt_path
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error downloading captions for {video_url}: {e}")
-            return None
         except FileNotFoundError as e:
             logger.error(f"yt-dlp command not found: {e}")
             return None
@@ -144,9 +201,46 @@ class YouTubeCaptionDownloader:
             return None
         except Exception as e:
             logger.error(f"Unexpected error processing captions for {video_url}: {str(e)}")
+            if video_id:
+                self.ledger.record(video_id, self.ledger.FAILED, error=str(e))
             return None
 
 
+    def should_skip(self, entry):
+        """
+        Check if a video is skipped because of an earlier attempt.
+        Videos without captions are skipped. Failed videos are retried once their backoff
+        has passed, until they failed max_attempts times in a row.
+        Args:
+            entry (dict): The ledger entry of the video.
+        Returns:
+            bool: True if the video is skipped.
+        """
+        if entry["status"] == self.ledger.NO_CAPTIONS:
+            return True
+        if entry["status"] != self.ledger.FAILED:
+            return False
+        if entry["attempts"] >= self.max_attempts:
+            return True
+        backoff = self.retry_backoff * 2 ** max(entry["attempts"] - 1, 0)
+        return time.time() - entry["updated_at"] < backoff
+
+    def get_subtitle_path(self, video_info):
+        """
+        Get the path of the downloaded subtitle file from the yt-dlp video information.
+        Args:
+            video_info (dict): The JSON printed by yt-dlp.
+        Returns:
+            str: The path of the VTT file, or None if no subtitles were requested.
+        """
+        requested = video_info.get('requested_subtitles') or {}
+        for language, subtitle in requested.items():
+            if subtitle.get('filepath'):
+                return subtitle['filepath']
+            return os.path.join(self.output_dir, f"{video_info['id']}.{language}.{subtitle.get('ext', 'vtt')}")
+        return None
+
+
     def get_txt_path(self, video_id, video_title):
         """
         Get the path for the text file to save the cleaned captions.
@@ -214,11 +308,12 @@ class YouTubeCaptionDownloader:
 
         logger.info(f"Merged captions saved to: {merged_file_path}")
 
-    def process_playlist(self, playlist_url):
+    def process_playlist(self, playlist_url, retry_failed=False):
         """
         Process a YouTube playlist to download captions for all videos.
         Args:
             playlist_url (str): The URL of the YouTube playlist.
+            retry_failed (bool): See download_captions.
         Returns:
             list: A list of paths to the downloaded caption files.
         """
@@ -232,7 +327,7 @@ class YouTubeCaptionDownloader:
         caption_files = []
 
         with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(self.download_captions, url) for url in video_urls]
+            futures = [executor.submit(self.download_captions, url, retry_failed) for url in video_urls]
             for future in as_completed(futures):
                 result = future.result()
                 if result:
@@ -247,9 +342,138 @@ class YouTubeCaptionDownloader:
         logger.info(f"Total videos in playlist: {total_videos}")
         logger.info(f"Successfully downloaded: {successful_downloads}")
         logger.info(f"Failed to download: {failed_downloads}")
+        logger.info("Ledger: %s", self.ledger.summary())
 
         return caption_files
 
+    def stream_playlist(self, playlist_url, sink, **kwargs):
+        """
+        Stream the captions of a YouTube playlist into a sink, e.g. a vector store.
+        Args:
+            playlist_url (str): The URL of the YouTube playlist.
+            sink (callable): Called with the documents of every video, e.g. rag.store_chunks.
+            **kwargs: The options of stream_videos.
+        Returns:
+            dict: The stream summary of stream_videos.
+        """
+        video_urls = self.get_playlist_videos(playlist_url)
+        logger.info("Found %s unique videos in the playlist.", len(video_urls))
+        return self.stream_videos(video_urls, sink, **kwargs)
+
+    def stream_videos(self, video_urls, sink, download_workers=5, embed_workers=1, queue_size=8, max_chars=1000,
+                      retry_failed=False):
+        """
+        Download captions and hand the documents of every video to a sink as soon as they are cleaned.
+        Download workers put documents on a bounded queue and embedding workers take them off,
+        so downloads and embedding overlap and downloads wait when embedding falls behind.
+        The first sink call runs alone, so a vector store created by it is not created twice.
+        Args:
+            video_urls (list): The URLs of the YouTube videos.
+            sink (callable): Called with the list of documents of a video, e.g. rag.store_chunks.
+            download_workers (int): The number of concurrent yt-dlp downloads.
+            embed_workers (int): The number of threads calling the sink.
+            queue_size (int): The number of videos waiting for the sink before downloads block.
+            max_chars (int): The maximum length of a caption document.
+            retry_failed (bool): See download_captions.
+        Returns:
+            dict: The number of videos, stored videos, stored documents, videos without
+                  captions and failed videos, and the elapsed seconds.
+        """
+        if download_workers < 1 or embed_workers < 1 or queue_size < 1:
+            raise ValueError("download_workers, embed_workers and queue_size must be positive")
+
+        documents_queue = queue.Queue(maxsize=queue_size)
+        summary = {"videos": len(video_urls), "stored": 0, "documents": 0, "no_captions": 0, "failed": 0}
+        summary_lock = threading.Lock()
+        first_call_lock = threading.Lock()
+        first_call_done = threading.Event()
+        live_consumers = [embed_workers]
+        start = time.perf_counter()
+
+        def produce(video_url):
+            try:
+                documents = self.caption_documents(video_url, max_chars=max_chars, retry_failed=retry_failed)
+            except Exception as e:
+                logger.error("Error reading captions of %s: %s", video_url, str(e))
+                documents = []
+            if documents:
+                documents_queue.put((video_url, documents))
+                return
+
+            video_id = self.ledger.video_id_from_url(video_url)
+            entry = self.ledger.get(video_id) if video_id else None
+            status = "no_captions" if entry and entry["status"] == self.ledger.NO_CAPTIONS else "failed"
+            with summary_lock:
+                summary[status] += 1
+
+        def consume():
+            finished = False
+            try:
+                store()
+                finished = True
+            finally:
+                if not finished:
+                    abandon()
+
+        def store():
+            while True:
+                item = documents_queue.get()
+                if item is None:
+                    # The end marker is passed on to the next consumer
+                    documents_queue.put(None)
+                    return
+                video_url, documents = item
+                try:
+                    if first_call_done.is_set():
+                        sink(documents)
+                    else:
+                        with first_call_lock:
+                            sink(documents)
+                            first_call_done.set()
+                    with summary_lock:
+                        summary["stored"] += 1
+                        summary["documents"] += len(documents)
+                    logger.info("Stored %s caption documents of %s", len(documents), video_url)
+                except Exception as e:
+                    logger.error("Error storing captions of %s: %s", video_url, str(e))
+                    with summary_lock:
+                        summary["failed"] += 1
+
+        def abandon():
+            # The sink ended a consumer, e.g. with KeyboardInterrupt. The last one empties
+            # the queue until the end marker, so downloads never block on a full queue.
+            with summary_lock:
+                summary["failed"] += 1
+                live_consumers[0] -= 1
+                last = live_consumers[0] == 0
+            if not last:
+                return
+            item = documents_queue.get()
+            while item is not None:
+                with summary_lock:
+                    summary["failed"] += 1
+                item = documents_queue.get()
+            documents_queue.put(None)
+
+        consumers = [threading.Thread(target=consume, daemon=True) for _ in range(embed_workers)]
+        for consumer in consumers:
+            consumer.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=download_workers) as executor:
+                futures = [executor.submit(produce, url) for url in video_urls]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            documents_queue.put(None)
+            for consumer in consumers:
+                consumer.join()
+
+        summary["seconds"] = time.perf_counter() - start
+        logger.info("Stream summary: %s", summary)
+        logger.info("Ledger: %s", self.ledger.summary())
+        return summary
+
 # def main():
 #     mode = input("Enter 'v' for single video or 'p' for playlist(s): ").lower()
 
@@ -0,0 +1,77 @@
+"""
+This script measures how much shorter caption text gets when the words
+rolling auto-generated cues repeat are removed.
+"""
+import argparse
+import os
+import time
+from pipeline import logger
+from pipeline.ytdpl.vtt_parser import VttParser
+
+
+def benchmark(file_path) -> dict:
+    """
+    Cleans a VTT file with exact line deduplication and with overlap merging.
+
+    Parameters:
+    file_path (str): The path to the VTT file.
+
+    Returns:
+    dict: The number of characters of the raw cue text, after line deduplication and after
+          overlap merging, the compression ratio and the merge time in seconds.
+    """
+    def length(segments):
+        return sum(len(text) + 1 for _, _, text in segments)
+
+    raw = length(VttParser.parse_file(file_path))
+    deduplicated = length(VttParser.drop_repeated_lines(VttParser.parse_file(file_path)))
+    start = time.perf_counter()
+    merged = length(VttParser.merge_overlaps(VttParser.parse_file(file_path)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "raw": raw,
+        "deduplicated": deduplicated,
+        "merged": merged,
+        "ratio": raw / merged if merged else 0.0,
+        "seconds": elapsed,
+    }
+
+
+def main(paths):
+    """ Main function to benchmark the caption cleaning of VTT files and directories. """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in sorted(names) if name.endswith(".vtt")
+            )
+        else:
+            files.append(path)
+
+    totals = {"raw": 0, "deduplicated": 0, "merged": 0}
+    for file_path in files:
+        result = benchmark(file_path)
+        for key in totals:
+            totals[key] += result[key]
+        logger.info(
+            "%s: %d raw, %d deduplicated, %d merged characters (%.2fx) in %.3fs",
+            file_path, result["raw"], result["deduplicated"], result["merged"],
+            result["ratio"], result["seconds"]
+        )
+
+    if totals["merged"]:
+        logger.info(
+            "Total: %d raw, %d deduplicated, %d merged characters, compression %.2fx (%.2fx over deduplication)",
+            totals["raw"], totals["deduplicated"], totals["merged"],
+            totals["raw"] / totals["merged"], totals["deduplicated"] / totals["merged"]
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the caption overlap removal on VTT files.")
+    parser.add_argument('paths', metavar='P', type=str, nargs='+', help='VTT files or directories')
+    args = parser.parse_args()
+    main(args.paths)
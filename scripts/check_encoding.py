@@ -3,9 +3,9 @@ This script checks the encoding of a file.
 """
 import os
 import argparse
-import chardet
 from pipeline import logger
 from pipeline import FileUtils
+from pipeline.utils.encoding_audit import EncodingAudit
 
 def check_encoding(file_path) -> dict:
     """
@@ -25,17 +25,8 @@ def check_encoding(file_path) -> dict:
         result = {"error": "File not found"}
 
     try:
-        # Check file size to avoid processing excessively large files
-        file_size = os.path.getsize(file_path)
-        if file_size > 10 * 1024 * 1024:  # 10 MB limit
-            logger.error("Error: The file %s is too large to process.", file_path)
-            result = {"error": "File too large"}
-
-        with open(file_path, 'rb') as f:
-            raw_data = bytearray()
-            while chunk := f.read(8192):
-                raw_data.extend(chunk)
-        result = chardet.detect(raw_data)
+        # Only samples of large files are read for detection
+        result = EncodingAudit.detect_encoding(file_path)
     except FileNotFoundError:
         logger.error("Error: The file %s was not found.", file_path)
         result = {"error": "File not found"}
@@ -49,20 +40,25 @@ def check_encoding(file_path) -> dict:
     return result
 
 def main(files_to_check):
-    """ Main function to check the encoding of files. """
-    for file_path in files_to_check:
-        result = check_encoding(file_path)
-        logger.info("%s: %s", file_path, result)
+    """ Main function to check the encoding of files and directories. """
+    audit = EncodingAudit()
+    for path in files_to_check:
+        dirty = audit.audit(path)
+        for file_path in EncodingAudit.collect_files(path):
+            file_path = os.path.abspath(file_path)
+            result = check_encoding(file_path)
+            logger.info("%s: %s", file_path, result)
 
-        positions = FileUtils.find_non_ascii_bytes(file_path)
-        if positions:
-            logger.info("Non-ASCII bytes found in file: %s", file_path)
-            logger.info(positions)
-            FileUtils.clean_non_ascii_positions(file_path, positions)
+            positions = dirty.get(file_path)
+            if positions:
+                logger.info(
+                    "Non-ASCII bytes found in file: %s (%s ranges)", file_path, len(positions)
+                )
+                FileUtils.clean_non_ascii_positions(file_path, positions)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Check the encoding of files.")
-    parser.add_argument('files', metavar='F', type=str, nargs='+', help='Files to check')
+    parser.add_argument('files', metavar='F', type=str, nargs='+', help='Files or directories to check')
     args = parser.parse_args()
     main(args.files)
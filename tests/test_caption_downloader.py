@@ -0,0 +1,191 @@
+"""
+Tests for the YouTubeCaptionDownloader class and its caption ledger,
+using a fake yt-dlp executable.
+"""
+
+import os
+import stat
+import sys
+import pytest
+from pipeline.ytdpl.caption_ledger import CaptionLedger
+from pipeline.ytdpl.youtube_caption_downloader import YouTubeCaptionDownloader
+from pipeline.ytdpl.vtt_parser import VttParser
+
+
+FAKE_YT_DLP = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+output = args[args.index("--output") + 1]
+video_id = args[-1].split("v=")[-1]
+with open(os.environ["FAKE_YT_DLP_LOG"], "a", encoding="utf-8") as log:
+    log.write(video_id + "\\n")
+if video_id == "flaky":
+    sys.stderr.write("ERROR: HTTP Error 429: Too Many Requests\\n")
+    sys.exit(1)
+if video_id == "nocaps":
+    print(json.dumps({{"id": video_id, "title": "No captions", "requested_subtitles": None}}))
+    sys.exit(0)
+with open(output.replace("%(id)s", video_id).replace("%(ext)s", "en.vtt"), "w", encoding="utf-8") as vtt:
+    vtt.write("WEBVTT\\nKind: captions\\nLanguage: en\\n\\n"
+              "00:00:00.000 --> 00:00:02.000 align:start position:0%\\nhello world\\n")
+print(json.dumps({{"id": video_id, "title": "Video " + video_id,
+                  "requested_subtitles": {{"en": {{"ext": "vtt"}}}}}}))
+'''
+
+
+@pytest.fixture(name="downloader")
+def fixture_downloader(tmp_path, monkeypatch):
+    """
+    A downloader whose yt-dlp calls are answered by a fake executable
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "yt-dlp"
+    fake.write_text(FAKE_YT_DLP.format(python=sys.executable), encoding="utf-8")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_YT_DLP_LOG", str(tmp_path / "calls.log"))
+    return YouTubeCaptionDownloader(str(tmp_path / "captions"))
+
+
+def calls(tmp_path):
+    """
+    The video ids yt-dlp was started for
+    """
+    log = tmp_path / "calls.log"
+    return log.read_text(encoding="utf-8").split() if log.exists() else []
+
+
+def test_video_id_from_url():
+    """
+    Test the URL forms the ledger understands
+    """
+    assert CaptionLedger.video_id_from_url("https://www.youtube.com/watch?v=abc123&t=5") == "abc123"
+    assert CaptionLedger.video_id_from_url("https://youtu.be/abc123?si=x") == "abc123"
+    assert CaptionLedger.video_id_from_url("https://www.youtube.com/shorts/abc123") == "abc123"
+    assert CaptionLedger.video_id_from_url("https://example.com/watch?v=abc123") is None
+
+
+def test_finished_videos_skip_yt_dlp(downloader, tmp_path):
+    """
+    Test that one yt-dlp call downloads a video and the ledger answers the next request
+    """
+    url = "https://www.youtube.com/watch?v=vid1"
+
+    txt_path = downloader.download_captions(url)
+    assert open(txt_path, encoding="utf-8").read() == "hello world"
+    assert not [name for name in os.listdir(downloader.output_dir) if name.endswith(".vtt")]
+
+    assert downloader.download_captions(url) == txt_path
+    assert calls(tmp_path) == ["vid1"]
+
+
+def test_videos_without_captions_are_remembered(downloader, tmp_path):
+    """
+    Test that a video without captions is only retried on request
+    """
+    url = "https://www.youtube.com/watch?v=nocaps"
+
+    assert downloader.download_captions(url) is None
+    assert downloader.download_captions(url) is None
+    assert calls(tmp_path) == ["nocaps"]
+    assert downloader.ledger.summary() == {CaptionLedger.NO_CAPTIONS: 1}
+
+    assert downloader.download_captions(url, retry_failed=True) is None
+    assert calls(tmp_path) == ["nocaps", "nocaps"]
+
+
+def test_failed_videos_are_retried_with_backoff(downloader, tmp_path):
+    """
+    Test that failed videos are retried after their backoff until max_attempts
+    """
+    url = "https://www.youtube.com/watch?v=flaky"
+
+    downloader.retry_backoff = 3600
+    assert downloader.download_captions(url) is None
+    assert downloader.download_captions(url) is None
+    assert calls(tmp_path) == ["flaky"]
+    assert downloader.ledger.get("flaky")["attempts"] == 1
+
+    downloader.retry_backoff = 0
+    downloader.max_attempts = 2
+    assert downloader.download_captions(url) is None
+    assert downloader.download_captions(url) is None
+    assert calls(tmp_path) == ["flaky", "flaky"]
+    assert downloader.ledger.get("flaky")["error"] == "ERROR: HTTP Error 429: Too Many Requests"
+
+    assert downloader.download_captions(url, retry_failed=True) is None
+    assert calls(tmp_path) == ["flaky", "flaky", "flaky"]
+    assert downloader.ledger.get("flaky")["attempts"] == 3
+
+
+def test_caption_documents_keep_the_vtt(downloader, tmp_path):
+    """
+    Test that caption documents fetch the VTT again when only the text was kept
+    """
+    url = "https://www.youtube.com/watch?v=vid2"
+    downloader.download_captions(url)
+
+    documents = downloader.caption_documents(url)
+
+    assert [document.page_content for document in documents] == ["hello world"]
+    assert documents[0].metadata["timestamp_url"] == "https://www.youtube.com/watch?v=vid2&t=0s"
+    assert documents[0].metadata["title"] == "Video vid2"
+    assert downloader.caption_documents(url)[0].metadata["end"] == 2.0
+    assert calls(tmp_path) == ["vid2", "vid2"]
+
+
+def test_stream_videos_feeds_the_sink(downloader, tmp_path):
+    """
+    Test that documents of every video reach the sink through the bounded queue
+    """
+    stored = []
+    urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id in ("vid3", "nocaps", "vid4", "vid5")]
+
+    summary = downloader.stream_videos(urls, stored.append, download_workers=3, embed_workers=2, queue_size=1)
+
+    assert sorted(documents[0].metadata["video_id"] for documents in stored) == ["vid3", "vid4", "vid5"]
+    assert {key: summary[key] for key in ("videos", "stored", "documents", "no_captions", "failed")} == {
+        "videos": 4, "stored": 3, "documents": 3, "no_captions": 1, "failed": 0
+    }
+    assert sorted(calls(tmp_path)) == ["nocaps", "vid3", "vid4", "vid5"]
+
+    with pytest.raises(ValueError):
+        downloader.stream_videos(urls, stored.append, queue_size=0)
+
+
+def test_stream_videos_counts_failed_videos(downloader, monkeypatch):
+    """
+    Test that download and parsing errors count as failed videos, not as videos without captions
+    """
+    def parse_file(path):
+        if "vid7" in path:
+            raise ValueError("broken VTT file")
+        return original_parse_file(path)
+
+    original_parse_file = VttParser.parse_file
+    monkeypatch.setattr(VttParser, "parse_file", parse_file)
+    urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id in ("vid6", "vid7", "flaky", "nocaps")]
+
+    summary = downloader.stream_videos(urls, lambda documents: None, download_workers=2)
+
+    assert {key: summary[key] for key in ("stored", "no_captions", "failed")} == {
+        "stored": 1, "no_captions": 1, "failed": 2
+    }
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_stream_videos_survives_a_dying_consumer(downloader):
+    """
+    Test that downloads do not block on the full queue once the sink has ended every consumer
+    """
+    def sink(documents):
+        raise SystemExit(f"sink stopped at {documents[0].metadata['video_id']}")
+
+    urls = [f"https://www.youtube.com/watch?v=vid{number}" for number in range(8, 13)]
+
+    summary = downloader.stream_videos(urls, sink, download_workers=2, embed_workers=1, queue_size=1)
+
+    assert summary["stored"] == 0
+    assert summary["failed"] == 5
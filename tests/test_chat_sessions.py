@@ -0,0 +1,48 @@
+"""
+Tests for the chat sessions of the Pipeline class.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from pipeline.pipeline import Pipeline
+
+
+@pytest.fixture(name="pipeline")
+def fixture_pipeline():
+    """
+    A pipeline whose chat model answers from a list
+    """
+    pipeline = Pipeline(base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test")
+    pipeline.chat = FakeListChatModel(responses=["answer"])
+    return pipeline
+
+
+def test_sessions_have_isolated_histories(pipeline):
+    """
+    Test that concurrent sessions only see their own messages
+    """
+    prompts = {f"10.0.0.{i}:22/tcp": f"analyze port {i}" for i in range(8)}
+    pipeline.setup_chain_with_message_history()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda item: pipeline.invoke(item[1], session_id=item[0]), prompts.items()))
+
+    for session_id, prompt in prompts.items():
+        messages = pipeline.get_session_history(session_id).messages
+        assert [message.content for message in messages] == [prompt, "answer"]
+    assert pipeline.chat_history.messages == []
+
+    pipeline.invoke("default session")
+    assert [message.content for message in pipeline.chat_history.messages] == ["default session", "answer"]
+
+
+def test_clear_session(pipeline):
+    """
+    Test that a cleared session starts with an empty history
+    """
+    pipeline.invoke("hello", session_id="a")
+    pipeline.clear_session("a")
+
+    assert "a" not in pipeline.session_histories
+    assert pipeline.get_session_history("a").messages == []
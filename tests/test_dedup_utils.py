@@ -0,0 +1,74 @@
+"""
+Tests for the MinHashDeduplicator class.
+"""
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from pipeline.retrieval import Retrieval
+from pipeline.utils.dedup_utils import MinHashDeduplicator
+
+PARAGRAPH = (
+    "All logs must be collected in a centralized log repository for analysis and monitoring. "
+    "Logs must be reviewed at least monthly to identify abnormal patterns and potential threats "
+    "and log data must support incident response activities and forensic analysis."
+)
+
+
+def test_near_duplicates_are_dropped_with_provenance():
+    """
+    Test that a near-identical chunk is dropped and its source is kept on the first chunk
+    """
+    deduplicator = MinHashDeduplicator(threshold=0.7)
+    documents = [
+        Document(page_content=PARAGRAPH, metadata={"source": "a.txt"}),
+        Document(page_content=PARAGRAPH.replace("monthly", "weekly"), metadata={"source": "b.txt"}),
+        Document(page_content="Backups are encrypted and tested every quarter.", metadata={"source": "c.txt"}),
+    ]
+
+    kept = deduplicator.deduplicate(documents)
+
+    assert [document.metadata["source"] for document in kept] == ["a.txt", "c.txt"]
+    assert kept[0].metadata["duplicate_count"] == 1
+    assert kept[0].metadata["duplicate_sources"] == "b.txt"
+    assert deduplicator.stats == {"seen": 3, "dropped": 1}
+
+
+def test_deduplication_spans_batches():
+    """
+    Test that chunks are deduplicated against earlier batches
+    """
+    deduplicator = MinHashDeduplicator()
+    assert len(deduplicator.deduplicate([Document(page_content=PARAGRAPH)])) == 1
+    assert deduplicator.deduplicate([Document(page_content=PARAGRAPH)]) == []
+
+
+def test_stored_chunks_get_the_provenance_of_later_batches():
+    """
+    Test that a duplicate in a later batch updates the stored chunk in the vector store
+    """
+    retrieval = Retrieval(
+        base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test", dedup_threshold=0.7
+    )
+    retrieval.vector_store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+
+    retrieval.store_chunks([Document(page_content=PARAGRAPH, metadata={"source": "a.txt"})])
+    stored_id = list(retrieval.vector_store.store)[0]
+    retrieval.store_chunks([
+        Document(page_content=PARAGRAPH.replace("monthly", "weekly"), metadata={"source": "b.txt"}),
+        Document(page_content="Backups are encrypted and tested every quarter.", metadata={"source": "c.txt"})
+    ])
+
+    assert retrieval.deduplicator.updated[0].id == stored_id
+    assert len(retrieval.vector_store.store) == 2
+    stored = retrieval.vector_store.get_by_ids([stored_id])[0]
+    assert stored.metadata == {"source": "a.txt", "duplicate_count": 1, "duplicate_sources": "b.txt"}
+
+
+def test_optimal_bands():
+    """
+    Test that the band layout uses at most num_perm hashes and approximates the threshold
+    """
+    bands, rows = MinHashDeduplicator.optimal_bands(0.8, 64)
+    assert bands * rows <= 64
+    assert abs((1 / bands) ** (1 / rows) - 0.8) < 0.1
@@ -0,0 +1,96 @@
+"""
+Tests for the EncodingAudit class and the check_encoding script.
+"""
+
+import json
+import os
+import pytest
+from pipeline import FileUtils
+from pipeline.utils import encoding_audit
+from pipeline.utils.encoding_audit import EncodingAudit
+from scripts import check_encoding
+
+
+@pytest.fixture(name="scans")
+def fixture_scans(monkeypatch):
+    """
+    Records the files that are scanned for non-ASCII bytes
+    """
+    scanned = []
+    find_non_ascii_bytes = FileUtils.find_non_ascii_bytes
+
+    def record(file_path, digest=None):
+        scanned.append(os.path.basename(file_path))
+        return find_non_ascii_bytes(file_path, digest)
+
+    monkeypatch.setattr(FileUtils, "find_non_ascii_bytes", staticmethod(record))
+    return scanned
+
+
+def test_clean_files_are_cached(tmp_path, scans):
+    """
+    Test that a clean file is scanned once and skipped by the next audit
+    """
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.txt").write_text("plain text", encoding="utf-8")
+    cache_path = tmp_path / "audit.json"
+
+    assert EncodingAudit(cache_path).audit(str(data)) == {}
+    assert EncodingAudit(cache_path).audit(str(data)) == {}
+
+    assert scans == ["a.txt"]
+    entry = json.loads(cache_path.read_text(encoding="utf-8"))[str(data / "a.txt")]
+    assert entry["size"] == 10 and len(entry["sha256"]) == 64
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_changed_files_are_scanned_again(tmp_path, scans):
+    """
+    Test that a touched file with unchanged content is not scanned again, and a changed file is reported
+    """
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("plain text", encoding="utf-8")
+    audit = EncodingAudit(tmp_path / "audit.json")
+    audit.audit(str(file_path))
+
+    stat = os.stat(file_path)
+    os.utime(file_path, (stat.st_atime, stat.st_mtime + 10))
+    assert audit.audit(str(file_path)) == {}
+    assert scans == ["a.txt"]
+    assert audit._cache[str(file_path)]["mtime"] == stat.st_mtime + 10
+
+    file_path.write_text("plain TEXT", encoding="utf-8")
+    os.utime(file_path, (stat.st_atime, stat.st_mtime + 20))
+    assert audit.audit(str(file_path)) == {}
+    assert scans == ["a.txt", "a.txt"]
+
+    file_path.write_bytes("café text".encode("utf-8"))
+    assert audit.audit(str(file_path)) == {str(file_path): [(3, 5)]}
+    assert scans == ["a.txt", "a.txt", "a.txt"]
+    assert str(file_path) not in audit._cache
+
+
+def test_check_encoding_script_cleans_dirty_files(tmp_path, monkeypatch):
+    """
+    Test that the script reports the encoding of every file and replaces the non-ASCII bytes of dirty files
+    """
+    monkeypatch.setattr(encoding_audit, "CACHE_DIR", tmp_path)
+    file_path = tmp_path / "notes.md"
+    file_path.write_bytes("naïve notes".encode("utf-8"))
+    clean_path = tmp_path / "clean.md"
+    clean_path.write_text("plain notes", encoding="utf-8")
+    reported = []
+    monkeypatch.setattr(check_encoding.logger, "info", lambda message, *args: reported.append(args))
+
+    assert check_encoding.check_encoding(str(file_path))["encoding"]
+    assert check_encoding.check_encoding(str(tmp_path / "missing.md")) == {"error": "File not found"}
+
+    check_encoding.main([str(tmp_path)])
+
+    assert file_path.read_bytes() == b"na  ve notes"
+    assert clean_path.read_bytes() == b"plain notes"
+    assert {args[0] for args in reported if len(args) == 2 and isinstance(args[1], dict)} == {
+        str(file_path), str(clean_path)
+    }
+    assert EncodingAudit(tmp_path / "encoding_audit.json").audit(str(tmp_path)) == {}
@@ -0,0 +1,138 @@
+"""
+Tests for the ExploitIndex class.
+"""
+
+import csv
+import os
+import pytest
+from pipeline.nmap_project.exploit_index import ExploitIndex
+from pipeline.nmap_project.searchsploit import SearchSploit
+
+
+EXPLOITS = [
+    ("49757", "exploits/unix/remote/49757.py", "vsftpd 2.3.4 - Backdoor Command Execution", "remote", "unix"),
+    ("45233", "exploits/linux/remote/45233.py", "OpenSSH < 7.7 - User Enumeration (2)", "remote", "linux"),
+    ("46516", "exploits/linux/remote/46516.py", "OpenSSH 2.3 < 7.7 - Username Enumeration", "remote", "linux"),
+    ("46676", "exploits/linux/local/46676.php", "Apache 2.4.17 < 2.4.38 - 'apache2ctl graceful' Privilege Escalation",
+     "local", "linux"),
+    ("36803", "exploits/linux/remote/36803.py", "ProFTPd 1.3.5 - 'mod_copy' Remote Command Execution", "remote",
+     "linux"),
+    ("40839", "exploits/linux/local/40839.c", "Linux Kernel 2.6.22 < 3.9 - 'Dirty COW' Race Condition", "local",
+     "linux"),
+    ("1", "exploits/windows/remote/1.c", "Microsoft IIS 5.0 - WebDAV Remote", "remote", "windows"),
+]
+
+
+@pytest.fixture(name="csv_path")
+def fixture_csv_path(tmp_path):
+    """
+    A small files_exploits.csv
+    """
+    csv_path = tmp_path / "exploitdb" / "files_exploits.csv"
+    csv_path.parent.mkdir()
+    with open(csv_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "file", "description", "date_published", "author", "type", "platform", "port"])
+        for edb_id, path, title, kind, platform in EXPLOITS:
+            writer.writerow([edb_id, path, title, "2020-01-01", "someone", kind, platform, ""])
+    return str(csv_path)
+
+
+@pytest.fixture(name="index")
+def fixture_index(csv_path, tmp_path):
+    """
+    An index built from the small CSV
+    """
+    index = ExploitIndex.build(csv_path, str(tmp_path / "exploitdb.idx"))
+    yield index
+    index.close()
+
+
+def ids(result):
+    """
+    The EDB-IDs of a search result
+    """
+    return sorted(entry["EDB-ID"] for entry in result["RESULTS_EXPLOIT"])
+
+
+def test_version_ranges_match_like_searchsploit(index):
+    """
+    Test exact versions, open and closed ranges and strict matching
+    """
+    assert ids(index.search(["vsftpd 2.3.4"])) == ["49757"]
+    assert ids(index.search(["vsftpd 2.3.5"])) == []
+    assert ids(index.search(["OpenSSH 7.6p1"])) == ["45233", "46516"]
+    assert ids(index.search(["OpenSSH 7.7"])) == []
+    assert ids(index.search(["Apache 2.4.29"])) == ["46676"]
+    assert ids(index.search(["linux kernel 3.2"])) == ["40839"]
+    assert ids(index.search(["OpenSSH 7.6p1"], strict=True)) == []
+
+    result = index.search("vsftpd 2.3.4")
+    assert result["RESULTS_EXPLOIT"][0]["Path"] == os.path.join(index.exploitdb_dir, EXPLOITS[0][1])
+
+
+def test_fuzzy_words_and_batches(index):
+    """
+    Test trigram matching of misspelled words and batched searches
+    """
+    assert ids(index.search(["proftpd 1.3.5"])) == ["36803"]
+    assert ids(index.search(["opensh 7.2"])) == ["45233", "46516"]
+    assert ids(index.search(["nonexistent product"])) == []
+
+    results = index.search_many([["vsftpd 2.3.4"], ["Apache 2.4.29"], "vsftpd  2.3.4"])
+    assert [ids(result) for result in results] == [["49757"], ["46676"], ["49757"]]
+    assert results[0] is results[2]
+
+
+def test_load_or_build_reuses_the_index(csv_path, tmp_path):
+    """
+    Test that the index file is reused until the CSV changes
+    """
+    index_path = str(tmp_path / "exploitdb.idx")
+    ExploitIndex.load_or_build(csv_path, index_path).close()
+    built_at = os.path.getmtime(index_path)
+
+    index = ExploitIndex.load_or_build(csv_path, index_path)
+    assert os.path.getmtime(index_path) == built_at
+    assert index.header["records"] == len(EXPLOITS)
+    index.close()
+
+    with open(csv_path, "a", encoding="utf-8") as file:
+        file.write('2,exploits/php/webapps/2.txt,"Drupal < 7.58 - Drupalgeddon2",2018-01-01,x,webapps,php,\n')
+    index = ExploitIndex.load_or_build(csv_path, index_path)
+    assert ids(index.search(["drupal 7.57"])) == ["2"]
+    index.close()
+
+
+def test_searchsploit_uses_the_index(index):
+    """
+    Test that SearchSploit answers JSON searches from the index without starting searchsploit
+    """
+    searchsploit = SearchSploit(index=index)
+    searchsploit.base_cmd = ["false"]
+
+    assert ids(searchsploit.search(["vsftpd", "2.3.4"])) == ["49757"]
+    assert [ids(result) for result in searchsploit.search_many([["Apache", "2.4.29"], ["ProFTPd", "1.3.5"]])] == [
+        ["46676"], ["36803"]
+    ]
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"garbage" * 10,
+    ExploitIndex.MAGIC + b"\x05\x00",
+    ExploitIndex.MAGIC + b"\x02" + b"\x00" * 7 + b"{}"
+])
+def test_corrupt_index_is_rebuilt(csv_path, tmp_path, content):
+    """
+    Test that a corrupt or foreign index file raises ValueError and is rebuilt by load_or_build
+    """
+    index_path = tmp_path / "exploitdb.idx"
+    index_path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        ExploitIndex(str(index_path))
+
+    index = ExploitIndex.load_or_build(csv_path, str(index_path))
+    assert index.header["records"] == len(EXPLOITS)
+    index.close()
@@ -0,0 +1,121 @@
+"""
+Tests for the FileUtils class.
+"""
+
+import os
+from pipeline import FileUtils
+
+
+def test_find_non_ascii_bytes_returns_ranges(tmp_path):
+    """
+    Test that non-ASCII bytes are reported as (start, end) ranges
+    """
+    file_path = tmp_path / "persian.txt"
+    file_path.write_bytes("ab سلام cd é".encode("utf-8"))
+
+    assert FileUtils.find_non_ascii_bytes(str(file_path)) == [(3, 11), (15, 17)]
+
+
+def test_find_non_ascii_bytes_merges_runs_across_blocks(tmp_path, monkeypatch):
+    """
+    Test that a run crossing a scan block boundary is reported once
+    """
+    monkeypatch.setattr(FileUtils, "SCAN_BLOCK_SIZE", 4)
+    file_path = tmp_path / "blocks.txt"
+    file_path.write_bytes(b"abc" + b"\xc3" * 6 + b"abcdefgh" + b"\xff")
+
+    assert FileUtils.find_non_ascii_bytes(str(file_path)) == [(3, 9), (17, 18)]
+
+
+def test_find_non_ascii_bytes_empty_and_missing_files(tmp_path):
+    """
+    Test empty and missing files
+    """
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+
+    assert FileUtils.find_non_ascii_bytes(str(empty)) == []
+    assert FileUtils.find_non_ascii_bytes(str(tmp_path / "missing.txt")) == []
+
+
+def test_clean_non_ascii_positions(tmp_path, monkeypatch):
+    """
+    Test cleaning given ranges and cleaning the whole file in place
+    """
+    monkeypatch.setattr(FileUtils, "SCAN_BLOCK_SIZE", 4)
+    file_path = tmp_path / "dirty.txt"
+    file_path.write_bytes(b"a\xc3\xa9b\xe2\x80\x99c")
+
+    FileUtils.clean_non_ascii_positions(str(file_path), [(1, 3)])
+    assert file_path.read_bytes() == b"a  b\xe2\x80\x99c"
+
+    FileUtils.clean_non_ascii_positions(str(file_path), replacement_byte=b"_")
+    assert file_path.read_bytes() == b"a  b___c"
+    assert FileUtils.find_non_ascii_bytes(str(file_path)) == []
+
+
+def _touch(root, *paths):
+    """
+    Create empty files below root
+    """
+    for path in paths:
+        file_path = root / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("")
+
+
+def test_walk_files_prunes_excluded_directories_by_name(tmp_path):
+    """
+    Test that excluded directories are matched by name, not by substring, and not as files
+    """
+    _touch(
+        tmp_path,
+        "a.py",
+        "b.txt",
+        "environment/c.py",
+        "env/d.py",
+        "venv",
+        ".git/e.py",
+        "pkg/node_modules/f.py",
+        "pkg/g.py",
+    )
+
+    files = [
+        os.path.relpath(path, tmp_path)
+        for path in FileUtils.walk_files(str(tmp_path), ".py")
+    ]
+
+    assert files == ["a.py", os.path.join("environment", "c.py"), os.path.join("pkg", "g.py")]
+    assert "venv" in [os.path.relpath(path, tmp_path) for path in FileUtils.walk_files(str(tmp_path), None)]
+
+
+def test_walk_files_honours_gitignore_and_globs(tmp_path):
+    """
+    Test nested .gitignore files, negation, anchored patterns and multiple extensions
+    """
+    _touch(
+        tmp_path,
+        "build/out.py",
+        "docs/guide.md",
+        "docs/notes.txt",
+        "src/main.py",
+        "src/generated_1.py",
+        "src/generated_keep.py",
+        "src/sub/skip.py",
+    )
+    (tmp_path / ".gitignore").write_text("# comment\n/build/\n*.txt\n")
+    (tmp_path / "src" / ".gitignore").write_text("generated_*.py\n!generated_keep.py\nsub/**\n")
+
+    files = sorted(
+        os.path.relpath(path, tmp_path)
+        for path in FileUtils.walk_files(str(tmp_path), [".py", ".md", ".txt"], use_gitignore=True)
+    )
+
+    assert files == [
+        os.path.join("docs", "guide.md"),
+        os.path.join("src", "generated_keep.py"),
+        os.path.join("src", "main.py"),
+    ]
+
+    assert len(FileUtils.get_files(str(tmp_path), ".txt", exclude_dirs=["docs/"])) == 0
+    assert len(list(FileUtils.walk_files(str(tmp_path), ".txt"))) == 1
@@ -0,0 +1,95 @@
+"""
+Tests for the HtmlTextExtractor class.
+"""
+
+import os
+from pipeline.utils.html_extractor import HtmlTextExtractor
+
+
+PAGE = """
+<html><head><title>Docs</title><script>var tracking = 1;</script></head>
+<body>
+  <nav><a href="/">Home</a> <a href="/about">About</a></nav>
+  <div id="cookie-banner">We use cookies. <button>Accept</button></div>
+  <main>
+    <h1>Log Management</h1>
+    <p>Logs are kept   for 90 days.</p>
+    <div class="share-links">Share on social media</div>
+  </main>
+  <footer>Copyright 2024</footer>
+</body></html>
+"""
+
+
+def test_boilerplate_is_removed():
+    """
+    Test that navigation, banners, scripts and footers are dropped
+    """
+    text = HtmlTextExtractor(cache_dir=False).html_to_text(PAGE)
+
+    assert text == "Log Management\n\nLogs are kept for 90 days."
+
+
+def test_body_is_used_without_main():
+    """
+    Test that pages without <main> keep their body text
+    """
+    html = '<body><div class="content"><p>Body text</p></div><div role="navigation">Menu</div></body>'
+
+    assert HtmlTextExtractor(cache_dir=False).html_to_text(html) == "Body text"
+
+
+def test_extract_uses_the_cache(tmp_path):
+    """
+    Test that unchanged pages are read from the cache and changed pages replace old entries
+    """
+    extractor = HtmlTextExtractor(cache_dir=tmp_path)
+    url = "https://example.com/docs"
+
+    first = extractor.extract(url, PAGE.encode("utf-8"))
+    second = extractor.extract(url, PAGE.encode("utf-8"))
+
+    assert first == second
+    assert extractor.stats["pages"] == 2
+    assert extractor.stats["cached"] == 1
+    assert extractor.stats["text_size"] < extractor.stats["original_size"]
+
+    changed = extractor.extract(url, PAGE.replace("90", "180"))
+    assert changed != first
+    assert extractor.stats["cached"] == 1
+    assert len(os.listdir(tmp_path)) == 1
+    assert extractor.extract(url, PAGE.replace("90", "180")) == changed
+    assert extractor.stats["cached"] == 2
+
+
+def test_extract_does_not_list_the_cache(tmp_path, monkeypatch):
+    """
+    Test that a cache miss replaces the entry of the URL without listing the cache directory
+    """
+    extractor = HtmlTextExtractor(cache_dir=tmp_path)
+
+    def fail(_):
+        raise AssertionError("the cache directory was listed")
+
+    monkeypatch.setattr(os, "listdir", fail)
+    for number in range(3):
+        extractor.extract("https://example.com/docs", PAGE.replace("90", str(number)))
+    monkeypatch.undo()
+
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_content_forms_and_class_names_are_kept():
+    """
+    Test that a page wrapped in a form keeps its text while small forms are dropped,
+    and that class names only containing a boilerplate word are kept
+    """
+    text = "Installation requires Python 3.10 and a running Ollama server. " * 5
+    html = (
+        f'<body><form id="aspnetForm"><div class="sharedContent"><p>{text}</p></div>'
+        '<div class="menu-item-article">Menu item text</div></form>'
+        '<form class="search"><input name="q"><button>Search</button></form>'
+        '<ul class="main-menu"><li>Home</li></ul></body>'
+    )
+
+    assert HtmlTextExtractor(cache_dir=False).html_to_text(html) == f"{text.strip()}\nMenu item text"
@@ -0,0 +1,164 @@
+"""
+Tests for the JsonRecordStream class.
+"""
+
+import json
+import pytest
+from pipeline.utils.json_stream import JsonRecordStream, JsonObjectScanner
+from pipeline.utils.chatbot_utils import ChatbotUtils
+from pipeline.rag.json_rag import JsonRAG
+
+
+DATA = {
+    "meta": {"note": "skip \"[{\" me", "list": [1, {"a": "]}\\"}]},
+    "nmaprun": {
+        "host": [{"id": i, "name": "host-é" + "x" * i, "ports": [80, 443]} for i in range(50)],
+        "total": 50
+    }
+}
+
+
+@pytest.fixture(name="json_file")
+def fixture_json_file(tmp_path):
+    """
+    A JSON export with records below a nested path
+    """
+    file_path = tmp_path / "export.json"
+    file_path.write_text(json.dumps(DATA, ensure_ascii=False), encoding="utf-8")
+    return str(file_path)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1 << 16])
+def test_records_at_path(json_file, block_size):
+    """
+    Test that records are read across any block boundary
+    """
+    records = list(JsonRecordStream(json_file, "nmaprun.host", block_size=block_size))
+
+    assert records == DATA["nmaprun"]["host"]
+
+
+def test_wildcard_and_index_segments(json_file):
+    """
+    Test '*' and array index segments
+    """
+    assert list(JsonRecordStream(json_file, "*.host.3")) == [DATA["nmaprun"]["host"][3]]
+    assert list(JsonRecordStream(json_file, "meta.list")) == DATA["meta"]["list"]
+
+
+def test_top_level_array_and_missing_path(tmp_path):
+    """
+    Test the empty path and a path that does not exist
+    """
+    file_path = tmp_path / "array.json"
+    file_path.write_text(" [1, 22, [], {}] ", encoding="utf-8")
+
+    assert list(JsonRecordStream(str(file_path), block_size=1)) == [1, 22, [], {}]
+    assert list(JsonRecordStream(str(file_path), "host")) == []
+
+
+@pytest.mark.parametrize("padding", range(16))
+def test_numbers_split_by_a_block_boundary(tmp_path, padding):
+    """
+    Test that a number cut at any offset by the end of a block is read completely
+    """
+    file_path = tmp_path / "numbers.json"
+    file_path.write_text('["' + "x" * padding + '", -12.375e+2, 0.25, 7]', encoding="utf-8")
+
+    assert list(JsonRecordStream(str(file_path), block_size=16)) == ["x" * padding, -1237.5, 0.25, 7]
+
+
+def test_numbers_at_the_default_block_size(tmp_path):
+    """
+    Test numbers cut by the default and small block sizes
+    """
+    file_path = tmp_path / "float.json"
+    file_path.write_text('["' + "x" * (65536 - 7) + '", 3.75]', encoding="utf-8")
+    assert list(JsonRecordStream(str(file_path)))[1] == 3.75
+
+    file_path.write_text('{"a":[0.25]}', encoding="utf-8")
+    assert list(JsonRecordStream(str(file_path), "a", block_size=9)) == [0.25]
+
+    file_path.write_text("[1e5]", encoding="utf-8")
+    assert list(JsonRecordStream(str(file_path), block_size=3)) == [1e5]
+
+
+def test_invalid_json_raises(tmp_path):
+    """
+    Test that a truncated file is reported
+    """
+    file_path = tmp_path / "broken.json"
+    file_path.write_text('{"host": [{"id": 1}, {"id"', encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(JsonRecordStream(str(file_path), "host"))
+
+
+def test_field_value():
+    """
+    Test the lookup of promoted metadata fields
+    """
+    record = {"address": {"addr": "10.0.0.1"}, "ports": [80]}
+
+    assert JsonRAG._field_value(record, "address.addr") == "10.0.0.1"
+    assert JsonRAG._field_value(record, "ports") is None
+    assert JsonRAG._field_value(record, "missing.field") is None
+
+
+ANSWER = (
+    'Here is the plan {not json} and a note: "}" does not matter.\n'
+    '```json\n'
+    '{"summary": "uses \\"{braces}\\" in strings", '
+    '"commands": [{"command": "nmap -sV {target}", "description": "scan \\\\ }"}]}\n'
+    '```\nThanks {"ignored": true}'
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, len(ANSWER)])
+def test_object_scanner_handles_strings_and_streamed_chunks(chunk_size):
+    """
+    Test that braces in strings and escapes are skipped, whatever the chunk boundaries
+    """
+    scanner = JsonObjectScanner(ChatbotUtils.has_commands)
+    results = [scanner.feed(ANSWER[i:i + chunk_size]) for i in range(0, len(ANSWER), chunk_size)]
+
+    expected = {
+        "summary": 'uses "{braces}" in strings',
+        "commands": [{"command": "nmap -sV {target}", "description": "scan \\ }"}]
+    }
+    assert scanner.result == expected
+    assert results[-1] == expected
+    assert ChatbotUtils.extract_json(ANSWER) == expected
+    assert ChatbotUtils.extract_commands_json(ANSWER) == expected
+
+
+def test_object_scanner_stops_reading_a_stream():
+    """
+    Test that a stream is not read after the closing brace of the matching object
+    """
+    read = []
+
+    def tokens():
+        for token in ['{"a": 1}', ' {"b": ', '{"c": 2}', '}', ' never']:
+            read.append(token)
+            yield token
+
+    assert JsonObjectScanner.find(tokens(), lambda data: "c" in data) == {"c": 2}
+    assert read[-1] == "}"
+    assert JsonObjectScanner.find("{'bad': {\"inner\": [1]}}") == {"inner": [1]}
+
+    with pytest.raises(ValueError):
+        ChatbotUtils.extract_json("no json here {")
+    with pytest.raises(ValueError):
+        ChatbotUtils.extract_commands_json('{"commands": ["ls"]}')
+
+
+def test_object_scanner_skips_stray_and_deeply_nested_braces():
+    """
+    Test that a brace in prose does not hide later objects and deep nesting does not recurse
+    """
+    assert JsonObjectScanner.find('use { often. then {"a":1}') == {"a": 1}
+    assert JsonObjectScanner.find(["use {", ' often. then {', '"a":1}']) == {"a": 1}
+    assert JsonObjectScanner.find("{" * 900 + "x" + "}" * 900) is None
+    assert JsonObjectScanner.find('{"a": ' + "[" * 5000 + "]" * 5000 + ', "b": {"c": 1}}') == {"c": 1}
+    assert JsonObjectScanner.find('{"a": {"b": 1}, "c": {"d": 2},}', lambda data: "d" in data) == {"d": 2}
@@ -0,0 +1,89 @@
+"""
+Tests for the metadata index and filter of the Retrieval class.
+"""
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+from pipeline.retrieval import Retrieval
+
+
+@pytest.fixture(name="retrieval")
+def fixture_retrieval():
+    """
+    A Retrieval without documents, connected to an unused local endpoint
+    """
+    return Retrieval(base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test")
+
+
+def test_index_metadata_makes_values_scalar(retrieval):
+    """
+    Test that non-scalar metadata is flattened and indexed
+    """
+    chunk = Document(
+        page_content="text",
+        metadata={"policy": "Log Management", "tags": ["a", "b"], "owner": None, "year": 2023}
+    )
+    retrieval.index_metadata([chunk])
+
+    assert chunk.metadata == {"policy": "Log Management", "tags": "a;b", "year": 2023}
+    assert retrieval.metadata_index["year"] == {2023}
+
+
+def test_build_metadata_filter_combines_fields(retrieval):
+    """
+    Test that several fields are combined with $and
+    """
+    metadata_filter = {"policy": "Log Management", "year": {"$gte": 2023}}
+
+    assert retrieval.build_metadata_filter(metadata_filter) == {
+        "$and": [{"policy": "Log Management"}, {"year": {"$gte": 2023}}]
+    }
+    assert retrieval.build_metadata_filter({"year": 2023}) == {"year": 2023}
+
+
+def test_build_metadata_filter_rejects_invalid_filters(retrieval):
+    """
+    Test that unknown operators and empty filters are rejected
+    """
+    with pytest.raises(ValueError):
+        retrieval.build_metadata_filter({"year": {"$like": 2023}})
+    with pytest.raises(ValueError):
+        retrieval.build_metadata_filter({})
+    with pytest.raises(ValueError):
+        retrieval.build_metadata_filter({"$or": []})
+
+
+class RecordingVectorStore(InMemoryVectorStore):
+    """
+    A vector store recording the filter of every search
+    """
+    def __init__(self, embedding):
+        super().__init__(embedding=embedding)
+        self.filters = []
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        self.filters.append(kwargs.get("filter"))
+        return []
+
+
+def test_filters_are_per_session_and_can_be_cleared(retrieval):
+    """
+    Test that a session keeps its filter, does not change other sessions and clears it with {}
+    """
+    retrieval.chat = FakeListChatModel(responses=["answer"])
+    retrieval.vector_store = RecordingVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+    filters = retrieval.vector_store.filters
+
+    retrieval.invoke("first", metadata_filter={"year": 2023}, session_id="a")
+    retrieval.invoke("second", session_id="a")
+    retrieval.invoke("other", session_id="b")
+    retrieval.invoke("cleared", metadata_filter={}, session_id="a")
+    retrieval.invoke("default", metadata_filter={"policy": "Backup"})
+    retrieval.clear_session("a")
+
+    assert filters == [{"year": 2023}, {"year": 2023}, None, None, {"policy": "Backup"}]
+    assert retrieval.get_session_filter("a") == {"policy": "Backup"}
+    assert retrieval.get_session_filter("b") == {"policy": "Backup"}
@@ -0,0 +1,121 @@
+"""
+Tests for the NmapOrchestrator class, using a fake nmap executable.
+"""
+
+import asyncio
+import os
+import stat
+import sys
+import pytest
+from pipeline.nmap_project.nmap_orchestrator import NmapOrchestrator
+
+
+# Reports every address of its targets as up with every requested port open.
+# Targets named 'slow' report one host and then hang.
+FAKE_NMAP = '''#!{python}
+import ipaddress, os, sys, time
+args = sys.argv[1:]
+ports = []
+if "-p" in args:
+    for part in args[args.index("-p") + 1].split(","):
+        start, _, end = part.partition("-")
+        ports += range(int(start), int(end or start) + 1)
+targets = [arg for i, arg in enumerate(args) if not arg.startswith("-") and args[i - 1] not in ("-p", "-oX")]
+with open(os.environ["FAKE_NMAP_LOG"], "a", encoding="utf-8") as log:
+    log.write(f"start {{os.getpid()}}\\n")
+sys.stdout.write('<?xml version="1.0"?><nmaprun scanner="nmap">')
+for target in targets:
+    addresses = ["10.9.9.9"] if target == "slow" else [str(a) for a in ipaddress.ip_network(target).hosts()] or [target]
+    for address in addresses:
+        sys.stdout.write('<host><status state="up"/><address addr="%s" addrtype="ipv4"/><ports>' % address)
+        for port in ports:
+            sys.stdout.write('<port protocol="tcp" portid="%s"><state state="open"/><service name="svc%s"/></port>'
+                             % (port, port))
+        sys.stdout.write("</ports></host>")
+    sys.stdout.flush()
+    if target == "slow":
+        time.sleep(30)
+time.sleep(0.2)
+sys.stdout.write("</nmaprun>")
+with open(os.environ["FAKE_NMAP_LOG"], "a", encoding="utf-8") as log:
+    log.write(f"end {{os.getpid()}}\\n")
+'''
+
+
+@pytest.fixture(name="nmap_log")
+def fixture_nmap_log(tmp_path, monkeypatch):
+    """
+    Puts the fake nmap on the PATH and returns its log file
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "nmap"
+    fake.write_text(FAKE_NMAP.format(python=sys.executable), encoding="utf-8")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    log = tmp_path / "nmap.log"
+    monkeypatch.setenv("FAKE_NMAP_LOG", str(log))
+    return log
+
+
+def test_split_targets_and_ports():
+    """
+    Test sharding networks, single addresses and port ranges
+    """
+    groups = NmapOrchestrator.split_targets(["10.0.0.0/28", "10.0.1.1", "host.local", "10.0.2.1"], 4)
+    assert groups[:4] == [["10.0.0.0/30"], ["10.0.0.4/30"], ["10.0.0.8/30"], ["10.0.0.12/30"]]
+    assert groups[4:] == [["10.0.1.1", "host.local", "10.0.2.1"]]
+
+    assert NmapOrchestrator.split_ports("22,80,1000-1003", 2) == ["22,80,1000", "1001-1003"]
+    assert NmapOrchestrator.split_ports("T:80,U:53", 2) == ["T:80,U:53"]
+
+    with pytest.raises(ValueError):
+        NmapOrchestrator([], ports="80")
+
+
+def test_run_merges_shards_with_limited_concurrency(nmap_log):
+    """
+    Test that hosts scanned in several port shards are merged and at most two nmap processes run at once
+    """
+    orchestrator = NmapOrchestrator("10.0.0.0/29", ports="22,80,443", max_concurrency=2, shard_size=4, port_shards=3)
+    assert len(orchestrator.shards) == 6
+
+    result = orchestrator.run()
+
+    assert [host["ip"] for host in result["hosts"]] == [f"10.0.0.{i}" for i in (1, 2, 5, 6)]
+    assert [port["portid"] for port in result["hosts"][0]["ports"]] == [22, 80, 443]
+    assert result["scanned"] == 8
+    assert result["failed"] == [] and result["timed_out"] == []
+    assert result["hosts_per_second"] > 0
+
+    running = peak = 0
+    for line in nmap_log.read_text(encoding="utf-8").splitlines():
+        running += 1 if line.startswith("start") else -1
+        peak = max(peak, running)
+    assert peak == 2
+
+
+def test_timed_out_shard_keeps_partial_results(nmap_log):
+    """
+    Test that a shard that times out is stopped and its reported hosts are kept
+    """
+    result = NmapOrchestrator(["10.0.0.1", "slow"], ports="22", shard_size=1, timeout=2).run()
+
+    assert sorted(host["ip"] for host in result["hosts"]) == ["10.0.0.1", "10.9.9.9"]
+    assert result["timed_out"] == [(["slow"], "22")]
+    assert result["elapsed"] < 10
+
+
+def test_run_inside_a_running_event_loop(nmap_log):
+    """
+    Test that run works while an event loop is running, and that run_async can be awaited
+    """
+    orchestrator = NmapOrchestrator("10.0.0.0/30", ports="22")
+
+    async def scan_in_loop():
+        return orchestrator.run(), await orchestrator.run_async()
+
+    result, awaited = asyncio.run(scan_in_loop())
+
+    assert [host["ip"] for host in result["hosts"]] == ["10.0.0.1", "10.0.0.2"]
+    assert [host["ip"] for host in awaited["hosts"]] == ["10.0.0.1", "10.0.0.2"]
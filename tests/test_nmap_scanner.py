@@ -0,0 +1,132 @@
+"""
+Tests for the XML parsing of the NmapScanner class, using a fake nmap executable.
+"""
+
+import os
+import stat
+import sys
+import pytest
+from pipeline.nmap_project.nmap_scanner import NmapScanner
+
+
+SCAN_XML = os.path.join(os.path.dirname(__file__), "data", "nmap_scan.xml")
+
+# Writes the report up to the first host, then waits for the test to read that host
+# before writing the rest. Without the go file the second host is never written.
+FAKE_NMAP = '''#!{python}
+import os, sys, time
+with open({xml!r}, encoding="utf-8") as f:
+    report = f.read()
+split = report.index("</host>") + len("</host>")
+sys.stdout.write(report[:split])
+sys.stdout.flush()
+for _ in range(500):
+    if os.path.exists(os.environ["FAKE_NMAP_GO"]):
+        sys.stdout.write(report[split:])
+        break
+    time.sleep(0.01)
+'''
+
+# Fills the stderr pipe many times over before writing the report
+NOISY_NMAP = '''#!{python}
+import sys
+sys.stderr.write("warning: noisy scan\\n" * 50000)
+sys.stderr.flush()
+with open({xml!r}, encoding="utf-8") as f:
+    sys.stdout.write(f.read())
+'''
+
+
+@pytest.fixture(name="report")
+def fixture_report():
+    """
+    The sample two-host XML report
+    """
+    with open(SCAN_XML, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parse_output_returns_every_host(report):
+    """
+    Test that every host of a scan is parsed with its ports, services, CPEs and OS matches
+    """
+    scanner = NmapScanner(target="192.168.56.0/30")
+    scanner.nmap_output = report
+    data = scanner.parse_output().get_parsed_data()
+
+    assert [host["ip"] for host in data["hosts"]] == ["192.168.56.2", "192.168.56.3"]
+    first, second = data["hosts"]
+    assert first["mac_address"] == "08:00:27:AA:BB:CC"
+    assert first["hostnames"] == ["web.local"]
+    assert first["ports"][0]["port"] == "22/tcp"
+    assert first["ports"][0]["version"] == "OpenSSH 7.6p1 Ubuntu 4ubuntu0.3 Ubuntu Linux; protocol 2.0"
+    assert first["os_matches"] == [{"name": "Linux 4.15 - 5.8", "accuracy": 100, "cpes": ["cpe:/o:linux:linux_kernel:4"]}]
+    assert "cpe:/a:apache:http_server:2.4.29" in first["cpes"]
+    assert [(port["portid"], port["state"]) for port in second["ports"]] == [(21, "open"), (23, "filtered")]
+
+    assert data["host_ip"] == "192.168.56.2"
+    assert data["os_info"] == "Linux 4.15 - 5.8"
+
+
+def test_parse_hosts_accepts_small_chunks(report):
+    """
+    Test that the report can be fed in arbitrary pieces
+    """
+    chunks = [report[i:i + 7].encode() for i in range(0, len(report), 7)]
+    assert [host["ip"] for host in NmapScanner.parse_hosts(chunks)] == ["192.168.56.2", "192.168.56.3"]
+
+
+def test_with_xml_output_replaces_output_options():
+    """
+    Test that commands always write XML to stdout
+    """
+    assert NmapScanner.with_xml_output("nmap -sV -oN scan.txt 10.0.0.1") == ["nmap", "-oX", "-", "-sV", "10.0.0.1"]
+    assert NmapScanner(target="10.0.0.1", flags=None, ports="22,80", firewall=True).build_command() == [
+        "nmap", "-oX", "-", "-p", "22,80", "-Pn", "10.0.0.1"
+    ]
+
+
+def test_iter_hosts_yields_before_the_scan_ends(tmp_path, monkeypatch):
+    """
+    Test that the first host is available while nmap is still running
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "nmap"
+    fake.write_text(FAKE_NMAP.format(python=sys.executable, xml=SCAN_XML), encoding="utf-8")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    go_file = tmp_path / "go"
+    monkeypatch.setenv("FAKE_NMAP_GO", str(go_file))
+
+    hosts = NmapScanner(target="192.168.56.0/30").iter_hosts()
+    assert next(hosts)["ip"] == "192.168.56.2"
+
+    go_file.touch()
+    assert [host["ip"] for host in hosts] == ["192.168.56.3"]
+
+
+def test_iter_hosts_does_not_block_on_stderr(tmp_path, monkeypatch):
+    """
+    Test that nmap writing more to stderr than a pipe holds still finishes the scan
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "nmap"
+    fake.write_text(NOISY_NMAP.format(python=sys.executable, xml=SCAN_XML), encoding="utf-8")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    hosts = NmapScanner(target="192.168.56.0/30").iter_hosts()
+    assert [host["ip"] for host in hosts] == ["192.168.56.2", "192.168.56.3"]
+
+
+def test_iter_hosts_without_nmap_sets_returncode(tmp_path, monkeypatch):
+    """
+    Test that a missing nmap executable ends the scan with a failed returncode
+    """
+    monkeypatch.setenv("PATH", str(tmp_path))
+
+    scanner = NmapScanner(target="192.168.56.0/30")
+    assert not list(scanner.iter_hosts())
+    assert scanner.returncode not in (None, 0)
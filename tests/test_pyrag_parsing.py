@@ -0,0 +1,157 @@
+"""
+Tests for the parallel parsing of the PyRAG class and for full indexes into a persisted collection.
+"""
+
+import functools
+import multiprocessing
+import pytest
+from git import Actor, Repo
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pipeline.rag import py_rag
+from pipeline.rag.py_rag import PyRAG
+from pipeline.utils.repo_cache import RepositoryCache
+from pipeline.utils.symbol_index import SymbolIndex
+
+
+FILES = 20
+
+
+@pytest.fixture(name="package")
+def fixture_package(tmp_path):
+    """
+    A package of small modules, parsed into one document each
+    """
+    package = tmp_path / "package"
+    package.mkdir()
+    for number in range(FILES):
+        (package / f"module_{number}.py").write_text(
+            f'def function_{number}(value):\n    """Returns value plus {number}."""\n    return value + {number}\n',
+            encoding="utf-8"
+        )
+    return package
+
+
+@pytest.fixture(name="recorder")
+def fixture_recorder(monkeypatch):
+    """
+    Records the process pools, the submitted and the handled files and the stored batches
+    """
+    recorder = {"executors": [], "submitted": 0, "handled": 0, "in_flight": 0, "batches": []}
+
+    class RecordingExecutor(py_rag.ProcessPoolExecutor):
+        """
+        A process pool counting the submitted files
+        """
+        def __init__(self, max_workers=None, mp_context=None):
+            super().__init__(max_workers=max_workers, mp_context=mp_context)
+            recorder["executors"].append(mp_context.get_start_method())
+
+        def submit(self, fn, /, *args, **kwargs):
+            if fn is py_rag.parse_python_file:
+                recorder["submitted"] += 1
+                recorder["in_flight"] = max(recorder["in_flight"], recorder["submitted"] - recorder["handled"])
+            return super().submit(fn, *args, **kwargs)
+
+    add_symbols = SymbolIndex.add_symbols
+
+    def record_symbols(self, file_path, symbols):
+        recorder["handled"] += 1
+        return add_symbols(self, file_path, symbols)
+
+    def record_batch(_, all_chunks):
+        recorder["batches"].append((len(all_chunks), recorder["submitted"]))
+
+    monkeypatch.setattr(py_rag, "ProcessPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(SymbolIndex, "add_symbols", record_symbols)
+    monkeypatch.setattr(PyRAG, "store_chunks", record_batch)
+    return recorder
+
+
+def test_files_are_parsed_in_a_pool_and_stored_in_batches(package, recorder):
+    """
+    Test that two workers parse every file, at most four files per worker are queued,
+    and batches are stored while files are still parsed
+    """
+    rag = PyRAG(
+        base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test",
+        path=str(package), parse_workers=2, parse_batch_size=3, parse_pool_threshold=10
+    )
+
+    default = multiprocessing.get_start_method()
+    assert recorder["executors"] == ["fork" if default == "fork" else "spawn"]
+    assert rag.parse_executor is None
+    assert recorder["submitted"] == recorder["handled"] == FILES
+    assert recorder["in_flight"] <= 2 * 4
+
+    assert len(recorder["batches"]) == 7
+    assert sum(chunks for chunks, _ in recorder["batches"]) == FILES
+    assert recorder["batches"][0][1] < FILES
+    assert sorted(symbol["qualname"] for symbol in rag.symbol_index.lookup("function_7")) == ["function_7"]
+
+
+@pytest.mark.parametrize("module", [None, "module_3.py"])
+def test_small_inputs_are_parsed_without_a_pool(package, recorder, module):
+    """
+    Test that a directory with few files and a single file are parsed in this process
+    """
+    path = package / module if module else package
+    rag = PyRAG(
+        base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test",
+        path=str(path), parse_workers=2, parse_pool_threshold=FILES
+    )
+
+    assert not recorder["executors"]
+    assert recorder["handled"] == (1 if module else FILES)
+    assert rag.symbol_index.lookup("function_3")
+
+
+def test_full_index_replaces_the_persisted_collection(package, tmp_path, monkeypatch):
+    """
+    Test that a full index over an existing persisted collection does not store the chunks twice
+    """
+    monkeypatch.setattr(PyRAG, "setup_embeddings", staticmethod(lambda: DeterministicFakeEmbedding(size=16)))
+    kwargs = {
+        "base_url": "http://localhost:1/v1", "openai_api_key": "not-needed", "model": "test",
+        "path": str(package), "collection_name": "code", "persist_directory": str(tmp_path / "store")
+    }
+
+    first = PyRAG(**kwargs)
+    stored = len(first.vector_store.get()["ids"])
+    assert stored >= FILES
+
+    second = PyRAG(**kwargs)
+    assert len(second.vector_store.get()["ids"]) == stored
+
+
+def test_incremental_update_of_few_files_starts_no_pool(package, tmp_path, monkeypatch):
+    """
+    Test that the pool is started for the full index but not for an update of one changed file
+    """
+    author = Actor("Test", "test@example.com")
+    origin = Repo.init(package)
+    origin.index.add([path.name for path in package.glob("*.py")])
+    origin.index.commit("initial", author=author, committer=author)
+
+    pools = []
+    start_parse_pool = PyRAG.start_parse_pool
+    monkeypatch.setattr(PyRAG, "start_parse_pool", lambda self: pools.append(1) or start_parse_pool(self))
+    monkeypatch.setattr(PyRAG, "setup_embeddings", staticmethod(lambda: DeterministicFakeEmbedding(size=16)))
+    monkeypatch.setattr(PyRAG, "is_valid_git_url", staticmethod(lambda git_url: True))
+    monkeypatch.setattr(py_rag, "RepositoryCache", functools.partial(RepositoryCache, state_path=tmp_path / "state.json"))
+    kwargs = {
+        "base_url": "http://localhost:1/v1", "openai_api_key": "not-needed", "model": "test",
+        "git_url": f"file://{package}", "path": str(tmp_path / "clone"), "collection_name": "code",
+        "persist_directory": str(tmp_path / "store"), "parse_workers": 2, "parse_pool_threshold": 10
+    }
+
+    PyRAG(**kwargs)
+    assert pools == [1]
+
+    (package / "module_3.py").write_text("def renamed_function(value):\n    return value\n", encoding="utf-8")
+    origin.index.add(["module_3.py"])
+    origin.index.commit("change", author=author, committer=author)
+
+    rag = PyRAG(**kwargs)
+    assert pools == [1]
+    assert rag.symbol_index.lookup("renamed_function")
+    assert not rag.symbol_index.lookup("function_3")
@@ -0,0 +1,86 @@
+"""
+Tests for the RepositoryCache class against a local repository.
+"""
+
+import os
+import pytest
+from git import Actor, Repo
+from pipeline.utils.repo_cache import RepositoryCache
+
+
+AUTHOR = Actor("Test", "test@example.com")
+
+
+def commit(repo, files: dict, message: str, removed=()) -> str:
+    """
+    Writes, removes and commits files in a repository
+    """
+    for name, content in files.items():
+        path = os.path.join(repo.working_tree_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        repo.index.add([name])
+    if removed:
+        repo.index.remove(list(removed), working_tree=True)
+    return repo.index.commit(message, author=AUTHOR, committer=AUTHOR).hexsha
+
+
+@pytest.fixture(name="origin")
+def fixture_origin(tmp_path):
+    """
+    A repository to clone from
+    """
+    repo = Repo.init(tmp_path / "origin")
+    commit(repo, {"a.py": "A = 1\n", "b.py": "B = 1\n", "pkg/c.py": "C = 1\n"}, "initial")
+    return repo
+
+
+def test_clone_fetch_and_changed_files(origin, tmp_path):
+    """
+    Test that a clone is reused and only the changes since the last commit are reported
+    """
+    path = str(tmp_path / "clone")
+    cache = RepositoryCache(path, f"file://{origin.working_tree_dir}", state_path=tmp_path / "state.json")
+
+    first = cache.sync()
+    assert os.path.isfile(os.path.join(path, "pkg", "c.py"))
+    assert len(list(cache.repo.iter_commits())) == 1
+    cache.mark_indexed("code", first)
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+    origin.git.mv("b.py", "renamed.py")
+    commit(origin, {"a.py": "A = 2\n", "d.py": "D = 1\n"}, "change", removed=["pkg/c.py"])
+
+    cache = RepositoryCache(path, f"file://{origin.working_tree_dir}", state_path=tmp_path / "state.json")
+    second = cache.sync()
+    changes = cache.changed_files(cache.last_indexed("code"), second)
+
+    assert second == origin.head.commit.hexsha
+    assert sorted(changes["changed"]) == [os.path.join(path, name) for name in ("a.py", "d.py", "renamed.py")]
+    assert sorted(changes["deleted"]) == [os.path.join(path, name) for name in ("b.py", "pkg/c.py")]
+
+
+def test_unknown_commit_needs_full_index(origin, tmp_path):
+    """
+    Test that a missing or unknown last commit asks for a full re-index
+    """
+    cache = RepositoryCache(str(tmp_path / "clone"), f"file://{origin.working_tree_dir}",
+                            state_path=tmp_path / "state.json")
+    head = cache.sync()
+
+    assert cache.last_indexed("code") is None
+    assert cache.changed_files(None, head) is None
+    assert cache.changed_files("0" * 40, head) is None
+
+
+def test_existing_directory_is_not_overwritten(origin, tmp_path):
+    """
+    Test that a non-empty directory that is not a clone is refused
+    """
+    path = tmp_path / "occupied"
+    path.mkdir()
+    (path / "notes.txt").write_text("keep", encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        RepositoryCache(str(path), f"file://{origin.working_tree_dir}").sync()
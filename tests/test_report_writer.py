@@ -0,0 +1,115 @@
+"""
+Tests for the ReportWriter class.
+"""
+
+import os
+from pathlib import Path
+import pytest
+from pipeline import ReportWriter, FileUtils
+
+
+def test_fragments_are_buffered_until_close(tmp_path):
+    """
+    Test that nothing reaches the report before it is closed
+    """
+    file_path = tmp_path / "report.md"
+    report = ReportWriter(str(file_path))
+    report.write("# One")
+    report.write("# Two")
+
+    assert not file_path.exists()
+
+    report.close()
+
+    assert file_path.read_text(encoding="utf-8") == "# One\n\n# Two\n\n"
+    assert os.listdir(tmp_path) == ["report.md"]
+
+
+def test_flush_size_writes_to_the_body_file(tmp_path):
+    """
+    Test that a full buffer is flushed to the temporary body file
+    """
+    file_path = tmp_path / "report.md"
+    with ReportWriter(str(file_path), flush_size=10) as report:
+        report.write("0123456789")
+        body = Path(report._body_path).read_text(encoding="utf-8")
+
+    assert body == "0123456789\n\n"
+
+
+def test_header_is_placed_in_front_of_the_body(tmp_path):
+    """
+    Test that the header slot replaces a separate prepend pass
+    """
+    file_path = tmp_path / "README.md"
+    with ReportWriter(str(file_path)) as report:
+        report.write("## a.py")
+        report.set_header("# Introduction")
+
+    assert file_path.read_text(encoding="utf-8") == "# Introduction\n\n## a.py\n\n"
+
+
+def test_append_keeps_existing_content(tmp_path):
+    """
+    Test that appending keeps the current report below the header
+    """
+    file_path = tmp_path / "report.md"
+    file_path.write_text("old\n\n", encoding="utf-8")
+
+    with ReportWriter(str(file_path), append=True) as report:
+        report.write("new")
+
+    assert file_path.read_text(encoding="utf-8") == "old\n\nnew\n\n"
+
+
+def test_partial_report_is_kept_after_an_error(tmp_path):
+    """
+    Test that the fragments written before an error are not lost
+    """
+    file_path = tmp_path / "report.md"
+    with pytest.raises(RuntimeError):
+        with ReportWriter(str(file_path)) as report:
+            report.write("done")
+            raise RuntimeError("model failed")
+
+    assert file_path.read_text(encoding="utf-8") == "done\n\n"
+
+    with pytest.raises(ValueError):
+        report.write("too late")
+
+
+def test_prepend_to_file_streams_the_original(tmp_path):
+    """
+    Test that prepend_to_file keeps the original content behind the new content
+    """
+    file_path = tmp_path / "notes.md"
+    file_path.write_text("body", encoding="utf-8")
+
+    FileUtils.prepend_to_file(str(file_path), "head\n")
+
+    assert file_path.read_text(encoding="utf-8") == "head\nbody"
+    assert os.listdir(tmp_path) == ["notes.md"]
+
+
+def test_concurrent_reports_use_their_own_temporary_files(tmp_path):
+    """
+    Test that two writers of the same report do not share temporary files,
+    and that the report keeps the permissions of a normal file
+    """
+    file_path = tmp_path / "report.md"
+    first = ReportWriter(str(file_path), flush_size=1)
+    second = ReportWriter(str(file_path), flush_size=1)
+    first.write("first")
+    second.write("second")
+
+    assert first._body_path != second._body_path
+
+    first.close()
+    assert file_path.read_text(encoding="utf-8") == "first\n\n"
+    second.close()
+    assert file_path.read_text(encoding="utf-8") == "second\n\n"
+    assert os.listdir(tmp_path) == ["report.md"]
+
+    reference = tmp_path / "reference.md"
+    reference.write_text("", encoding="utf-8")
+    assert file_path.stat().st_mode == reference.stat().st_mode
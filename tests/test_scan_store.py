@@ -0,0 +1,258 @@
+"""
+Tests for the ScanStore and IncrementalScanner classes, using a fake nmap executable.
+"""
+
+import json
+import os
+import stat
+import sys
+import pytest
+from pipeline.nmap_project.scan_store import ScanStore, IncrementalScanner
+
+
+# Reports the hosts and open ports of the FAKE_NMAP_STATE file. Versions are only reported with -sV,
+# and only for the ports given with -p. The service name is "svc" unless the state gives one.
+# A port without a product is not identified. Every call is logged. A "fail" state exits with status 1,
+# a "fail_details" state only when scanning with -sV.
+FAKE_NMAP = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+with open(os.environ["FAKE_NMAP_STATE"], encoding="utf-8") as file:
+    state = json.load(file)
+with open(os.environ["FAKE_NMAP_LOG"], "a", encoding="utf-8") as log:
+    log.write(json.dumps(args) + "\\n")
+if state.pop("fail", False) | (state.pop("fail_details", False) and "-sV" in args):
+    sys.stderr.write("nmap failed\\n")
+    sys.exit(1)
+requested = None
+if "-p" in args:
+    requested = [part.partition(":")[2] or part for part in args[args.index("-p") + 1].split(",")]
+targets = [arg for i, arg in enumerate(args) if not arg.startswith("-") and args[i - 1] not in ("-p", "-oX")]
+sys.stdout.write('<?xml version="1.0"?><nmaprun scanner="nmap">')
+for ip, ports in state.items():
+    if ip not in targets and "10.0.0.0/24" not in targets:
+        continue
+    sys.stdout.write('<host><status state="up"/><address addr="%s" addrtype="ipv4"/><ports>' % ip)
+    for portid, (product, version, *service) in ports.items():
+        if requested is not None and portid not in requested:
+            continue
+        details = ' product="%s" version="%s"' % (product, version) if "-sV" in args and product else ""
+        sys.stdout.write('<port protocol="tcp" portid="%s"><state state="open"/><service name="%s"%s/></port>'
+                         % (portid, service[0] if service else "svc", details))
+    sys.stdout.write("</ports></host>")
+sys.stdout.write("</nmaprun>")
+'''
+
+
+@pytest.fixture(name="fake_nmap")
+def fixture_fake_nmap(tmp_path, monkeypatch):
+    """
+    Puts the fake nmap on the PATH and returns a function to set the scanned state and read the calls
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "nmap"
+    fake.write_text(FAKE_NMAP.format(python=sys.executable), encoding="utf-8")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    state_path = tmp_path / "state.json"
+    log = tmp_path / "nmap.log"
+    monkeypatch.setenv("FAKE_NMAP_STATE", str(state_path))
+    monkeypatch.setenv("FAKE_NMAP_LOG", str(log))
+
+    def set_state(state):
+        state_path.write_text(json.dumps(state), encoding="utf-8")
+        log.write_text("", encoding="utf-8")
+        return lambda: [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+
+    return set_state
+
+
+def port(portid, product=None, version=None):
+    """
+    A port in the format of NmapScanner.parse_host
+    """
+    return {
+        "port": f"{portid}/tcp", "portid": portid, "protocol": "tcp", "state": "open", "service": "svc",
+        "product": product, "service_version": version, "version": f"{product} {version}", "cpes": []
+    }
+
+
+def host(ip, ports):
+    """
+    A host in the format of NmapScanner.parse_host
+    """
+    return {
+        "ip": ip, "addresses": {"ipv4": ip}, "mac_address": None, "mac_vendor": None, "hostnames": [],
+        "status": "up", "ports": ports, "os_matches": [], "cpes": []
+    }
+
+
+def test_store_diff_and_trends(tmp_path):
+    """
+    Test storing scans, comparing them and querying their history
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    first = store.start_scan("10.0.0.0/24")
+    store.record_hosts(first, [host("10.0.0.1", [port(22, "OpenSSH", "7.6"), port(80, "nginx", "1.1")])])
+    store.finish_scan(first)
+    second = store.start_scan("10.0.0.0/24")
+    store.record_hosts(second, [
+        host("10.0.0.1", [port(22, "OpenSSH", "8.0"), port(443, "nginx", "1.1")]),
+        host("10.0.0.2", [port(25, "Postfix", "3.4")])
+    ])
+    assert store.latest_scan("10.0.0.0/24") == first
+    store.finish_scan(second)
+
+    assert store.hosts(first)[0]["ports"][0] == port(22, "OpenSSH", "7.6")
+    diff = store.diff_scans(first, second)
+    assert diff["new_hosts"] == ["10.0.0.2"]
+    assert diff["opened"] == [("10.0.0.1", "443/tcp"), ("10.0.0.2", "25/tcp")]
+    assert diff["closed"] == [("10.0.0.1", "80/tcp")]
+    assert diff["changed"] == [{
+        "ip": "10.0.0.1", "port": "22/tcp",
+        "before": {"service": "svc", "product": "OpenSSH", "version": "7.6"},
+        "after": {"service": "svc", "product": "OpenSSH", "version": "8.0"}
+    }]
+
+    trend = store.trend("10.0.0.0/24")
+    assert [(row["scan_id"], row["hosts"], row["open_ports"], row["services"]) for row in trend] == [
+        (first, 1, 2, 2), (second, 2, 3, 3)
+    ]
+    assert [row["service_version"] for row in store.port_history("10.0.0.1", "22/tcp")] == ["7.6", "8.0"]
+
+    with pytest.raises(ValueError):
+        store.start_scan("10.0.0.0/24", kind="partial")
+    store.close()
+
+
+def test_rescan_only_scans_new_ports_in_detail(tmp_path, fake_nmap):
+    """
+    Test that a rescan reuses the details of unchanged ports and scans new ports with -sV
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    scanner = IncrementalScanner(store, flags="-sV")
+
+    calls = fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "80": ["nginx", "1.1"]}})
+    result = scanner.rescan("10.0.0.0/24")
+    assert result["detailed_ports"] == 2
+    assert [args[-1] for args in calls()] == ["10.0.0.0/24", "10.0.0.1"]
+    assert calls()[1][calls()[1].index("-p") + 1] == "T:22,T:80"
+    assert [p["product"] for p in result["hosts"][0]["ports"]] == ["OpenSSH", "nginx"]
+
+    calls = fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "80": ["nginx", "1.1"]}})
+    result = scanner.rescan("10.0.0.0/24")
+    assert result["detailed_ports"] == 0
+    assert len(calls()) == 1
+    assert [p["service_version"] for p in result["hosts"][0]["ports"]] == ["7.6", "1.1"]
+    assert result["diff"] == {"new_hosts": [], "gone_hosts": [], "opened": [], "closed": [], "changed": []}
+
+    calls = fake_nmap({
+        "10.0.0.1": {"22": ["OpenSSH", "7.6"]},
+        "10.0.0.2": {"8080": ["Jetty", "9.4"]}
+    })
+    result = scanner.rescan("10.0.0.0/24")
+    assert result["detailed_ports"] == 1
+    assert calls()[1][-1] == "10.0.0.2"
+    assert result["diff"]["opened"] == [("10.0.0.2", "8080/tcp")]
+    assert result["diff"]["closed"] == [("10.0.0.1", "80/tcp")]
+    assert result["hosts"][1]["ports"][0]["product"] == "Jetty"
+
+    assert [row["open_ports"] for row in store.trend("10.0.0.0/24")] == [2, 2, 2]
+    assert len(store.trend("10.0.0.0/24")) == 3
+    store.close()
+
+
+def test_rescan_scans_changed_and_stale_ports_in_detail(tmp_path, fake_nmap):
+    """
+    Test that ports whose service name changed, or whose details are too old, are scanned with -sV again
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    scanner = IncrementalScanner(store, flags="-sV")
+    fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "80": ["nginx", "1.1"]}})
+    first = scanner.rescan("10.0.0.1")
+    assert all(p["detailed_at"] for p in store.hosts(first["scan_id"])[0]["ports"])
+
+    calls = fake_nmap({"10.0.0.1": {"22": ["Dropbear", "2020.81", "ssh"], "80": ["nginx", "1.1"]}})
+    result = scanner.rescan("10.0.0.1")
+    assert result["detailed_ports"] == 1
+    assert calls()[1][calls()[1].index("-p") + 1] == "T:22"
+    assert [p["product"] for p in result["hosts"][0]["ports"]] == ["Dropbear", "nginx"]
+    assert result["diff"]["changed"][0]["after"] == {"service": "ssh", "product": "Dropbear", "version": "2020.81"}
+    detailed_at = {p["port"]: p["detailed_at"] for p in store.hosts(result["scan_id"])[0]["ports"]}
+    assert detailed_at["22/tcp"] > detailed_at["80/tcp"]
+
+    fake_nmap({"10.0.0.1": {"22": ["Dropbear", "2020.81", "ssh"], "80": ["nginx", "1.1"]}})
+    assert scanner.rescan("10.0.0.1")["detailed_ports"] == 0
+
+    scanner.max_detail_age = 0
+    calls = fake_nmap({"10.0.0.1": {"22": ["Dropbear", "2020.81", "ssh"], "80": ["nginx", "1.2"]}})
+    result = scanner.rescan("10.0.0.1")
+    assert result["detailed_ports"] == 2
+    assert result["hosts"][0]["ports"][1]["service_version"] == "1.2"
+    store.close()
+
+
+def test_rescan_does_not_repeat_unidentified_ports(tmp_path, fake_nmap):
+    """
+    Test that ports scanned in detail without being identified are not scanned in detail again
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    scanner = IncrementalScanner(store, flags="-sV")
+    fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "8000": [None, None, "tcpwrapped"]}})
+    assert scanner.rescan("10.0.0.1")["detailed_ports"] == 2
+
+    calls = fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "8000": [None, None, "tcpwrapped"]}})
+    result = scanner.rescan("10.0.0.1")
+    assert result["detailed_ports"] == 0
+    assert len(calls()) == 1
+    assert result["hosts"][0]["ports"][1]["product"] is None
+    store.close()
+
+
+def test_failed_discovery_is_not_recorded(tmp_path, fake_nmap):
+    """
+    Test that a failed discovery pass reports no gone hosts and is not used as a snapshot
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    scanner = IncrementalScanner(store, flags="-sV")
+    fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"]}})
+    first = scanner.rescan("10.0.0.1")
+
+    fake_nmap({"fail": True})
+    failed = scanner.rescan("10.0.0.1")
+    assert failed["status"] == "failed"
+    assert failed["scan_id"] is None
+    assert store.latest_scan("10.0.0.1") == first["scan_id"]
+
+    fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"]}})
+    result = scanner.rescan("10.0.0.1")
+    assert result["status"] == "done"
+    assert result["detailed_ports"] == 0
+    assert result["diff"]["gone_hosts"] == []
+    store.close()
+
+
+def test_failed_detailed_scan_is_repeated(tmp_path, fake_nmap):
+    """
+    Test that a port whose detailed scan failed after its service changed is scanned in detail again
+    """
+    store = ScanStore(tmp_path / "scans.sqlite3")
+    scanner = IncrementalScanner(store, flags="-sV")
+    fake_nmap({"10.0.0.1": {"22": ["OpenSSH", "7.6"], "80": ["nginx", "1.1"]}})
+    scanner.rescan("10.0.0.1")
+
+    fake_nmap({"fail_details": True, "10.0.0.1": {"22": ["Dropbear", "2020.81", "ssh"], "80": ["nginx", "1.1"]}})
+    failed = scanner.rescan("10.0.0.1")
+    assert failed["detailed_ports"] == 0
+    ports = store.hosts(failed["scan_id"])[0]["ports"]
+    assert ports[0]["product"] == "OpenSSH"
+    assert "detailed_at" not in ports[0]
+    assert "detailed_at" in ports[1]
+
+    calls = fake_nmap({"10.0.0.1": {"22": ["Dropbear", "2020.81", "ssh"], "80": ["nginx", "1.1"]}})
+    result = scanner.rescan("10.0.0.1")
+    assert result["detailed_ports"] == 1
+    assert calls()[1][calls()[1].index("-p") + 1] == "T:22"
+    assert result["hosts"][0]["ports"][0]["product"] == "Dropbear"
+    store.close()
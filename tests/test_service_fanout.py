@@ -0,0 +1,83 @@
+"""
+Tests for the ServiceFanout class.
+"""
+
+import pytest
+from pipeline.nmap_project.service_fanout import ServiceFanout
+
+
+def port(ip, number, product, version, service="ssh"):
+    """
+    Port details as NmapPortScannerProject.process_ports returns them
+    """
+    return {
+        "IP Address": ip,
+        "Port Number": number,
+        "Service Name": service,
+        "Version": f"{product} {version}",
+        "Product": product,
+        "Product Version": version
+    }
+
+
+@pytest.fixture(name="ports")
+def fixture_ports():
+    """
+    Twenty hosts running the same two services
+    """
+    ports = []
+    for i in range(20):
+        ports.append(port(f"10.0.0.{i}", "22/tcp", "OpenSSH", "7.6p1"))
+        ports.append(port(f"10.0.0.{i}", "80/tcp", "Apache httpd", "2.4.29", service="http"))
+    ports.append(port("10.0.0.99", "22/tcp", "openssh ", "7.6p1"))
+    return ports
+
+
+def test_every_service_is_looked_up_once(ports):
+    """
+    Test that results are mapped back to every host and port
+    """
+    batches = []
+
+    def lookup_many(services):
+        batches.append([service["Product"] for service in services])
+        return [f"exploits of {service['Product'].strip().lower()}" for service in services]
+
+    fanout = ServiceFanout(lookup_many)
+    results = fanout.fan_out(ports)
+
+    assert batches == [["OpenSSH", "Apache httpd"]]
+    assert results[0] == results[-1] == "exploits of openssh"
+    assert results[1] == "exploits of apache httpd"
+    assert len(results) == len(ports)
+    assert list(fanout.group(ports)) == [("ssh", "openssh", "7.6p1"), ("http", "apache httpd", "2.4.29")]
+
+
+def test_results_are_cached_until_the_ttl_expires(ports):
+    """
+    Test that a second scan reuses results and expired results are looked up again
+    """
+    now = [0.0]
+    lookups = []
+
+    def lookup_many(services):
+        lookups.extend(services)
+        return [None] * len(services)
+
+    fanout = ServiceFanout(lookup_many, ttl=60, timer=lambda: now[0])
+    fanout.fan_out(ports)
+    fanout.fan_out(ports[:2] + [port("10.0.1.1", "21/tcp", "vsftpd", "2.3.4", service="ftp")])
+    assert len(lookups) == 3
+    assert fanout.stats == {"ports": 44, "services": 5, "lookups": 3, "cache_hits": 2}
+
+    now[0] = 61.0
+    fanout.fan_out(ports)
+    assert len(lookups) == 5
+
+
+def test_lookup_must_answer_every_service(ports):
+    """
+    Test that a lookup returning the wrong number of results is an error
+    """
+    with pytest.raises(ValueError):
+        ServiceFanout(lambda services: []).fan_out(ports)
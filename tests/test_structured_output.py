@@ -0,0 +1,106 @@
+"""
+Tests for the structured output mode of the Pipeline class.
+"""
+
+import pytest
+from langchain_community.llms import Ollama
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from pipeline.pipeline import Pipeline, StructuredOutputError
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "count": {"type": "integer"}
+    },
+    "required": ["title", "count"]
+}
+
+
+def create_pipeline(*responses):
+    """
+    A pipeline whose chat model answers from a list
+    """
+    pipeline = Pipeline(base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test")
+    pipeline.chat = FakeListChatModel(responses=list(responses))
+    return pipeline
+
+
+def test_valid_and_repaired_answers():
+    """
+    Test that valid answers are returned as is and JSON in prose and code fences is repaired
+    """
+    pipeline = create_pipeline(
+        '{"title": "a", "count": 1}',
+        'Sure! ```json\n{"title": "b", "count": 2}\n``` Anything else?'
+    )
+
+    assert pipeline.invoke_structured("first", SCHEMA) == {"title": "a", "count": 1}
+    assert pipeline.invoke_structured("second", SCHEMA) == {"title": "b", "count": 2}
+    assert pipeline.structured_metrics == {"calls": 2, "json_mode": 0, "repaired": 1, "retries": 0, "failures": 0}
+    assert [message.content for message in pipeline.chat_history.messages] == [
+        "first", '{"title": "a", "count": 1}', "second", '{"title": "b", "count": 2}'
+    ]
+
+
+def test_invalid_answer_is_retried_with_the_error():
+    """
+    Test that an answer not matching the schema is sent back with the validation error when retries
+    are enabled, and only the prompt and the valid answer are kept in the history
+    """
+    pipeline = create_pipeline('{"title": "a", "count": "many"}', '{"title": "a", "count": 3}')
+    prompts = []
+    invoke = pipeline.invoke
+    pipeline.invoke = lambda prompt, **kwargs: prompts.append(prompt) or invoke(prompt, **kwargs)
+
+    assert pipeline.invoke_structured("count", SCHEMA, session_id="s", max_retries=1) == {"title": "a", "count": 3}
+    assert pipeline.structured_metrics["retries"] == 1
+    assert "$.count" in prompts[1] and "'many' is not of type 'integer'" in prompts[1]
+    assert [message.content for message in pipeline.get_session_history("s").messages] == [
+        "count", '{"title": "a", "count": 3}'
+    ]
+
+
+def test_invalid_answer_is_not_retried_by_default():
+    """
+    Test that an invalid answer raises without a follow-up prompt and leaves the history unchanged
+    """
+    pipeline = create_pipeline('{"title": "a", "count": "many"}', '{"title": "a", "count": 3}')
+
+    with pytest.raises(StructuredOutputError):
+        pipeline.invoke_structured("count", SCHEMA)
+    assert pipeline.structured_metrics["retries"] == 0
+    assert pipeline.chat_history.messages == []
+
+
+def test_failures_and_invalid_schema():
+    """
+    Test that too many invalid answers and invalid schemas raise errors
+    """
+    pipeline = create_pipeline("no json", '{"title": "a"}')
+
+    with pytest.raises(StructuredOutputError):
+        pipeline.invoke_structured("count", SCHEMA, max_retries=1)
+    assert pipeline.structured_metrics["failures"] == 1
+
+    with pytest.raises(ValueError):
+        pipeline.invoke_structured("count", {"type": "not-a-type"})
+
+
+def test_json_mode_of_providers():
+    """
+    Test that the OpenAI API and Ollama are asked for JSON output, constrained to the schema if given
+    """
+    pipeline = Pipeline(base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test")
+    assert pipeline.json_mode_chat().kwargs == {"response_format": {"type": "json_object"}}
+    assert pipeline.json_mode_chat(SCHEMA).kwargs == {"response_format": {
+        "type": "json_schema", "json_schema": {"name": "structured_answer", "schema": SCHEMA}
+    }}
+
+    pipeline.chat = Ollama(base_url="http://localhost:1", model="test")
+    assert pipeline.json_mode_chat().kwargs == {"format": "json"}
+    assert pipeline.json_mode_chat(SCHEMA).kwargs == {"format": SCHEMA}
+
+    pipeline.chat = FakeListChatModel(responses=["{}"])
+    assert pipeline.json_mode_chat() is pipeline.chat
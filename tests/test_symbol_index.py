@@ -0,0 +1,103 @@
+"""
+Tests for the SymbolIndex class.
+"""
+
+import pytest
+from pipeline.utils.symbol_index import SymbolIndex
+from pipeline.rag.py_rag import parse_python_file
+
+
+SOURCE = '''"""Chat module."""
+
+
+class Pipeline:
+    """A pipeline."""
+
+    def invoke(self, prompt):
+        return self.modify_chat_history(len(prompt))
+
+    @staticmethod
+    def modify_chat_history(num_messages):
+        return num_messages > 0
+
+
+def invoke(prompt):
+    return Pipeline().invoke(prompt)
+'''
+
+
+@pytest.fixture(name="index")
+def fixture_index(tmp_path):
+    """
+    An index of a package with one module
+    """
+    package = tmp_path / "pkg"
+    package.mkdir()
+    (package / "chat.py").write_text(SOURCE, encoding="utf-8")
+    (package / "broken.py").write_text("def broken(:\n", encoding="utf-8")
+
+    index = SymbolIndex(str(tmp_path))
+    index.add_file(str(package / "chat.py"))
+    index.add_file(str(package / "broken.py"))
+    return index
+
+
+def test_lookup_returns_exact_spans(index):
+    """
+    Test that qualified and module-qualified names resolve to one symbol with its source
+    """
+    symbols = index.lookup("Pipeline.modify_chat_history")
+
+    assert len(symbols) == 1
+    assert symbols[0]["kind"] == "method"
+    assert (symbols[0]["start"], symbols[0]["end"]) == (10, 12)
+    assert SymbolIndex.source(symbols[0]).startswith("    @staticmethod\n    def modify_chat_history")
+    assert index.lookup("pkg.chat.Pipeline.modify_chat_history") == symbols
+    assert len(index.lookup("invoke")) == 2
+    assert index.lookup("pkg.broken") == []
+
+
+def test_find_in_text_prefers_qualified_names(index):
+    """
+    Test that a qualified name in a question does not match unrelated symbols
+    """
+    found = index.find_in_text("What does `Pipeline.invoke` do?")
+    assert [symbol["qualname"] for symbol in found] == ["Pipeline.invoke"]
+
+    found = index.find_in_text("when is modify_chat_history called")
+    assert [symbol["qualname"] for symbol in found] == ["Pipeline.modify_chat_history"]
+
+    assert index.find_in_text("how does the main loop run") == []
+    assert index.find_in_text("Pipeline objects are built where?") == []
+    assert [symbol["qualname"] for symbol in index.find_in_text("where is `Pipeline` built")] == ["Pipeline"]
+
+
+def test_callers_and_persistence(index, tmp_path):
+    """
+    Test call references, removal of a file and saving and loading the index
+    """
+    assert [symbol["qualname"] for symbol in index.callers("modify_chat_history")] == ["Pipeline.invoke"]
+
+    index_path = str(tmp_path / "symbols.json")
+    index.save(index_path)
+    loaded = SymbolIndex.load(index_path)
+    assert loaded.lookup("Pipeline") == index.lookup("Pipeline")
+
+    loaded.remove_file(str(tmp_path / "pkg" / "chat.py"))
+    assert loaded.lookup("Pipeline") == []
+
+
+def test_parse_python_file_returns_documents_and_symbols(tmp_path):
+    """
+    Test the worker function PyRAG runs in its process pool
+    """
+    file_path = tmp_path / "chat.py"
+    file_path.write_text(SOURCE, encoding="utf-8")
+
+    path, documents, symbols, elapsed = parse_python_file(str(file_path), "chat")
+
+    assert path == str(file_path)
+    assert documents[0].metadata["source"] == str(file_path)
+    assert "def modify_chat_history" in "".join(document.page_content for document in documents)
+    assert [symbol["qualname"] for symbol in symbols][:3] == ["chat", "Pipeline", "Pipeline.invoke"]
+    assert elapsed >= 0
@@ -0,0 +1,75 @@
+"""
+Tests for the TokenCounter class and token based chunking.
+"""
+
+import pytest
+from langchain_core.documents import Document
+from pipeline import TokenCounter
+from pipeline.pipeline import Pipeline
+from pipeline.retrieval import Retrieval
+
+
+def test_approximate_count():
+    """
+    Test that the approximate counter counts words, digits, symbols and non-ASCII characters
+    """
+    assert TokenCounter.approximate_count("") == 0
+    assert TokenCounter.approximate_count("hello world") == 4
+    assert TokenCounter.approximate_count("123456") == 2
+    assert TokenCounter.approximate_count("a, b!") == 4
+    assert TokenCounter.approximate_count("سلام") == 4
+
+
+def test_unknown_tokenizer_falls_back_to_approximate():
+    """
+    Test that an unknown tokenizer falls back to the approximate counter
+    """
+    counter = TokenCounter("no-such-tokenizer")
+    assert counter.tokenizer == TokenCounter.APPROXIMATE
+    assert counter.count("hello world") == TokenCounter.approximate_count("hello world")
+
+
+def test_describe():
+    """
+    Test the chunk size distribution summary
+    """
+    stats = TokenCounter.describe(list(range(1, 101)))
+    assert stats["count"] == 100
+    assert stats["total"] == 5050
+    assert stats["min"] == 1
+    assert stats["max"] == 100
+    assert stats["p50"] == 50
+    assert stats["p95"] == 95
+    assert TokenCounter.describe([])["count"] == 0
+
+
+def test_token_sized_splitter():
+    """
+    Test that a splitter with a tokenizer keeps every chunk within the token budget
+    """
+    splitter = Pipeline.recursive_character_text_splitter(
+        chunk_size=20,
+        chunk_overlap=0,
+        tokenizer=TokenCounter.APPROXIMATE
+    )
+    text = " ".join(["tokenization"] * 200)
+    chunks = splitter.split_text(text)
+    assert len(chunks) > 1
+    assert all(TokenCounter.approximate_count(chunk) <= 20 for chunk in chunks)
+
+
+@pytest.mark.parametrize("tokenizer", [None, TokenCounter.APPROXIMATE])
+def test_split_documents_scales_the_default_overlap(tokenizer):
+    """
+    Test that an explicit chunk_size alone gets an overlap smaller than the chunk size
+    """
+    kwargs = {"tokenizer": tokenizer} if tokenizer else {}
+    retrieval = Retrieval(
+        base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test", chunk_size=100, **kwargs
+    )
+    retrieval.documents = [Document(page_content=" ".join(["overlap"] * 500))]
+
+    chunks = retrieval.split_documents(chunk_size=2000, chunk_overlap=200)
+
+    assert len(chunks) > 1
+    assert retrieval.chunk_stats["max"] <= 100
@@ -0,0 +1,141 @@
+"""
+Tests for the VttParser class.
+"""
+
+import os
+from pipeline.ytdpl.vtt_parser import VttParser
+from pipeline.ytdpl.youtube_caption_downloader import YouTubeCaptionDownloader
+
+
+VTT = """WEBVTT
+Kind: captions
+Language: en
+
+NOTE
+This note spans
+two lines --> and is ignored
+
+STYLE
+::cue { color: white }
+
+intro
+00:00:01.000 --> 00:00:03.500 align:start position:0%
+hello<00:00:01.500><c> world</c>
+
+00:00:03.500 --> 00:00:05.000 align:start position:0%
+hello world
+fish &amp; chips
+
+01:00:05.000 --> 01:00:07.250
+<v Speaker>the end</v>
+"""
+
+ROLLING_VTT = os.path.join(os.path.dirname(__file__), "data", "rolling.vtt")
+
+
+def test_iter_segments_keeps_timing_and_cleans_text():
+    """
+    Test that header, NOTE and STYLE blocks are skipped and tags and entities removed
+    """
+    segments = list(VttParser.iter_segments(VTT.splitlines()))
+
+    assert segments == [
+        (1.0, 3.5, "hello world"),
+        (3.5, 5.0, "hello world\nfish & chips"),
+        (3605.0, 3607.25, "the end"),
+    ]
+    assert list(VttParser.drop_repeated_lines(segments))[1] == (3.5, 5.0, "fish & chips")
+
+
+def test_timestamps():
+    """
+    Test parsing and formatting timestamps
+    """
+    assert VttParser.parse_timestamp("01:02:03.500") == 3723.5
+    assert VttParser.parse_timestamp("02:03.500") == 123.5
+    assert VttParser.format_timestamp(3723.5) == "01:02:03"
+
+
+def test_clean_subtitle_matches_parser(tmp_path):
+    """
+    Test the cleaned text of a string and of a file
+    """
+    downloader = YouTubeCaptionDownloader(str(tmp_path / "captions"))
+    expected = "hello world\nfish & chips\nthe end"
+    assert downloader.clean_subtitle(VTT) == expected
+
+    vtt_path = tmp_path / "video.en.vtt"
+    vtt_path.write_text(VTT, encoding="utf-8")
+    txt_path = tmp_path / "video.txt"
+    downloader.clean_subtitle_file(str(vtt_path), str(txt_path))
+    assert txt_path.read_text(encoding="utf-8") == expected
+
+
+def test_to_documents_adds_time_metadata(tmp_path):
+    """
+    Test grouping segments into documents with start times and timestamped links
+    """
+    vtt_path = tmp_path / "video.en.vtt"
+    vtt_path.write_text(VTT, encoding="utf-8")
+    segments = VttParser.drop_repeated_lines(VttParser.parse_file(str(vtt_path)))
+    metadata = {"source": "https://www.youtube.com/watch?v=abc", "title": "A video"}
+
+    documents = list(VttParser.to_documents(segments, metadata, max_chars=30))
+
+    assert [document.page_content for document in documents] == ["hello world fish & chips", "the end"]
+    assert documents[0].metadata["start"] == 1.0
+    assert documents[0].metadata["end"] == 5.0
+    assert documents[1].metadata["start_time"] == "01:00:05"
+    assert documents[1].metadata["timestamp_url"] == "https://www.youtube.com/watch?v=abc&t=3605s"
+    assert documents[1].metadata["title"] == "A video"
+
+
+def test_merge_overlaps_removes_rolling_repeats():
+    """
+    Test that the words a cue repeats from the cues before it are removed
+    """
+    segments = [
+        (0.0, 1.0, "hello world"),
+        (1.0, 2.0, "hello world\nthis is"),
+        (2.0, 3.0, "world this is a test"),
+        (3.0, 4.0, "I said no"),
+        (4.0, 5.0, "no way"),
+    ]
+
+    assert list(VttParser.merge_overlaps(segments)) == [
+        (0.0, 1.0, "hello world"),
+        (1.0, 2.0, "this is"),
+        (2.0, 3.0, "a test"),
+        (3.0, 4.0, "I said no"),
+        (4.0, 5.0, "no way"),
+    ]
+    assert VttParser.overlap_length("a b a b".split(), "a b a c".split()) == 2
+
+
+def test_merge_overlaps_keeps_phrases_spoken_twice():
+    """
+    Test that manual captions repeating a phrase in consecutive cues keep every spoken word
+    """
+    segments = [
+        (0.0, 1.0, "we need to go to the"),
+        (1.0, 2.0, "to the store"),
+        (2.0, 3.0, "I said no no"),
+        (3.0, 4.0, "no no I won't"),
+        (4.0, 5.0, "I won't"),
+    ]
+
+    assert list(VttParser.merge_overlaps(segments)) == segments
+
+
+def test_rolling_captions_file_is_not_repeated():
+    """
+    Test that the sample auto-generated captions are cleaned to the spoken text
+    """
+    segments = list(VttParser.merge_overlaps(VttParser.parse_file(ROLLING_VTT)))
+
+    assert segments[0] == (0.16, 2.47, "welcome back to the channel")
+    assert " ".join(text.replace("\n", " ") for _, _, text in segments) == (
+        "welcome back to the channel today we are going to look at rolling captions "
+        "and how they repeat every phrase more than once so the same words show up "
+        "two or three times thanks for watching"
+    )
@@ -0,0 +1,135 @@
+"""
+Tests for the WebCrawler class against a local HTTP server.
+"""
+
+import asyncio
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from pipeline.rag.web_rag import WebRAG
+from pipeline.utils import html_extractor, web_crawler
+from pipeline.utils.web_crawler import HttpCache, WebCrawler
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """
+    Request handler that does not log to stderr
+    """
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(name="site")
+def fixture_site(tmp_path):
+    """
+    A small website served from a temporary directory
+    """
+    root = tmp_path / "site"
+    root.mkdir()
+    (root / "index.html").write_text(
+        '<a href="a.html">A</a> <a href="b.html#top">B</a> <a href="https://example.com/">X</a>',
+        encoding="utf-8"
+    )
+    (root / "a.html").write_text('<a href="index.html">home</a>', encoding="utf-8")
+    (root / "b.html").write_text('<a href="c.html">C</a>', encoding="utf-8")
+    (root / "c.html").write_text("deep", encoding="utf-8")
+    (root / "notes.txt").write_text("plain notes", encoding="utf-8")
+    (root / "data.json").write_text('{"answer": 42}', encoding="utf-8")
+
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_crawl_respects_depth_and_domain(site, tmp_path):
+    """
+    Test that links are followed within the depth and domain limits
+    """
+    crawler = WebCrawler(max_depth=1, cache=HttpCache(tmp_path / "cache"))
+    pages = crawler.crawl(site + "index.html")
+
+    assert sorted(page["url"] for page in pages) == [
+        site + "a.html", site + "b.html", site + "index.html"
+    ]
+    assert crawler.stats["fetched"] == 3
+
+
+def test_recrawl_revalidates_with_the_cache(site, tmp_path):
+    """
+    Test that unchanged pages are answered with 304 and served from the cache
+    """
+    cache = HttpCache(tmp_path / "cache")
+    WebCrawler(max_depth=2, cache=cache).crawl(site + "index.html")
+
+    crawler = WebCrawler(max_depth=2, cache=cache)
+    pages = crawler.crawl(site + "index.html")
+
+    assert len(pages) == 4
+    assert all(page["from_cache"] for page in pages)
+    assert crawler.stats == {"fetched": 0, "not_modified": 4, "failed": 0}
+
+
+def test_recrawl_refetches_a_missing_cached_body(site, tmp_path):
+    """
+    Test that a 304 for a page whose cached body is gone fetches the page again
+    """
+    cache_dir = tmp_path / "cache"
+    cache = HttpCache(cache_dir)
+    WebCrawler(max_depth=0, cache=cache).crawl(site + "c.html")
+    for body in cache_dir.glob("*.body"):
+        body.unlink()
+
+    crawler = WebCrawler(max_depth=0, cache=cache)
+    pages = crawler.crawl(site + "c.html")
+
+    assert [page["body"] for page in pages] == [b"deep"]
+    assert crawler.stats == {"fetched": 1, "not_modified": 0, "failed": 0}
+    assert cache.get(site + "c.html")["body"] == b"deep"
+    assert not list(cache_dir.glob("*.tmp"))
+
+
+def test_max_pages_and_failures(site, tmp_path):
+    """
+    Test the page limit and that missing pages are counted as failed
+    """
+    crawler = WebCrawler(max_depth=3, max_pages=2, cache=False)
+    assert len(crawler.crawl(site + "index.html")) == 2
+
+    crawler = WebCrawler(max_depth=0, cache=HttpCache(tmp_path / "cache"))
+    assert crawler.crawl(site + "missing.html") == []
+    assert crawler.stats["failed"] == 1
+
+
+def test_crawl_inside_a_running_event_loop(site, tmp_path):
+    """
+    Test that crawl works while an event loop is running, as in a notebook, and that crawl_async can be awaited
+    """
+    crawler = WebCrawler(max_depth=0, cache=HttpCache(tmp_path / "cache"))
+
+    async def crawl_in_loop():
+        return crawler.crawl(site + "index.html"), await crawler.crawl_async(site + "a.html")
+
+    pages, awaited = asyncio.run(crawl_in_loop())
+
+    assert [page["url"] for page in pages] == [site + "index.html"]
+    assert [page["url"] for page in awaited] == [site + "a.html"]
+
+
+@pytest.mark.parametrize("page, text", [("notes.txt", "plain notes"), ("data.json", '{"answer": 42}')])
+def test_web_rag_keeps_text_and_json_pages(site, tmp_path, monkeypatch, page, text):
+    """
+    Test that a single text or JSON URL is loaded as its decoded text
+    """
+    monkeypatch.setattr(web_crawler, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(html_extractor, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(WebRAG, "store_chunks", lambda self, chunks: None)
+
+    rag = WebRAG(base_url="http://localhost:1/v1", openai_api_key="not-needed", model="test", url=site + page)
+
+    assert [document.page_content for document in rag.documents] == [text]
+    assert rag.documents[0].metadata == {"source": site + page, "depth": 0}